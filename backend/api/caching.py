@@ -0,0 +1,71 @@
+"""
+api/caching - ETags and conditional GETs.
+
+Single documents get a strong ETag hashed from their raw BSON, so a matching
+``If-None-Match`` is answered with a 304 before the document is decoded,
+validated or serialized. Lists get a weak ETag hashed from the response body.
+``Cache-Control`` is set from ``CACHE_CONTROL`` (``COOKBOOKS_`` env prefix).
+"""
+
+import functools
+import hashlib
+
+import bson
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from flask import Response, current_app, make_response, request
+from pymongo.collection import Collection
+
+from api.metrics import timed
+
+DEFAULT_CACHE_CONTROL = "no-cache"
+
+
+def etag_for(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def cache_headers(response: Response, etag: str, weak: bool = False) -> Response:
+    response.set_etag(etag, weak=weak)
+    response.headers["Cache-Control"] = current_app.config.get(
+        "CACHE_CONTROL", DEFAULT_CACHE_CONTROL
+    )
+    return response
+
+
+def find_one_raw(collection: Collection, search_dict: dict) -> RawBSONDocument | None:
+    """Like ``find_one``, but leaves the document as undecoded BSON."""
+    raw_collection = collection.with_options(
+        codec_options=CodecOptions(document_class=RawBSONDocument)
+    )
+    return raw_collection.find_one(search_dict)
+
+
+def conditional_document(raw: RawBSONDocument, to_json) -> Response:
+    """
+    Respond with a document, or a 304 if the client's copy is current.
+
+    ``to_json`` converts the decoded document to the response body, and only
+    runs if the ETag doesn't match.
+    """
+    etag = etag_for(raw.raw)
+    if request.if_none_match.contains_weak(etag):
+        return cache_headers(Response(status=304), etag)
+    response = make_response(timed("model")(to_json)(bson.decode(raw.raw)))
+    return cache_headers(response, etag)
+
+
+def weak_etag(view):
+    """Decorate a list view to set a weak ETag and answer conditional GETs."""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        response = make_response(view(*args, **kwargs))
+        if response.status_code != 200 or response.is_streamed:
+            return response
+        cache_headers(response, etag_for(response.get_data()), weak=True)
+        # Lists include the user's recipes when authorized.
+        response.vary.add("Authorization")
+        return response.make_conditional(request)
+
+    return wrapper
@@ -0,0 +1,109 @@
+"""
+api/compression - gzip/brotli response compression.
+
+Responses of at least ``COMPRESS_MIN_SIZE`` bytes (``COOKBOOKS_`` env prefix)
+are compressed with the best encoding the client accepts. Brotli is used if
+the optional ``brotli`` package is installed. Streamed (NDJSON) responses are
+compressed chunk by chunk, flushing after each so that clients still receive
+records as soon as they are written.
+"""
+
+import zlib
+
+from flask import Flask, Response, current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_MIN_SIZE = 1024
+DEFAULT_LEVEL = 6
+
+
+class _Gzip:
+    def __init__(self, level: int) -> None:
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _Brotli:
+    def __init__(self, level: int) -> None:
+        # Brotli's quality runs 0-11, rather than zlib's 1-9.
+        self._compressor = brotli.Compressor(quality=min(11, level))
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+def _choose_encoding() -> str | None:
+    accepted = request.accept_encodings
+    encodings = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best = accepted.best_match(encodings)
+    if best is None or accepted[best] == 0:
+        return None
+    return best
+
+
+def _compressor(encoding: str):
+    level = int(current_app.config.get("COMPRESS_LEVEL", DEFAULT_LEVEL))
+    if encoding == "br":
+        return _Brotli(level)
+    return _Gzip(level)
+
+
+def _stream(chunks, compressor):
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        data = compressor.compress(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def compress_response(response: Response) -> Response:
+    if (
+        response.status_code != 200
+        or "Content-Encoding" in response.headers
+        or request.method == "HEAD"
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    if not response.is_streamed:
+        min_size = int(current_app.config.get("COMPRESS_MIN_SIZE", DEFAULT_MIN_SIZE))
+        if response.content_length is None or response.content_length < min_size:
+            return response
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+
+    compressor = _compressor(encoding)
+    if response.is_streamed:
+        response.response = _stream(response.response, compressor)
+    else:
+        response.set_data(compressor.compress(response.get_data()) + compressor.finish())
+    response.headers["Content-Encoding"] = encoding
+    # The compressed bytes differ from the ones a strong ETag was made for.
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app: Flask) -> None:
+    app.after_request(compress_response)
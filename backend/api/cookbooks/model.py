@@ -1,7 +1,3 @@
-# FastAPI's jsonable_encoder handles converting various non-JSON types,
-# such as datetime between JSON types and native Python types.
-from fastapi.encoders import jsonable_encoder
-
 # Pydantic, and Python's built-in typing are used to define a schema
 # that defines the structure and types of the different objects stored
 # in the recipes collection, and managed by this API.
@@ -22,7 +18,7 @@ class Cookbook(BaseModel):
     author: str 
 
     def to_json(self):
-        return jsonable_encoder(self, exclude_none=True)
+        return self.model_dump(mode="json", by_alias=True, exclude_none=True)
 
     def to_bson(self):
         data = self.dict(by_alias=True, exclude_none=True)
@@ -8,63 +8,81 @@ from bson import ObjectId
 from flask import abort
 from flask import current_app
 from flask import request
-from flask import url_for
 from flask import jsonify
-from flask import current_app
-from flask_pymongo import PyMongo
+from pymongo import ASCENDING
 from pymongo.collection import ReturnDocument
 
+from api.caching import conditional_document, find_one_raw, weak_etag
+from api.counts import counts
+from api.db import mongo
+from api.metrics import timed
+from api.pagination import (
+    KeysetPage,
+    decode_after,
+    endpoint_href,
+    keyset_links,
+    last_page,
+    page_links,
+    seek_filter,
+)
+
+# Listing order, and the keyset for ``after=`` pagination.
+COOKBOOK_SORT = [("key", ASCENDING), ("_id", ASCENDING)]
+COOKBOOK_SORT_TYPES = (str, ObjectId)
+
+
+@timed("model")
+def cookbook_json(doc: dict) -> dict:
+    return Cookbook(**doc).to_json()
+
 
 # @app.route("/cookbooks/count")
 def cookbooks_count():
     """GET the count of cookbooks."""
-    with current_app.app_context():
-        mongo = PyMongo(current_app)
-        cookbook_count = mongo.db.cookbooks.count_documents({})
+    cookbook_count = counts.count(mongo.db.cookbooks, {})
     return {
         "count": cookbook_count,
     }
 
 
 # @app.route("/cookbooks/")
+@weak_etag
 def list_cookbooks():
     """
     GET a list of cookbook cookbooks.
 
-    The results are paginated using the `page` parameter.
+    The results are paginated using the `page` parameter, or with the `after`
+    token from a previous page's `next` link (see ``api.pagination``).
     """
 
     page = int(request.args.get("page", 1))
+    after = request.args.get("after")
     per_page = 10  # A const value.
+    href = endpoint_href(".list_cookbooks")
+
+    if after is not None:
+        after_values = decode_after(after, COOKBOOK_SORT, COOKBOOK_SORT_TYPES)
+        search_dict = {}
+        if after_values is not None:
+            search_dict = seek_filter(COOKBOOK_SORT, after_values)
+        docs = KeysetPage(
+            mongo.db.cookbooks.find(search_dict).sort(COOKBOOK_SORT).limit(per_page + 1),
+            per_page,
+            COOKBOOK_SORT,
+        )
+        return {
+            "cookbooks": [cookbook_json(doc) for doc in docs],
+            "_links": keyset_links(href, after, docs.next_after()),
+        }
 
     # For pagination, it's necessary to sort by name,
     # then skip the number of docs that earlier pages would have displayed,
     # and then to limit to the fixed page size, ``per_page``.
-    with current_app.app_context():
-        mongo = PyMongo(current_app)
-        cursor = mongo.db.cookbooks.find().sort("key").skip(per_page * (page - 1)).limit(per_page)
-        cookbook_count = mongo.db.cookbooks.count_documents({})
-
-    links = {
-        "self": {"href": url_for(".list_cookbooks", page=page, _external=True)},
-        "last": {
-            "href": url_for(
-                ".list_cookbooks", page=(cookbook_count // per_page) + 1, _external=True
-            )
-        },
-    }
-    # Add a 'prev' link if it's not on the first page:
-    if page > 1:
-        links["prev"] = {
-            "href": url_for(".list_cookbooks", page=page - 1, _external=True)
-        }
-    # Add a 'next' link if it's not on the last page:
-    if page - 1 < cookbook_count // per_page:
-        links["next"] = {
-            "href": url_for(".list_cookbooks", page=page + 1, _external=True)
-        }
+    cursor = mongo.db.cookbooks.find().sort(COOKBOOK_SORT).skip(per_page * (page - 1)).limit(per_page)
+    cookbook_count = counts.count(mongo.db.cookbooks, {})
+    links = page_links(href, page, last_page(cookbook_count, per_page))
     return {
-        "cookbooks": [Cookbook(**doc).to_json() for doc in cursor],
+        "cookbooks": [cookbook_json(doc) for doc in cursor],
         "_links": links,
     }
 
@@ -75,9 +93,8 @@ def new_cookbook():
     raw_cookbook["date_added"] = datetime.utcnow()
     # Validate key, name, author fields exist.
     cookbook = cookbook(**raw_cookbook)
-    with current_app.app_context():
-        mongo = PyMongo(current_app)
-        insert_result = mongo.db.cookbooks.insert_one(cookbook.to_bson())
+    insert_result = mongo.db.cookbooks.insert_one(cookbook.to_bson())
+    counts.invalidate(mongo.db.cookbooks)
     cookbook.id = ObjectId(str(insert_result.inserted_id))
     print(cookbook)
     return cookbook.to_json()
@@ -85,24 +102,23 @@ def new_cookbook():
 
 # @app.route("/cookbooks/<string:key>", methods=["GET"])
 def get_cookbook(key):
-    with current_app.app_context():
-        mongo = PyMongo(current_app)
-        cookbook = mongo.db.cookbooks.find_one_or_404({"key": key})
-    return Cookbook(**cookbook).to_json()
+    cookbook = find_one_raw(mongo.db.cookbooks, {"key": key})
+    if cookbook is None:
+        abort(404)
+    return conditional_document(cookbook, lambda doc: Cookbook(**doc).to_json())
 
 
 # @app.route("/cookbooks/<string:key>", methods=["PUT"])
 def update_cookbook(key):
     cookbook = Cookbook(**request.get_json())
     cookbook.date_updated = datetime.utcnow()
-    with app.app_context:
-        mongo = PyMongo(current_app)
-        updated_cookbook = mongo.db.cookbooks.find_one_and_update(
-            {"key": key},
-            {"$set": cookbook.to_bson()},
-            return_document=ReturnDocument.AFTER,
-        )
+    updated_cookbook = mongo.db.cookbooks.find_one_and_update(
+        {"key": key},
+        {"$set": cookbook.to_bson()},
+        return_document=ReturnDocument.AFTER,
+    )
     if updated_cookbook:
+        counts.invalidate(mongo.db.cookbooks)
         return Cookbook(**updated_cookbook).to_json()
     else:
         abort(404, "cookbook not found")
@@ -110,12 +126,11 @@ def update_cookbook(key):
 
 # @app.route("/cookbooks/<string:key>", methods=["DELETE"])
 def delete_cookbook(key):
-    with current_app.app_context():
-        mongo = PyMongo(current_app)
-        deleted_cookbook = mongo.db.cookbooks.find_one_and_delete(
-            {"key": key},
-        )
+    deleted_cookbook = mongo.db.cookbooks.find_one_and_delete(
+        {"key": key},
+    )
     if deleted_cookbook:
+        counts.invalidate(mongo.db.cookbooks)
         return Cookbook(**deleted_cookbook).to_json()
     else:
         abort(404, "cookbook not found")
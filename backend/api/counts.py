@@ -0,0 +1,90 @@
+"""
+api/counts - A TTL cache of collection counts.
+
+Listing and count endpoints need the number of matching documents on every
+request, but recipes and cookbooks rarely change. Counts are cached per
+collection and filter for ``COUNT_CACHE_TTL`` seconds (``COOKBOOKS_`` env
+prefix), and at most ``COUNT_CACHE_SIZE`` of them, least recently used first
+out. API writes invalidate the collection's counts in this process; other
+workers and ``process_photos.py`` are covered by the TTL.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from bson import json_util
+from flask import Flask
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.collection import Collection
+
+
+class CountCache:
+    def __init__(self, ttl: float = 60.0, max_size: int = 1024) -> None:
+        self.ttl = ttl
+        # Every distinct search is a key: bound them.
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._counts: OrderedDict[tuple[str, str], tuple[float, int]] = OrderedDict()
+
+    def init_app(self, app: Flask) -> None:
+        self.init_config(app.config)
+
+    def init_config(self, config) -> None:
+        self.ttl = float(config.get("COUNT_CACHE_TTL", self.ttl))
+        self.max_size = int(config.get("COUNT_CACHE_SIZE", self.max_size))
+
+    def count(self, collection: Collection, search_dict: dict) -> int:
+        """Count the documents matching ``search_dict``, from cache if fresh.
+
+        Unfiltered counts use the collection metadata rather than a scan.
+        """
+        key, now, cached = self._lookup(collection, search_dict)
+        if cached is not None:
+            return cached
+        if search_dict:
+            count = collection.count_documents(search_dict)
+        else:
+            count = collection.estimated_document_count()
+        return self._store(key, now, count)
+
+    async def acount(self, collection: AsyncCollection, search_dict: dict) -> int:
+        """:meth:`count` for the ASGI app's async collections."""
+        key, now, cached = self._lookup(collection, search_dict)
+        if cached is not None:
+            return cached
+        if search_dict:
+            count = await collection.count_documents(search_dict)
+        else:
+            count = await collection.estimated_document_count()
+        return self._store(key, now, count)
+
+    def _lookup(self, collection, search_dict: dict):
+        key = (collection.name, json_util.dumps(search_dict, sort_keys=True))
+        now = time.monotonic()
+        with self._lock:
+            cached = self._counts.get(key)
+            if cached is None:
+                return key, now, None
+            if now - cached[0] >= self.ttl:
+                del self._counts[key]
+                return key, now, None
+            self._counts.move_to_end(key)
+        return key, now, cached[1]
+
+    def _store(self, key: tuple[str, str], now: float, count: int) -> int:
+        with self._lock:
+            self._counts[key] = (now, count)
+            self._counts.move_to_end(key)
+            while len(self._counts) > self.max_size:
+                self._counts.popitem(last=False)
+        return count
+
+    def invalidate(self, collection: Collection | AsyncCollection) -> None:
+        """Drop every cached count of ``collection`` after a write."""
+        with self._lock:
+            for key in [key for key in self._counts if key[0] == collection.name]:
+                del self._counts[key]
+
+
+counts = CountCache()
@@ -0,0 +1,50 @@
+"""
+api/db - The process-wide MongoDB client shared by every view.
+"""
+
+import os
+
+from flask import Flask
+from flask_pymongo import PyMongo
+
+# One client, and so one connection pool, per process. Views import this and
+# use ``mongo.db`` instead of constructing ``PyMongo(current_app)`` per request.
+mongo = PyMongo()
+
+# App config keys (set through the ``COOKBOOKS_`` env prefix, e.g.
+# ``COOKBOOKS_MONGO_MAX_POOL_SIZE=50``) mapped to their MongoClient option.
+CLIENT_OPTIONS = {
+    "MONGO_MAX_POOL_SIZE": "maxPoolSize",
+    "MONGO_MIN_POOL_SIZE": "minPoolSize",
+    "MONGO_MAX_IDLE_TIME_MS": "maxIdleTimeMS",
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": "waitQueueTimeoutMS",
+    "MONGO_CONNECT_TIMEOUT_MS": "connectTimeoutMS",
+    "MONGO_SOCKET_TIMEOUT_MS": "socketTimeoutMS",
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": "serverSelectionTimeoutMS",
+}
+
+
+def client_options(config) -> dict:
+    """Build the MongoClient keyword arguments from the app config."""
+    options = {
+        option: int(config[key])
+        for key, option in CLIENT_OPTIONS.items()
+        if config.get(key) is not None
+    }
+    # Never open sockets or monitor threads until the first operation, so a
+    # client built in the gunicorn master is never shared with the workers.
+    options["connect"] = False
+    return options
+
+
+def init_app(app: Flask) -> None:
+    """Create the shared client for ``app``.
+
+    PyMongo clients are not fork-safe. Unless ``MONGO_RESET_AFTER_FORK`` is
+    disabled, every forked child (e.g. a gunicorn worker started with
+    ``--preload``) replaces the inherited client with a fresh one.
+    """
+    options = client_options(app.config)
+    mongo.init_app(app, **options)
+    if app.config.get("MONGO_RESET_AFTER_FORK", True):
+        os.register_at_fork(after_in_child=lambda: mongo.init_app(app, **options))
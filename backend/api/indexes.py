@@ -0,0 +1,228 @@
+"""
+api/indexes - The indexes the API and process_photos.py queries rely on.
+
+Apply them (idempotently), or audit the query plans of each view's query shape
+for collection scans and in-memory sorts:
+
+    uv run -m api.indexes --apply
+    uv run -m api.indexes --audit
+
+Set ``COOKBOOKS_ENSURE_INDEXES=true`` to also apply them when the app starts.
+"""
+
+import argparse
+import os
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import ASCENDING, TEXT, IndexModel, MongoClient
+from pymongo.database import Database
+from pymongo.errors import OperationFailure
+
+from api.cookbooks.views import COOKBOOK_SORT
+from api.pagination import seek_filter
+from api.recipes.views import RECIPE_SORT, SEARCH_SORT
+from api.sampling import RANDOM_KEY
+from process.db import EXISTING_PAGES_PROJECTION
+
+INGREDIENT_AISLES = (
+    "meat",
+    "produce",
+    "seafood",
+    "pantry",
+    "dairy",
+    "seafood_and_meat",
+    "frozen",
+    "other",
+)
+# Ranked by text score, which no index orders by: a top-k sort is expected.
+TOP_K_SHAPES = ("search_recipes",)
+# Answered from the index alone: reading the documents (FETCH) is flagged too.
+COVERED_SHAPES = ("existing_pages",)
+
+INDEXES = {
+    "recipes": [
+        # list_recipes ordering and keyset pagination, the `cookbook` filter and
+        # process.db.existing_pages, which it covers.
+        IndexModel(RECIPE_SORT, name="cookbook_key_page_number_id"),
+        # get_n_random_recipes, unfiltered and with the `cookbook` filter.
+        IndexModel([(RANDOM_KEY, ASCENDING)], name="random_key"),
+        IndexModel(
+            [("cookbook_key", ASCENDING), (RANDOM_KEY, ASCENDING)],
+            name="cookbook_key_random_key",
+        ),
+        # `query` searches in list_recipes, recipes_count and search_recipes,
+        # which ranks a match in the dish name above one in the ingredients,
+        # and both above one in the instructions (weight 1).
+        IndexModel(
+            [
+                ("name_of_dish", TEXT),
+                *[(f"ingredients.{aisle}", TEXT) for aisle in INGREDIENT_AISLES],
+                ("instructions.step", TEXT),
+                ("instructions.details", TEXT),
+            ],
+            name="recipes_text",
+            weights={
+                "name_of_dish": 10,
+                **{f"ingredients.{aisle}": 5 for aisle in INGREDIENT_AISLES},
+            },
+        ),
+    ],
+    "cookbooks": [
+        # get_cookbook, process.db.is_cookbook and list_cookbooks ordering.
+        IndexModel(COOKBOOK_SORT, name="key_id"),
+    ],
+    "users": [
+        # login and signup.
+        IndexModel([("email", ASCENDING)], name="email", unique=True),
+        # Finding every user tracking a recipe.
+        IndexModel([("recipes.recipe_id", ASCENDING)], name="recipes_recipe_id"),
+    ],
+}
+
+
+def ensure_indexes(db: Database) -> list[str]:
+    """Create any missing indexes. Returns a message per index that failed."""
+    errors = []
+    for collection_name, indexes in INDEXES.items():
+        for index in indexes:
+            try:
+                db[collection_name].create_indexes([index])
+            except OperationFailure as e:
+                errors.append(f"{collection_name}.{index.document['name']}: {e}")
+    return errors
+
+
+def query_shapes(db: Database) -> dict[str, dict]:
+    """The ``explain`` command of each view's query, with sample values."""
+    recipe = db.recipes.find_one({}, {"cookbook_key": 1}) or {}
+    cookbook_key = recipe.get("cookbook_key", "cookbook")
+    user = db.users.find_one({}, {"email": 1}) or {}
+    user_id = user.get("_id", ObjectId())
+
+    def find(collection: str, search_dict: dict, sort=None, limit=0) -> dict:
+        command = {"find": collection, "filter": search_dict, "limit": limit}
+        if sort:
+            command["sort"] = dict(sort)
+        return command
+
+    def count(collection: str, search_dict: dict) -> dict:
+        return {"count": collection, "query": search_dict}
+
+    return {
+        "list_recipes": find("recipes", {}, RECIPE_SORT, 31),
+        "list_recipes?cookbook": find(
+            "recipes", {"cookbook_key": cookbook_key}, RECIPE_SORT, 31
+        ),
+        # A keyset page (``after=``), the same seek on every key of the sort.
+        "list_recipes?after": find(
+            "recipes",
+            seek_filter(RECIPE_SORT, [cookbook_key, 1, recipe.get("_id", ObjectId())]),
+            RECIPE_SORT,
+            31,
+        ),
+        "list_recipes?query": find(
+            "recipes", {"$text": {"$search": "chicken"}}, RECIPE_SORT, 31
+        ),
+        "recipes_count?query": count("recipes", {"$text": {"$search": "chicken"}}),
+        "search_recipes": {
+            **find("recipes", {"$text": {"$search": "chicken"}}, SEARCH_SORT, 30),
+            "projection": {"score": SEARCH_SORT["score"]},
+        },
+        "get_n_random_recipes": find(
+            "recipes", {RANDOM_KEY: {"$gte": 0.5}}, [(RANDOM_KEY, ASCENDING)], 6
+        ),
+        "get_n_random_recipes?cookbook": find(
+            "recipes",
+            {"cookbook_key": cookbook_key, RANDOM_KEY: {"$gte": 0.5}},
+            [(RANDOM_KEY, ASCENDING)],
+            6,
+        ),
+        "get_recipe": find("recipes", {"_id": recipe.get("_id", ObjectId())}),
+        "existing_pages": {
+            **find("recipes", {"cookbook_key": cookbook_key}),
+            "projection": EXISTING_PAGES_PROJECTION,
+        },
+        "list_cookbooks": find("cookbooks", {}, COOKBOOK_SORT, 11),
+        "list_cookbooks?after": find(
+            "cookbooks",
+            seek_filter(COOKBOOK_SORT, [cookbook_key, ObjectId()]),
+            COOKBOOK_SORT,
+            11,
+        ),
+        "get_cookbook": find("cookbooks", {"key": cookbook_key}, limit=1),
+        "login": find("users", {"email": user.get("email", "")}, limit=1),
+        "update_user_recipe": find(
+            "users", {"_id": user_id, "recipes.recipe_id": ObjectId()}, limit=1
+        ),
+    }
+
+
+def plan_stages(plan) -> list[str]:
+    """Every stage name in an explain plan, ignoring rejected plans."""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for key, value in plan.items():
+            if key != "rejectedPlans":
+                stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(plan_stages(value))
+    return stages
+
+
+def audit(db: Database) -> dict[str, list[str]]:
+    """Flag COLLSCANs and in-memory SORTs in each query shape's winning plan,
+    and FETCHes in covered shapes."""
+    problems = {}
+    for name, command in query_shapes(db).items():
+        explained = db.command("explain", command, verbosity="queryPlanner")
+        stages = plan_stages(explained.get("queryPlanner", explained))
+        flagged = [stage for stage in stages if stage in ("COLLSCAN", "SORT")]
+        if name in TOP_K_SHAPES:
+            flagged = [stage for stage in flagged if stage != "SORT"]
+        if name in COVERED_SHAPES and "FETCH" in stages:
+            flagged.append("FETCH")
+        problems[name] = flagged
+    return problems
+
+
+def main(apply: bool, run_audit: bool) -> None:
+    load_dotenv()
+    client = MongoClient(os.environ.get("COOKBOOKS_CONNECTION_STRING"))
+    db = client[os.environ.get("COOKBOOKS_DB_NAME")]
+    if apply:
+        errors = ensure_indexes(db)
+        for error in errors:
+            print(f"Error: {error}")
+        if not errors:
+            print("Indexes are up to date")
+    if run_audit:
+        for name, flagged in audit(db).items():
+            print(f"{name}: {', '.join(flagged) if flagged else 'ok'}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Apply the API's MongoDB indexes and audit its query plans."
+    )
+    parser.add_argument(
+        "--apply",
+        action="store_true",
+        default=False,
+        help="Create any missing indexes.",
+    )
+    parser.add_argument(
+        "--audit",
+        action="store_true",
+        default=False,
+        help="Explain each view's query and flag COLLSCANs and in-memory sorts.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args.apply, args.audit)
@@ -0,0 +1,287 @@
+"""
+api/ingredients - An in-memory index of which recipes use which ingredients.
+
+Answers "what can I cook with chicken, lemon and rice?" without scanning the
+recipes. Each ingredient line is normalized to a term (``"2 lbs. Chicken
+Thighs, boneless"`` is ``"chicken thigh"``), and each term maps to the bitset
+(a Python ``int``) of the recipes using it, numbered in listing order. A
+queried ingredient covers every term containing all of its words, so
+``chicken`` covers ``chicken thigh`` too. Staples like salt and oil are
+assumed to be at hand.
+
+Recipes are then ranked by how many of their ingredients are missing, by
+counting the covered terms of every recipe at once with bitwise operations.
+Most terms (e.g. OCR'd one-off lines) are used by a handful of recipes: those
+keep a sorted array of recipe numbers instead, 4 bytes a recipe, and are
+turned into a bitset only when a query covers them.
+
+The index is built per process from MongoDB, in the background: at startup,
+and again once older than ``INGREDIENT_INDEX_TTL`` seconds (``COOKBOOKS_``
+env prefix). Queries before the first build finishes are turned away. API
+writes mark it stale in this process; other workers and ``process_photos.py``
+are covered by the TTL.
+"""
+
+import functools
+import os
+import re
+import threading
+import time
+from array import array
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
+
+from bson import ObjectId
+from flask import Flask
+from pymongo.collection import Collection
+
+# Ingredients every kitchen is assumed to have: terms of only these words,
+# with at least one of STAPLES (e.g. "kosher salt and black pepper").
+STAPLES = {"salt", "pepper", "water", "ice", "oil"}
+STAPLE_WORDS = STAPLES | {"kosher", "sea", "black", "and", "olive", "vegetable"}
+# Words that say how much, or how to prepare, rather than what.
+QUANTITY_WORDS = {
+    "cup", "tablespoon", "tbsp", "teaspoon", "tsp", "ounce", "oz", "pound", "lb",
+    "gram", "g", "kg", "kilogram", "ml", "l", "liter", "litre", "pint", "quart",
+    "clove", "can", "jar", "package", "pkg", "stick", "pinch", "dash", "handful",
+    "bunch", "sprig", "slice", "piece", "head", "stalk", "large", "medium",
+    "small", "whole", "about", "of", "a", "an", "or", "to", "taste", "plus",
+    "more", "for", "serving", "optional", "fresh", "freshly", "finely",
+    "roughly", "coarsely", "thinly", "chopped", "minced", "diced", "sliced",
+    "grated", "shredded", "crushed", "ground", "peeled", "trimmed", "halved",
+    "quartered", "softened", "melted", "divided", "packed", "room",
+    "temperature", "extra", "virgin", "boneless", "skinless",
+}
+PROJECTION = {"cookbook_key": 1, "ingredients": 1}
+_PARENTHESES = re.compile(r"\([^)]*\)")
+_WORD = re.compile(r"[a-z]+")
+
+
+def singular(word: str) -> str:
+    if word == "leaves":
+        return "leaf"
+    if word.endswith("oes") or word.endswith("ches") or word.endswith("shes"):
+        return word[:-2]
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("s") and not word.endswith("ss") and len(word) > 2:
+        return word[:-1]
+    return word
+
+
+@functools.lru_cache(maxsize=65536)
+def normalize(line: str) -> str:
+    """The term for an ingredient line or query, ``""`` if it has no words."""
+    line = _PARENTHESES.sub(" ", line.lower()).split(",")[0]
+    words = [singular(word) for word in _WORD.findall(line)]
+    return " ".join(word for word in words if word not in QUANTITY_WORDS)
+
+
+def is_staple(term: str) -> bool:
+    words = set(term.split())
+    return words <= STAPLE_WORDS and bool(words & STAPLES)
+
+
+def bitset_of(numbers: array, size: int) -> int:
+    """The bitset of sorted recipe numbers, out of ``size`` recipes."""
+    buffer = bytearray((size + 7) // 8)
+    for number in numbers:
+        buffer[number >> 3] |= 1 << (number & 7)
+    return int.from_bytes(buffer, "little")
+
+
+def bits(bitset: int) -> Iterator[int]:
+    """The recipe numbers in a bitset, in order."""
+    while bitset:
+        low = bitset & -bitset
+        yield low.bit_length() - 1
+        bitset ^= low
+
+
+class IngredientIndex:
+    def __init__(self, docs: Iterable[dict]) -> None:
+        """Index recipe documents, in listing order, projected on PROJECTION."""
+        self.ids: list[ObjectId] = []
+        self.numbers: dict[ObjectId, int] = {}
+        self.terms: list[str] = []
+        self.recipe_terms: list[tuple[int, ...]] = []
+        term_numbers: dict[str, int] = {}
+        postings: list[array] = []
+        cookbooks: dict[str, int] = defaultdict(int)
+        sizes: dict[int, int] = defaultdict(int)
+        for number, doc in enumerate(docs):
+            self.ids.append(doc["_id"])
+            self.numbers[doc["_id"]] = number
+            bit = 1 << number
+            cookbooks[doc.get("cookbook_key")] |= bit
+            recipe_terms = set()
+            for lines in (doc.get("ingredients") or {}).values():
+                for line in lines or []:
+                    term = normalize(line)
+                    if not term or is_staple(term):
+                        continue
+                    if term not in term_numbers:
+                        term_numbers[term] = len(self.terms)
+                        self.terms.append(term)
+                        postings.append(array("I"))
+                    recipe_terms.add(term_numbers[term])
+            for term_number in recipe_terms:
+                postings[term_number].append(number)
+            self.recipe_terms.append(tuple(sorted(recipe_terms)))
+            sizes[len(recipe_terms)] |= bit
+        # A bitset costs a bit per recipe in the index, an array 32 bits per
+        # recipe using the term: keep whichever is smaller.
+        size = len(self.ids)
+        self.postings: list[int | array] = [
+            bitset_of(posting, size) if len(posting) * 32 >= size else posting
+            for posting in postings
+        ]
+        self.cookbooks = dict(cookbooks)
+        # Recipe bitsets by their number of (non-staple) ingredients.
+        self.sizes = dict(sizes)
+        self.all = (1 << len(self.ids)) - 1
+        # Terms by each of their words, to find the terms a query covers.
+        self._word_terms: dict[str, set[int]] = defaultdict(set)
+        for term_number, term in enumerate(self.terms):
+            for word in term.split():
+                self._word_terms[word].add(term_number)
+
+    def covered(self, have: Iterable[str]) -> set[int]:
+        """The terms containing every word of one of the ``have`` ingredients."""
+        covered = set()
+        for ingredient in have:
+            words = normalize(ingredient).split()
+            if not words:
+                continue
+            covered |= set.intersection(
+                *(self._word_terms.get(word, set()) for word in words)
+            )
+        return covered
+
+    def missing(self, covered: set[int], max_missing: int, mask: int) -> list[int]:
+        """
+        Bitsets of the recipes in ``mask`` using at least one covered term,
+        missing 0, 1, ... ``max_missing`` of their ingredients.
+        """
+        # at_least[i] holds the recipes using at least i covered terms: each
+        # term's recipes move up one count, from the highest count down so
+        # that a recipe moves at most once per term.
+        most = max(self.sizes, default=0)
+        at_least = [mask] + [0] * min(most, len(covered))
+        for term_number in covered:
+            posting = self.posting(term_number) & mask
+            for i in range(len(at_least) - 1, 0, -1):
+                at_least[i] |= at_least[i - 1] & posting
+        at_least.append(0)
+        # A recipe of size n using exactly n - d covered terms misses d.
+        missing = []
+        for d in range(max_missing + 1):
+            bitset = 0
+            for size, recipes in self.sizes.items():
+                used = size - d
+                if 1 <= used < len(at_least) - 1:
+                    bitset |= recipes & at_least[used] & ~at_least[used + 1]
+            missing.append(bitset)
+        return missing
+
+    def posting(self, term_number: int) -> int:
+        """The bitset of the recipes using a term."""
+        posting = self.postings[term_number]
+        if isinstance(posting, int):
+            return posting
+        return bitset_of(posting, len(self.ids))
+
+    def mask(
+        self,
+        cookbook_key: str,
+        only_ids: Iterable[ObjectId] | None = None,
+        excluded_ids: Iterable[ObjectId] = (),
+    ) -> int:
+        """The recipes of a cookbook (or all), of ``only_ids`` if given, and
+        without ``excluded_ids``."""
+        mask = self.cookbooks.get(cookbook_key, 0) if cookbook_key else self.all
+        if only_ids is not None:
+            mask &= self._bitset(only_ids)
+        return mask & ~self._bitset(excluded_ids)
+
+    def _bitset(self, recipe_ids: Iterable[ObjectId]) -> int:
+        bitset = 0
+        for recipe_id in recipe_ids:
+            number = self.numbers.get(recipe_id)
+            if number is not None:
+                bitset |= 1 << number
+        return bitset
+
+    def missing_terms(self, number: int, covered: set[int]) -> list[str]:
+        return [
+            self.terms[term_number]
+            for term_number in self.recipe_terms[number]
+            if term_number not in covered
+        ]
+
+
+class IngredientIndexCache:
+    def __init__(self, ttl: float = 300.0) -> None:
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._index: IngredientIndex | None = None
+        self._built_at = 0.0
+        self._rebuilding = False
+
+    def init_app(self, app: Flask) -> None:
+        self.init_config(app.config)
+        # A worker forked mid-build has the flag but not the thread: start over.
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def init_config(self, config) -> None:
+        self.ttl = float(config.get("INGREDIENT_INDEX_TTL", self.ttl))
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+        self._rebuilding = False
+
+    def start(self, collection: Collection, sort: list[tuple[str, int]]) -> None:
+        """Build the index in the background, unless a build is running."""
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(
+            target=self._build, args=(collection, sort), daemon=True
+        ).start()
+
+    def get(
+        self, collection: Collection, sort: list[tuple[str, int]]
+    ) -> IngredientIndex | None:
+        """The index of ``collection`` in ``sort`` order, or None until the
+        first build finishes.
+
+        A stale index is still returned while it is rebuilt in the background.
+        """
+        with self._lock:
+            index = self._index
+            stale = time.monotonic() - self._built_at >= self.ttl
+        if index is None or stale:
+            self.start(collection, sort)
+        return index
+
+    def _build(self, collection: Collection, sort) -> None:
+        started = time.monotonic()
+        try:
+            index = IngredientIndex(collection.find({}, PROJECTION).sort(sort))
+        except Exception as e:
+            print(f"Failed to build the ingredient index: {e}")
+            index = None
+        with self._lock:
+            self._rebuilding = False
+            if index is not None:
+                self._index = index
+                self._built_at = started
+
+    def invalidate(self) -> None:
+        """Rebuild on next use, after a write to the recipes."""
+        with self._lock:
+            self._built_at = 0.0
+
+
+ingredient_index = IngredientIndexCache()
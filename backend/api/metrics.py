@@ -0,0 +1,224 @@
+"""
+api/metrics - Where each request spends its time.
+
+Every request records, by route (its endpoint, e.g. ``list_recipes``):
+
+- ``db``: the number and duration of its MongoDB commands, from a PyMongo
+  ``CommandListener``;
+- ``model``: building response dicts from documents (pydantic validation and
+  dump), timed with :func:`timed`;
+- ``serialize``: encoding JSON, timed in ``api.serialize``;
+- ``total``: the whole request.
+
+They are sent back in a ``Server-Timing`` header, and aggregated into latency
+histograms served in the Prometheus text format at ``/metrics``, to scrapers
+sending ``Authorization: Bearer <METRICS_TOKEN>``. Without a ``METRICS_TOKEN``
+the histograms aren't served at all. Each process keeps its own, so scrape
+every worker, or run one per container. Set ``METRICS=false`` to turn both off
+(all with the ``COOKBOOKS_`` env prefix).
+
+A streamed (NDJSON) response's header is sent before its records are read and
+encoded, so it only covers the work done until then. The histograms cover it
+all.
+"""
+
+import bisect
+import functools
+import hmac
+import threading
+import time
+from collections import defaultdict
+
+from flask import Flask, Response, current_app, g, has_request_context, request
+from pymongo import monitoring
+
+# Seconds. Prometheus' default buckets.
+BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0
+)
+COMMAND_BUCKETS = (1, 2, 3, 5, 8, 13, 21)
+TIMERS = ("db", "model", "serialize")
+
+
+class Histogram:
+    def __init__(self, buckets: tuple) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def lines(self, name: str, labels: str) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        cumulative += self.counts[-1]
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # (metric, route) -> Histogram
+        self._histograms: dict[tuple[str, str], Histogram] = {}
+        # (route, command name) -> count
+        self._commands: dict[tuple[str, str], int] = defaultdict(int)
+
+    def observe(self, metric: str, route: str, value: float, buckets=BUCKETS):
+        with self._lock:
+            histogram = self._histograms.get((metric, route))
+            if histogram is None:
+                histogram = self._histograms[(metric, route)] = Histogram(buckets)
+            histogram.observe(value)
+
+    def count_command(self, route: str, command_name: str) -> None:
+        with self._lock:
+            self._commands[(route, command_name)] += 1
+
+    def exposition(self) -> str:
+        """The Prometheus text format of every metric."""
+        help_texts = {
+            "request_duration_seconds": "Request latency.",
+            "db_duration_seconds": "Time in MongoDB commands per request.",
+            "model_duration_seconds": "Time building response models per request.",
+            "serialize_duration_seconds": "Time encoding JSON per request.",
+            "db_commands": "MongoDB commands per request.",
+        }
+        lines = []
+        with self._lock:
+            for metric, help_text in help_texts.items():
+                name = f"cookbooks_{metric}"
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for (key, route), histogram in sorted(self._histograms.items()):
+                    if key == metric:
+                        lines.extend(histogram.lines(name, f'route="{route}"'))
+            name = "cookbooks_db_commands_total"
+            lines.append(f"# HELP {name} MongoDB commands run, by command.")
+            lines.append(f"# TYPE {name} counter")
+            for (route, command_name), count in sorted(self._commands.items()):
+                lines.append(
+                    f'{name}{{route="{route}",command="{command_name}"}} {count}'
+                )
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def _route() -> str:
+    return request.endpoint or "unmatched"
+
+
+def _timings():
+    """The current request's timings, or ``None`` outside a request."""
+    if not has_request_context():
+        return None
+    return g.get("timings")
+
+
+def add_time(timer: str, seconds: float) -> None:
+    timings = _timings()
+    if timings is not None:
+        timings[timer] += seconds
+
+
+def timed(timer: str):
+    """Decorate a function to add its run time to the request's ``timer``."""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                add_time(timer, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Adds every MongoDB command a request runs to its ``db`` timer."""
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        pass
+
+    def _finished(self, event) -> None:
+        timings = _timings()
+        if timings is None:
+            return
+        timings["db"] += event.duration_micros / 1_000_000
+        g.db_commands += 1
+        metrics.count_command(_route(), event.command_name)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finished(event)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finished(event)
+
+
+def start_timer() -> None:
+    g.timings = dict.fromkeys(TIMERS, 0.0)
+    g.db_commands = 0
+    g.request_started = time.perf_counter()
+
+
+def server_timing(response: Response) -> Response:
+    timings = _timings()
+    if timings is None:
+        return response
+    total = time.perf_counter() - g.request_started
+    entries = [
+        f'db;dur={timings["db"] * 1000:.2f};desc="{g.db_commands} commands"',
+        f"model;dur={timings['model'] * 1000:.2f}",
+        f"serialize;dur={timings['serialize'] * 1000:.2f}",
+        f"total;dur={total * 1000:.2f}",
+    ]
+    response.headers["Server-Timing"] = ", ".join(entries)
+    return response
+
+
+def record(exc: BaseException | None = None) -> None:
+    timings = _timings()
+    if timings is None or request.endpoint == "metrics":
+        return
+    route = _route()
+    total = time.perf_counter() - g.request_started
+    metrics.observe("request_duration_seconds", route, total)
+    for timer in TIMERS:
+        metrics.observe(f"{timer}_duration_seconds", route, timings[timer])
+    metrics.observe("db_commands", route, g.db_commands, COMMAND_BUCKETS)
+
+
+def metrics_view():
+    token = current_app.config["METRICS_TOKEN"]
+    scheme, _, sent = request.headers.get("Authorization", "").partition(" ")
+    if scheme != "Bearer" or not hmac.compare_digest(sent.encode(), token.encode()):
+        return Response(
+            "Unauthorized", status=401, headers={"WWW-Authenticate": "Bearer"}
+        )
+    return Response(metrics.exposition(), mimetype="text/plain; version=0.0.4")
+
+
+def init_app(app: Flask) -> None:
+    """Instrument ``app``. Call it before the MongoDB client is created."""
+    if not app.config.get("METRICS", True):
+        return
+    monitoring.register(CommandTimer())
+    app.before_request(start_timer)
+    app.after_request(server_timing)
+    app.teardown_request(record)
+    # Route timings and traffic aren't for everyone.
+    if app.config.get("METRICS_TOKEN"):
+        app.add_url_rule("/metrics", "metrics", metrics_view, methods=["GET"])
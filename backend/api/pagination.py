@@ -0,0 +1,150 @@
+"""
+api/pagination - Helpers for keyset (cursor-based) pagination.
+
+List endpoints page with ``page=`` by default, which skips over every earlier
+document. Passing ``after=<token>`` instead seeks straight past the last
+document of the previous page on an indexed sort key, so every page costs the
+same. An empty ``after=`` starts from the first page. The token is opaque to
+clients and is returned in the ``next`` link. Clients can still forge one, so
+each decoded value must be a plain value of its sort key's type (or null),
+never e.g. a query operator.
+"""
+
+import base64
+import functools
+from collections.abc import Callable, Iterable, Iterator, Sequence
+
+from bson import json_util
+from bson.errors import BSONError
+from flask import abort, url_for
+from pymongo import ASCENDING
+
+Sort = list[tuple[str, int]]
+# Builds the absolute URL of a listing with the given query parameters, so that
+# the links are built the same way by the Flask and ASGI apps.
+Href = Callable[..., str]
+
+
+def encode_after(values: list) -> str:
+    """Encode the sort key values of a page's last document as a token."""
+    raw = json_util.dumps(values).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def is_key_value(value, key_type: type) -> bool:
+    """Whether a decoded token value can stand in for a sort key of ``key_type``."""
+    if value is None:
+        return True
+    if key_type is int:
+        # bool is an int too, and BSON has no integer wider than 64 bits.
+        return type(value) is int and -(2**63) <= value < 2**63
+    return isinstance(value, key_type)
+
+
+def decode_after(token: str, sort: Sort, types: Sequence[type]) -> list | None:
+    """
+    Decode an ``after`` token of the sort keys' ``types``. Returns ``None`` for
+    the first page, and aborts with a 400 on any other value.
+    """
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json_util.loads(raw.decode("utf-8"))
+    except (BSONError, LookupError, OverflowError, TypeError, ValueError):
+        abort(400, "Invalid 'after' token")
+    if not isinstance(values, list) or len(values) != len(sort):
+        abort(400, "Invalid 'after' token")
+    if not all(map(is_key_value, values, types)):
+        abort(400, "Invalid 'after' token")
+    return values
+
+
+def sort_values(doc: dict, sort: Sort) -> list:
+    return [doc.get(field) for field, _ in sort]
+
+
+def seek_filter(sort: Sort, values: list) -> dict:
+    """Query filter matching documents strictly after ``values`` in ``sort`` order."""
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {prev: value for (prev, _), value in zip(sort[:i], values[:i])}
+        clause[field] = {"$gt" if direction == ASCENDING else "$lt": values[i]}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+
+def seek_expr(sort: Sort, values: list, var: str) -> dict:
+    """Aggregation expression form of :func:`seek_filter` over ``$$var``."""
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = [
+            {"$eq": [f"$${var}.{prev}", {"$literal": value}]}
+            for (prev, _), value in zip(sort[:i], values[:i])
+        ]
+        op = "$gt" if direction == ASCENDING else "$lt"
+        clause.append({op: [f"$${var}.{field}", {"$literal": values[i]}]})
+        clauses.append({"$and": clause})
+    return {"$or": clauses}
+
+
+class KeysetPage:
+    """
+    Iterates a page of documents fetched with a limit of ``per_page + 1``.
+
+    The extra document only tells whether there is a next page. Once iterated,
+    :meth:`next_after` is the token for that page, or ``None`` on the last one.
+    """
+
+    def __init__(self, docs: Iterable[dict], per_page: int, sort: Sort) -> None:
+        self.docs = docs
+        self.per_page = per_page
+        self.sort = sort
+        self.last = None
+        self.has_next = False
+
+    def __iter__(self) -> Iterator[dict]:
+        for i, doc in enumerate(self.docs):
+            if i == self.per_page:
+                self.has_next = True
+                break
+            self.last = sort_values(doc, self.sort)
+            yield doc
+
+    def next_after(self) -> str | None:
+        if not self.has_next:
+            return None
+        return encode_after(self.last)
+
+
+def endpoint_href(endpoint: str) -> Href:
+    """The ``Href`` of a Flask endpoint."""
+    return functools.partial(url_for, endpoint, _external=True)
+
+
+def last_page(count: int, per_page: int) -> int:
+    return max(1, -(-count // per_page))
+
+
+def page_links(href: Href, page: int, last: int, **params) -> dict:
+    """Build the ``_links`` of page ``page`` of ``last``, keeping any non-empty
+    filters."""
+    params = {key: value for key, value in params.items() if value}
+    links = {
+        "self": {"href": href(page=page, **params)},
+        "last": {"href": href(page=last, **params)},
+    }
+    if page > 1:
+        links["prev"] = {"href": href(page=page - 1, **params)}
+    if page < last:
+        links["next"] = {"href": href(page=page + 1, **params)}
+    return links
+
+
+def keyset_links(href: Href, after: str, next_after: str | None, **params) -> dict:
+    """Build the ``_links`` of a keyset page, keeping any non-empty filters."""
+    params = {key: value for key, value in params.items() if value}
+    links = {"self": {"href": href(after=after, **params)}}
+    if next_after is not None:
+        links["next"] = {"href": href(after=next_after, **params)}
+    return links
@@ -0,0 +1,116 @@
+"""
+api/passwords - bcrypt password hashing off the request threads.
+
+bcrypt is deliberately slow, so a burst of logins could take every worker and
+starve the reads. Hashes and checks run on a small shared thread pool instead
+(bcrypt releases the GIL), of ``PASSWORD_HASH_WORKERS`` threads per process.
+A request that waits more than ``PASSWORD_HASH_TIMEOUT`` seconds for the pool
+gives up with :class:`PasswordHasherBusy`. New hashes use ``BCRYPT_LOG_ROUNDS``
+(all with the ``COOKBOOKS_`` env prefix), and :meth:`PasswordHasher.needs_rehash`
+tells which stored hashes to upgrade after it changes.
+
+Run the workers with threads (e.g. ``gunicorn -w 4 --threads 8``) so that
+reads keep being served while logins wait for the pool.
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import bcrypt
+from flask import Flask
+
+DEFAULT_LOG_ROUNDS = 12
+DEFAULT_TIMEOUT = 10.0
+
+
+class PasswordHasherBusy(Exception):
+    """The hashing pool didn't get to a password in time."""
+
+
+class PasswordHasher:
+    def __init__(self) -> None:
+        self.log_rounds = DEFAULT_LOG_ROUNDS
+        self.timeout = DEFAULT_TIMEOUT
+        # Leave at least half of the cores to everything else.
+        self.workers = max(1, (os.cpu_count() or 2) // 2)
+        # Started on first use, so that forked workers each start their own.
+        self._executor = None
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def init_app(self, app: Flask) -> None:
+        self.init_config(app.config)
+
+    def init_config(self, config) -> None:
+        self.log_rounds = int(config.get("BCRYPT_LOG_ROUNDS", self.log_rounds))
+        self.timeout = float(config.get("PASSWORD_HASH_TIMEOUT", self.timeout))
+        with self._lock:
+            self.workers = int(config.get("PASSWORD_HASH_WORKERS", self.workers))
+            # Resized on next use. The old pool finishes what it was given.
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def _after_fork(self) -> None:
+        # The parent's pool threads don't exist in the child.
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _hash(self, password: str) -> str:
+        salt = bcrypt.gensalt(rounds=self.log_rounds)
+        return bcrypt.hashpw(password.encode("utf-8"), salt).decode("utf-8")
+
+    @staticmethod
+    def _check(pw_hash: str, password: str) -> bool:
+        try:
+            return bcrypt.checkpw(password.encode("utf-8"), pw_hash.encode("utf-8"))
+        except ValueError:
+            # Not a bcrypt hash.
+            return False
+
+    def _submit(self, fn, *args) -> Future:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="bcrypt"
+                )
+            return self._executor.submit(fn, *args)
+
+    def _wait(self, future: Future):
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise PasswordHasherBusy()
+
+    async def _await(self, future: Future):
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except TimeoutError:
+            raise PasswordHasherBusy()
+
+    def hash(self, password: str) -> str:
+        return self._wait(self._submit(self._hash, password))
+
+    def check(self, pw_hash: str, password: str) -> bool:
+        return self._wait(self._submit(self._check, pw_hash, password))
+
+    async def ahash(self, password: str) -> str:
+        return await self._await(self._submit(self._hash, password))
+
+    async def acheck(self, pw_hash: str, password: str) -> bool:
+        return await self._await(self._submit(self._check, pw_hash, password))
+
+    def needs_rehash(self, pw_hash: str) -> bool:
+        """Whether a stored hash was made with another cost than the current one."""
+        # bcrypt hashes look like ``$2b$12$<salt and hash>``.
+        parts = pw_hash.split("$")
+        if len(parts) < 4 or not parts[2].isdigit():
+            return True
+        return int(parts[2]) != self.log_rounds
+
+
+hasher = PasswordHasher()
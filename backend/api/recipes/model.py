@@ -1,7 +1,3 @@
-# FastAPI's jsonable_encoder handles converting various non-JSON types,
-# such as datetime between JSON types and native Python types.
-from fastapi.encoders import jsonable_encoder
-
 # Pydantic, and Python's built-in typing are used to define a schema
 # that defines the structure and types of the different objects stored
 # in the recipes collection, and managed by this API.
@@ -41,10 +37,36 @@ class Recipe(BaseModel):
     note: str | None = None
 
     def to_json(self):
-        return jsonable_encoder(self, exclude_none=True)
+        return self.model_dump(mode="json", by_alias=True, exclude_none=True)
 
     def to_bson(self):
         data = self.dict(by_alias=True, exclude_none=True)
         if data.get("_id") is None:
             data.pop("_id", None)
         return data
+
+
+class RecipeCard(BaseModel):
+    """The summary of a recipe shown in lists, without instructions or note."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    id: ObjectId = Field(None, alias="_id")
+    cookbook_key: str
+
+    name_of_dish: str
+    serving_size: str
+    page_number: int
+    ingredients: IngredientList
+
+    def to_json(self):
+        return self.model_dump(mode="json", by_alias=True, exclude_none=True)
+
+
+# Query projection loading only the fields of a ``RecipeCard``.
+RECIPE_CARD_PROJECTION = {
+    "cookbook_key": 1,
+    "name_of_dish": 1,
+    "serving_size": 1,
+    "page_number": 1,
+    "ingredients": 1,
+}
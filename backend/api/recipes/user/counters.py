@@ -0,0 +1,249 @@
+"""
+api/recipes/user/counters - Counts of each user's recipes, kept on the user.
+
+Every user document holds ``recipe_counts`` (see ``UserRecipeCounts``): the
+number of recipes in its embedded ``recipes`` array in total, cooked, uncooked
+and per cookbook key. Each write to the array changes them in the same update,
+with ``$inc``, so that counting is a point read of the user rather than an
+aggregation over the array. The builders here return the ``(filter, update)``
+pairs of those writes, for the Flask and ASGI views alike.
+
+Those writes only match users that already have counters, so that an ``$inc``
+never starts them from zero on a user with recipes. Users from before the
+counters get them from ``seed_update`` on their first write: if a write
+matches nothing, seed and retry it. Cookbook keys are field names in the
+counters, so keys with a ``.`` or a leading ``$`` are rejected.
+
+Recompute the counters from the arrays, for users created before they existed
+or after writing to the arrays by hand:
+
+    uv run -m api.recipes.user.counters --repair
+"""
+
+import argparse
+import os
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from pymongo.database import Database
+
+from api.users.model import (
+    COUNTED_COOKBOOK_KEY,
+    UserRecipeCounts,
+    UserRecipeStatus,
+    is_counted_cookbook_key,
+)
+
+COUNTS = "recipe_counts"
+HAS_COUNTS = {COUNTS: {"$exists": True}}
+
+
+def status_key(status: str | None) -> str:
+    """The counter of a status. Recipes that aren't cooked count as uncooked."""
+    return "cooked" if status == UserRecipeStatus.cooked else "uncooked"
+
+
+def counts_inc(cookbook_key: str, status: str | None, sign: int = 1) -> dict:
+    """The ``$inc`` of adding (or with ``sign=-1``, removing) a user recipe."""
+    if not is_counted_cookbook_key(cookbook_key):
+        raise ValueError(f"Cookbook key {cookbook_key!r} can't be counted")
+    return {
+        f"{COUNTS}.total": sign,
+        f"{COUNTS}.{status_key(status)}": sign,
+        f"{COUNTS}.cookbooks.{cookbook_key}": sign,
+    }
+
+
+def push_update(user_id: ObjectId, user_recipe: dict) -> tuple[dict, dict]:
+    """Add ``user_recipe`` to the user's recipes, unless it is already there."""
+    return (
+        {
+            "_id": user_id,
+            "recipes.recipe_id": {"$ne": user_recipe["recipe_id"]},
+            **HAS_COUNTS,
+        },
+        {
+            "$push": {"recipes": user_recipe},
+            "$inc": counts_inc(user_recipe["cookbook_key"], user_recipe["status"]),
+        },
+    )
+
+
+def set_updates(
+    user_id: ObjectId, recipe_id: ObjectId, update_dict: dict
+) -> list[tuple[dict, dict]]:
+    """
+    Apply a positional ``$set`` (see ``user_recipe_update``) to a user recipe.
+
+    A status change moves the recipe between the cooked and uncooked counters,
+    but only if its status really changes. So it is tried first only on a
+    recipe with another status, and then on the recipe whatever its status:
+    apply the updates in order, and stop at the first that matches. A user
+    without counters only gets the last, and keeps being counted from its
+    recipes.
+    """
+    updates = []
+    status = update_dict.get("recipes.$.status")
+    if status is not None:
+        new = status_key(status)
+        old = "uncooked" if new == "cooked" else "cooked"
+        changed = {f"{COUNTS}.{new}": 1, f"{COUNTS}.{old}": -1}
+        updates.append(
+            (
+                {
+                    "_id": user_id,
+                    "recipes": {
+                        "$elemMatch": {
+                            "recipe_id": recipe_id,
+                            "status": {"$ne": status},
+                        }
+                    },
+                    **HAS_COUNTS,
+                },
+                {"$set": update_dict, "$inc": changed},
+            )
+        )
+    updates.append(
+        ({"_id": user_id, "recipes.recipe_id": recipe_id}, {"$set": update_dict})
+    )
+    return updates
+
+
+def pull_update(user_id: ObjectId, user_recipe: dict) -> tuple[dict, dict]:
+    """
+    Remove a user recipe as it was read.
+
+    Only matches while its status is unchanged, so that the right counter is
+    decremented. Read it again and retry if it doesn't match.
+    """
+    recipe_id = user_recipe["recipe_id"]
+    return (
+        {
+            "_id": user_id,
+            "recipes": {
+                "$elemMatch": {
+                    "recipe_id": recipe_id,
+                    "status": user_recipe.get("status"),
+                }
+            },
+            **HAS_COUNTS,
+        },
+        {
+            "$pull": {"recipes": {"recipe_id": recipe_id}},
+            "$inc": counts_inc(
+                user_recipe["cookbook_key"], user_recipe.get("status"), -1
+            ),
+        },
+    )
+
+
+def seed_update(user_id: ObjectId) -> tuple[dict, list[dict]]:
+    """Compute the counters of a user that has none, from its recipes."""
+    return (
+        {"_id": user_id, COUNTS: {"$exists": False}},
+        [{"$set": {COUNTS: counts_expr()}}],
+    )
+
+
+def counts_expr() -> dict:
+    """Aggregation expression computing the counters of a user's recipes."""
+    recipes = {"$ifNull": ["$recipes", []]}
+    cooked = {
+        "$size": {
+            "$filter": {
+                "input": recipes,
+                "cond": {"$eq": ["$$this.status", UserRecipeStatus.cooked.value]},
+            }
+        }
+    }
+    return {
+        "total": {"$size": recipes},
+        "cooked": cooked,
+        "uncooked": {"$subtract": [{"$size": recipes}, cooked]},
+        "cookbooks": {
+            "$arrayToObject": {
+                "$map": {
+                    # Keys that can't be field names are left out.
+                    "input": {
+                        "$filter": {
+                            "input": {
+                                "$setUnion": [
+                                    {"$ifNull": ["$recipes.cookbook_key", []]}
+                                ]
+                            },
+                            "as": "key",
+                            "cond": {
+                                "$regexMatch": {
+                                    "input": {"$toString": "$$key"},
+                                    "regex": COUNTED_COOKBOOK_KEY,
+                                }
+                            },
+                        }
+                    },
+                    "as": "key",
+                    "in": {
+                        "k": "$$key",
+                        "v": {
+                            "$size": {
+                                "$filter": {
+                                    "input": recipes,
+                                    "cond": {"$eq": ["$$this.cookbook_key", "$$key"]},
+                                }
+                            }
+                        },
+                    },
+                }
+            }
+        },
+    }
+
+
+# What read_counts needs of a user from before the counters.
+LEGACY_COUNTS_PROJECTION = {"recipes.status": 1, "recipes.cookbook_key": 1}
+
+
+def read_counts(doc: dict | None) -> UserRecipeCounts:
+    """The counters of a user document, computed from its recipes if missing."""
+    if doc is None:
+        return UserRecipeCounts()
+    if COUNTS in doc:
+        return UserRecipeCounts(**doc[COUNTS])
+    return UserRecipeCounts.of(doc.get("recipes", []))
+
+
+def repair(db: Database, user_filter: dict | None = None) -> int:
+    """Recompute the counters of the matching users. Returns how many changed."""
+    # An update pipeline recomputes each user's counters atomically with
+    # respect to concurrent writes to its recipes.
+    result = db.users.update_many(
+        user_filter or {}, [{"$set": {COUNTS: counts_expr()}}]
+    )
+    return result.modified_count
+
+
+def main(args) -> None:
+    load_dotenv()
+    client = MongoClient(os.environ.get("COOKBOOKS_CONNECTION_STRING"))
+    db = client[os.environ.get("COOKBOOKS_DB_NAME")]
+    if args.repair:
+        user_filter = {"email": args.email} if args.email else None
+        print(f"Repaired the recipe counts of {repair(db, user_filter)} users")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Maintain the per-user recipe counters."
+    )
+    parser.add_argument(
+        "--repair",
+        action="store_true",
+        default=False,
+        help="Recompute the counters from each user's recipes.",
+    )
+    parser.add_argument("--email", type=str, help="Only repair this user.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_args())
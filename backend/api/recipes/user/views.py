@@ -2,106 +2,325 @@
 api/recipes/user - A small API for managing user recipes.
 """
 
+from collections.abc import Generator, Iterable, Iterator
 from datetime import datetime
+from typing import Any
 
 from bson import ObjectId
-from flask import abort, current_app, jsonify, request, url_for
+from flask import abort, current_app, request
 from flask_jwt_extended import get_jwt_identity, jwt_required
-from flask_pymongo import PyMongo
-from pymongo.collection import Collection, ReturnDocument
+from pydantic import ValidationError
+from pymongo import DESCENDING, UpdateOne
+from pymongo.collection import Collection
 
-from api.recipes.model import Recipe
-from api.users.model import UserRecipe, UserRecipeStatus
+from api.caching import weak_etag
+from api.db import mongo
+from api.metrics import timed
+from api.pagination import (
+    KeysetPage,
+    decode_after,
+    endpoint_href,
+    keyset_links,
+    last_page,
+    page_links,
+    seek_expr,
+)
+from api.recipes.user.counters import (
+    COUNTS,
+    LEGACY_COUNTS_PROJECTION,
+    pull_update,
+    push_update,
+    read_counts,
+    seed_update,
+    set_updates,
+)
+from api.recipes.views import BATCH_MAX_SIZE
+from api.serialize import ndjson_response, wants_ndjson
+from api.users.model import (
+    UserRecipe,
+    UserRecipeStatus,
+    is_counted_cookbook_key,
+)
+
+# Listing order of the embedded ``users.recipes`` array, newest first, and the
+# keyset for ``after=`` pagination.
+USER_RECIPE_SORT = [("created_at", DESCENDING), ("recipe_id", DESCENDING)]
+USER_RECIPE_SORT_TYPES = (datetime, ObjectId)
+
+# Reads and conditional pulls delete_user_recipe tries before giving up.
+DELETE_ATTEMPTS = 3
+
+
+def sorted_user_recipes(recipes) -> dict:
+    """Aggregation expression sorting a user's recipes array in listing order."""
+    return {"$sortArray": {"input": recipes, "sortBy": dict(USER_RECIPE_SORT)}}
+
+
+@timed("model")
+def user_recipe_json(raw: dict) -> dict:
+    return UserRecipe(**raw).to_json()
+
+
+def user_recipes_page_pipeline(
+    user_id: ObjectId, after_values: list | None, skip: int, limit: int
+) -> list[dict]:
+    """
+    Pipeline projecting a page of a user's recipes as `recipes`, and how many
+    they are as `total_recipes`.
+
+    The recipes are embedded in the user document, so the array is sorted and
+    sliced in place rather than $unwind-ing it into one document per recipe.
+    """
+    recipes = "$recipes"
+    if after_values is not None:
+        recipes = {
+            "$filter": {
+                "input": "$recipes",
+                "as": "recipe",
+                "cond": seek_expr(USER_RECIPE_SORT, after_values, "recipe"),
+            }
+        }
+    return [
+        {"$match": {"_id": user_id}},
+        {
+            "$project": {
+                "recipes": {"$slice": [sorted_user_recipes(recipes), skip, limit]},
+                # Counted for users whose counters haven't been repaired yet.
+                "total_recipes": {
+                    "$ifNull": [f"${COUNTS}.total", {"$size": "$recipes"}]
+                },
+            }
+        },
+    ]
+
+
+def created_user_recipe(recipe_id: ObjectId, recipe: dict | None) -> UserRecipe:
+    """A new, uncooked user recipe of the recipe ``recipe_id``, as found."""
+    if recipe is None or "cookbook_key" not in recipe:
+        abort(400, "cookbook_key not in recipe.")
+    if not is_counted_cookbook_key(recipe["cookbook_key"]):
+        abort(400, "cookbook_key of recipe is invalid.")
+    now = datetime.utcnow()
+    return UserRecipe(
+        created_at=now,
+        updated_at=now,
+        recipe_id=recipe_id,
+        cookbook_key=recipe["cookbook_key"],
+        status=UserRecipeStatus.uncooked,
+    )
+
+
+def updated_user_recipe(user_recipe: dict, raw: dict, update_dict: dict) -> UserRecipe:
+    """A user recipe as read before an update, with the update applied."""
+    for field in ("status", "rating", "note"):
+        if field in raw:
+            user_recipe[field] = raw[field]
+    user_recipe["updated_at"] = update_dict["recipes.$.updated_at"]
+    return UserRecipe(**user_recipe)
+
+
+def page_user_recipes(docs: Iterable[dict]) -> Iterator[dict]:
+    """The user recipes of a ``user_recipes_page_pipeline`` result."""
+    for doc in docs:
+        yield from doc.get("recipes", [])
+
+
+def user_recipes_total(docs: Iterable[dict]) -> int:
+    """How many recipes the user has, from a ``user_recipes_page_pipeline``."""
+    return sum(doc["total_recipes"] for doc in docs)
+
+
+# The user recipe writes below are generators of the operations they make on
+# the users collection, as ``(method, args, kwargs)``, each sent the result of
+# the last. ``run_steps`` applies them to a PyMongo collection, and
+# ``arun_steps`` to an async one, so the Flask and ASGI apps run one logic.
+Step = tuple[str, tuple, dict]
+Steps = Generator[Step, Any, Any]
+
+
+def run_steps(collection: Collection, steps: Steps):
+    """Apply ``steps`` to a PyMongo collection, and return what they return."""
+    try:
+        method, args, kwargs = next(steps)
+        while True:
+            result = getattr(collection, method)(*args, **kwargs)
+            method, args, kwargs = steps.send(result)
+    except StopIteration as stop:
+        return stop.value
+
+
+async def arun_steps(collection, steps: Steps):
+    """:func:`run_steps` on an ``AsyncCollection``."""
+    try:
+        method, args, kwargs = next(steps)
+        while True:
+            result = await getattr(collection, method)(*args, **kwargs)
+            method, args, kwargs = steps.send(result)
+    except StopIteration as stop:
+        return stop.value
+
+
+def user_recipe_counts(user_id: ObjectId) -> Steps:
+    """A user's recipe counters, read from the user document by ``_id``."""
+    doc = yield "find_one", ({"_id": user_id}, {COUNTS: 1}), {}
+    if doc is not None and COUNTS not in doc:
+        doc = yield "find_one", ({"_id": user_id}, LEGACY_COUNTS_PROJECTION), {}
+    return read_counts(doc)
+
+
+def counted_update(user_id: ObjectId, search_dict: dict, update) -> Steps:
+    """``update_one`` a counted write, seeding the user's counters if needed.
+
+    A user from before the counters has none, so the write matches nothing:
+    seed them, and retry it if they were seeded.
+    """
+    result = yield "update_one", (search_dict, update), {}
+    if result.matched_count == 0:
+        seed_dict, seed = seed_update(user_id)
+        if (yield "update_one", (seed_dict, seed), {}).matched_count:
+            result = yield "update_one", (search_dict, update), {}
+    return result
+
+
+def apply_first(updates: list[tuple[dict, dict]], **kwargs) -> Steps:
+    """``find_one_and_update`` each update in turn, until one matches."""
+    for search_dict, update in updates:
+        doc = yield "find_one_and_update", (search_dict, update), kwargs
+        if doc is not None:
+            return doc
+    return None
+
+
+def pull_user_recipe(user_id: ObjectId, recipe_id: ObjectId) -> Steps:
+    """
+    Remove a user recipe. Returns it as it was (or None if there is none), and
+    whether it was removed.
+
+    The recipe's status decides which counter to decrement: it is read again
+    and the pull retried if the status changes in between, up to
+    ``DELETE_ATTEMPTS`` times.
+    """
+    search_user = {"_id": user_id, "recipes.recipe_id": recipe_id}
+    user_recipe = None
+    for _ in range(DELETE_ATTEMPTS):
+        user = yield "find_one", (search_user, {"recipes.$": 1}), {}
+        if user is None or "recipes" not in user:
+            return None, False
+        user_recipe = user["recipes"][0]
+        search_dict, update = pull_update(user_id, user_recipe)
+        if (yield from counted_update(user_id, search_dict, update)).modified_count:
+            return user_recipe, True
+    return user_recipe, False
+
+
+def user_recipe_update(user_recipe_raw: dict) -> tuple[dict, str | None]:
+    """
+    Validate a user recipe update body.
+
+    Returns the positional ``$set`` of the requested fields, or an error
+    message if any is invalid or of the wrong type.
+    """
+    update_dict = {}
+    if "status" in user_recipe_raw:
+        status = user_recipe_raw["status"]
+        if not isinstance(status, str) or not UserRecipe.validate_status(status):
+            return {}, f"Status '{status}' is invalid"
+        update_dict["recipes.$.status"] = status
+    if "rating" in user_recipe_raw:
+        rating = user_recipe_raw["rating"]
+        if (
+            not isinstance(rating, int)
+            or isinstance(rating, bool)
+            or not UserRecipe.validate_rating(rating)
+        ):
+            return {}, f"Status '{rating}' is invalid"
+        update_dict["recipes.$.rating"] = rating
+    if "note" in user_recipe_raw:
+        note = user_recipe_raw["note"]
+        if not isinstance(note, str):
+            return {}, "Note is not a string"
+        if not UserRecipe.validate_note(note):
+            return {}, "Note is empty"
+        update_dict["recipes.$.note"] = note
+    if not update_dict:
+        return {}, "No updates requested"
+    update_dict["recipes.$.updated_at"] = datetime.utcnow()
+    return update_dict, None
 
 
 # @app.route("/recipes/user/count")
 @jwt_required()
 def user_recipes_count():
-    """GET the total count of a user's recipes."""
+    """
+    GET the total count of a user's recipes, and the `cooked`, `uncooked` and
+    per cookbook (`cookbooks`) counts.
+    """
     current_user_id = get_jwt_identity()
-    with current_app.app_context():
-        mongo = PyMongo(current_app)
-        recipes_count = mongo.db.users.aggregate(
-            [
-                {"$match": {"_id": ObjectId(current_user_id)}},
-                {"$project": {"total_recipes": {"$size": "$recipes"}}},
-            ]
-        )
+    recipe_counts = run_steps(
+        mongo.db.users, user_recipe_counts(ObjectId(current_user_id))
+    )
     return {
-        "count": recipes_count["total_recipes"],
+        "count": recipe_counts.total,
+        **recipe_counts.to_json(),
     }
 
 
 # @app.route("/recipes/user/")
+@weak_etag
 @jwt_required()
 def list_user_recipes():
     """
     GET a list of your user recipes.
 
-    The results are paginated using the `page` parameter.
+    The results are paginated using the `page` parameter, or with the `after`
+    token from a previous page's `next` link (see ``api.pagination``).
     """
     current_user_id = get_jwt_identity()
 
     page = int(request.args.get("page", 1))
+    after = request.args.get("after")
     per_page = 30  # A const value.
+    href = endpoint_href(".list_user_recipes")
     # cookbook_key = request.args.get("cookbook", None)
     # if cookbook_key is not None:
     #     search_dict["cookbook_key"] = cookbook_key
+
+    if after is not None:
+        after_values = decode_after(after, USER_RECIPE_SORT, USER_RECIPE_SORT_TYPES)
+        cursor = mongo.db.users.aggregate(
+            user_recipes_page_pipeline(
+                ObjectId(current_user_id), after_values, 0, per_page + 1
+            )
+        )
+        raws = KeysetPage(page_user_recipes(cursor), per_page, USER_RECIPE_SORT)
+        records = (user_recipe_json(raw) for raw in raws)
+
+        def links():
+            return keyset_links(href, after, raws.next_after())
+
+        if wants_ndjson():
+            return ndjson_response(records, links)
+        return {
+            "user_recipes": list(records),
+            "_links": links(),
+        }
+
     # For pagination, it's necessary to sort by name,
     # then skip the number of docs that earlier pages would have displayed,
     # and then to limit to the fixed page size, ``per_page``.
-    with current_app.app_context():
-        mongo = PyMongo(current_app)
-        cursor = (
-            mongo.db.users.aggregate(
-                [
-                    {"$match": {"_id": ObjectId(current_user_id)}},
-                    {"$unwind": "$recipes"},
-                    {"$sort": {"recipes.created_at": -1}},
-                    {"$limit": per_page * page},
-                    {"$skip": per_page * (page - 1)},
-                    {"$group": {"_id": "$_id", "recipes": {"$push": "$recipes"}}},
-                ]
+    docs = list(
+        mongo.db.users.aggregate(
+            user_recipes_page_pipeline(
+                ObjectId(current_user_id), None, per_page * (page - 1), per_page
             )
-            # .sort("key")
-            # .skip(per_page * (page - 1))
-            # .limit(per_page)
-        )
-        count_cursor = mongo.db.users.aggregate(
-            [
-                {"$match": {"_id": ObjectId(current_user_id)}},
-                {"$project": {"total_recipes": {"$size": "$recipes"}}},
-            ]
         )
-        for x in count_cursor:
-            recipes_count = x["total_recipes"]
-
-    links = {
-        "self": {"href": url_for(".list_user_recipes", page=page, _external=True)},
-        "last": {
-            "href": url_for(
-                ".list_user_recipes",
-                page=max(1, (recipes_count // per_page)),
-                _external=True,
-            )
-        },
-    }
-    # Add a 'prev' link if it's not on the first page:
-    if page > 1:
-        links["prev"] = {
-            "href": url_for(".list_user_recipes", page=page - 1, _external=True)
-        }
-    # Add a 'next' link if it's not on the last page:
-    if page < recipes_count // per_page:
-        links["next"] = {
-            "href": url_for(".list_user_recipes", page=page + 1, _external=True)
-        }
+    )
+    links = page_links(href, page, last_page(user_recipes_total(docs), per_page))
+    records = (user_recipe_json(raw) for raw in page_user_recipes(docs))
+    if wants_ndjson():
+        return ndjson_response(records, lambda: links)
     return {
-        "user_recipes": [
-            UserRecipe(**raw).to_json()
-            for doc in cursor
-            for raw in doc.get("recipes", [])
-        ],
+        "user_recipes": list(records),
         "_links": links,
     }
 
@@ -115,33 +334,29 @@ def new_user_recipe():
 
     if "status" in raw_user_recipe:
         if not UserRecipe.validate_status(raw_user_recipe["status"]):
-            return f"Status '{raw_user_recipe["status"]}' is invalid", 400
+            return f"Status '{raw_user_recipe['status']}' is invalid", 400
     if "rating" in raw_user_recipe:
         if not UserRecipe.validate_rating(raw_user_recipe["rating"]):
-            return f"Status '{raw_user_recipe["rating"]}' is invalid", 400
+            return f"Status '{raw_user_recipe['rating']}' is invalid", 400
     if "note" in raw_user_recipe:
         if not UserRecipe.validate_note(raw_user_recipe["note"]):
             return "Note is empty", 400
 
     raw_user_recipe["created_at"] = now
     raw_user_recipe["updated_at"] = now
+    raw_user_recipe.setdefault("status", UserRecipeStatus.uncooked)
+    if ObjectId.is_valid(raw_user_recipe.get("recipe_id")):
+        raw_user_recipe["recipe_id"] = ObjectId(raw_user_recipe["recipe_id"])
     # Validate fields exist.
     user_recipe = UserRecipe(**raw_user_recipe)
-    search_dict = {
-        "_id": ObjectId(current_user_id),
-        "recipes.$.recipe_id": ObjectId(user_recipe.recipe_id),
-    }
-    with current_app.app_context():
-        mongo = PyMongo(current_app)
-        user_coll: MongoCollection[User] = mongo.db.users
-        if user_coll.find_one(search_dict) is not None:
-            abort(400, "User Recipe already exists.")
-        insert_result = user_coll.find_one_and_update(
-            {"_id": ObjectId(current_user_id)},
-            {"$push": {"recipes": user_recipe.to_bson()}},
-        )
-        insert_result = user_coll.insert_one(user_recipe.to_bson())
-    user_recipe.id = ObjectId(str(insert_result.inserted_id))
+    if not is_counted_cookbook_key(user_recipe.cookbook_key):
+        return f"cookbook_key '{user_recipe.cookbook_key}' is invalid", 400
+    # The push and the counters only apply if the recipe isn't there yet.
+    user_id = ObjectId(current_user_id)
+    search_dict, update = push_update(user_id, user_recipe.to_bson())
+    result = run_steps(mongo.db.users, counted_update(user_id, search_dict, update))
+    if result.matched_count == 0:
+        abort(400, "User Recipe already exists.")
     return user_recipe.to_json()
 
 
@@ -153,28 +368,20 @@ def get_or_create_user_recipe(recipe_id):
         "_id": ObjectId(current_user_id),
         "recipes": {"$elemMatch": {"recipe_id": ObjectId(recipe_id)}},
     }
-    with current_app.app_context():
-        mongo = PyMongo(current_app)
-        user_recipe_cursor = mongo.db.users.find_one(search_user, {"recipes.$": 1})
-        if user_recipe_cursor is not None:
-            return UserRecipe(**user_recipe_cursor["recipes"][0]).to_json(), 200
-        recipe = mongo.db.recipes.find_one({"_id": ObjectId(recipe_id)})
-        if "cookbook_key" not in recipe:
-            abort(400, "cookbook_key not in recipe.")
-        cookbook_key = recipe["cookbook_key"]
-        user_recipe = {}
-        now = datetime.utcnow()
-        user_recipe["created_at"] = now
-        user_recipe["updated_at"] = now
-        user_recipe["recipe_id"] = ObjectId(recipe_id)
-        user_recipe["cookbook_key"] = cookbook_key
-        user_recipe["status"] = UserRecipeStatus.uncooked
-        user_recipe = UserRecipe(**user_recipe)
-        insert_result = mongo.db.users.find_one_and_update(
-            {"_id": ObjectId(current_user_id)},
-            {"$push": {"recipes": user_recipe.to_bson()}},
-        )
-        return user_recipe.to_json(), 201
+    user_recipe_cursor = mongo.db.users.find_one(search_user, {"recipes.$": 1})
+    if user_recipe_cursor is not None:
+        return UserRecipe(**user_recipe_cursor["recipes"][0]).to_json(), 200
+    recipe = mongo.db.recipes.find_one({"_id": ObjectId(recipe_id)})
+    user_recipe = created_user_recipe(ObjectId(recipe_id), recipe)
+    user_id = ObjectId(current_user_id)
+    search_dict, update = push_update(user_id, user_recipe.to_bson())
+    result = run_steps(mongo.db.users, counted_update(user_id, search_dict, update))
+    if result.matched_count == 0:
+        # Created by a concurrent request since it was looked up.
+        existing = mongo.db.users.find_one(search_user, {"recipes.$": 1})
+        if existing is not None:
+            return UserRecipe(**existing["recipes"][0]).to_json(), 200
+    return user_recipe.to_json(), 201
 
 
 # @app.route("/recipes/user/<string:recipe_id>", methods=["PUT"])
@@ -184,63 +391,126 @@ def update_user_recipe(recipe_id):
     current_user_id = get_jwt_identity()
 
     user_recipe_raw = request.get_json()
-    update_dict = {}
-    if "status" in user_recipe_raw:
-        if not UserRecipe.validate_status(user_recipe_raw["status"]):
-            return f"Status '{user_recipe_raw["status"]}' is invalid", 400
-        update_dict["recipes.$.status"] = user_recipe_raw["status"]
-    if "rating" in user_recipe_raw:
-        if not UserRecipe.validate_rating(user_recipe_raw["rating"]):
-            return f"Status '{user_recipe_raw["rating"]}' is invalid", 400
-        update_dict["recipes.$.rating"] = user_recipe_raw["rating"]
-    if "note" in user_recipe_raw:
-        if not UserRecipe.validate_note(user_recipe_raw["note"]):
-            return "Note is empty", 400
-        update_dict["recipes.$.note"] = user_recipe_raw["note"]
-    if not update_dict:
-        return "No updates requested", 400
-    update_dict["recipes.$.updated_at"] = datetime.utcnow()
+    update_dict, error = user_recipe_update(user_recipe_raw)
+    if error is not None:
+        return error, 400
 
-    with current_app.app_context():
-        mongo = PyMongo(current_app)
-        original_user = mongo.db.users.find_one_and_update(
-            {
-                "_id": ObjectId(current_user_id),
-                "recipes.recipe_id": ObjectId(recipe_id),
-            },
-            {"$set": update_dict},
-            {"recipes.$": 1},
-            # return_document=ReturnDocument.AFTER,
-        )
+    original_user = run_steps(
+        mongo.db.users,
+        apply_first(
+            set_updates(ObjectId(current_user_id), ObjectId(recipe_id), update_dict),
+            projection={"recipes.$": 1},
+        ),
+    )
     if original_user:
-        original_user_recipe = original_user["recipes"][0]
-        if "status" in user_recipe_raw:
-            original_user_recipe["status"] = user_recipe_raw["status"]
-        if "rating" in user_recipe_raw:
-            original_user_recipe["rating"] = user_recipe_raw["rating"]
-        if "note" in user_recipe_raw:
-            original_user_recipe["note"] = user_recipe_raw["note"]
-        original_user_recipe["updated_at"] = update_dict["recipes.$.updated_at"]
-        return UserRecipe(**original_user_recipe).to_json()
+        user_recipe = original_user["recipes"][0]
+        return updated_user_recipe(user_recipe, user_recipe_raw, update_dict).to_json()
     else:
         abort(404, "User Recipe not found")
 
 
-# @app.route("/recipes/user/<string:recipe_id>", methods=["DELETE"])
+# @app.route("/recipes/user/batch", methods=["POST"])
 @jwt_required()
-def delete_user_recipe(recipe_id):
+def batch_update_user_recipes():
+    """
+    POST a JSON body of `{"updates": [{"recipe_id": ..., "status": ...}]}` to
+    update several user recipes at once.
+
+    Each update is validated like `update_user_recipe`, and the valid ones are
+    applied with a single `bulk_write`. Each gets a result in request order,
+    with its own `code`: 200 and the updated `user_recipe`, 400 or 404.
+    """
     current_user_id = get_jwt_identity()
-    with current_app.app_context():
-        mongo = PyMongo(current_app)
-        deleted_user_recipe = mongo.db.users.find_one_and_update(
+    data = request.get_json(silent=True) or {}
+    updates = data.get("updates")
+    if not isinstance(updates, list):
+        abort(400, "Missing 'updates' list")
+    max_size = int(current_app.config.get("BATCH_MAX_SIZE", BATCH_MAX_SIZE))
+    if len(updates) > max_size:
+        abort(400, f"At most {max_size} updates per batch")
+
+    # (recipe_id as sent, parsed recipe_id, $set, error) per update.
+    parsed = []
+    for update in updates:
+        raw_recipe_id = update.get("recipe_id") if isinstance(update, dict) else None
+        if not (isinstance(raw_recipe_id, str) and ObjectId.is_valid(raw_recipe_id)):
+            parsed.append((raw_recipe_id, None, {}, "Invalid recipe_id"))
+            continue
+        update_dict, error = user_recipe_update(update)
+        parsed.append((raw_recipe_id, ObjectId(raw_recipe_id), update_dict, error))
+
+    # The user's current entries for these recipes, to tell which exist and to
+    # build the results without reading them back after the write.
+    user_id = ObjectId(current_user_id)
+    recipe_ids = list({recipe_id for _, recipe_id, _, error in parsed if not error})
+    cursor = mongo.db.users.aggregate(
+        [
+            {"$match": {"_id": user_id}},
             {
-                "_id": ObjectId(current_user_id),
-                "recipes.recipe_id": ObjectId(recipe_id),
+                "$project": {
+                    "_id": 0,
+                    "recipes": {
+                        "$filter": {
+                            "input": "$recipes",
+                            "as": "recipe",
+                            "cond": {"$in": ["$$recipe.recipe_id", recipe_ids]},
+                        }
+                    },
+                }
             },
-            {"$pull": {"recipes": {"recipe_id": ObjectId(recipe_id)}}},
-            {"recipes.$": 1},
+        ]
+    )
+    current = {raw["recipe_id"]: raw for doc in cursor for raw in doc["recipes"]}
+
+    operations = []
+    results = []
+    for raw_recipe_id, recipe_id, update_dict, error in parsed:
+        if error is not None:
+            results.append({"recipe_id": raw_recipe_id, "code": 400, "error": error})
+            continue
+        if recipe_id not in current:
+            results.append(
+                {
+                    "recipe_id": raw_recipe_id,
+                    "code": 404,
+                    "error": "User Recipe not found",
+                }
+            )
+            continue
+        user_recipe = dict(current[recipe_id])
+        for key, value in update_dict.items():
+            user_recipe[key.removeprefix("recipes.$.")] = value
+        try:
+            updated = UserRecipe(**user_recipe)
+        except ValidationError:
+            results.append(
+                {"recipe_id": raw_recipe_id, "code": 400, "error": "Invalid update"}
+            )
+            continue
+        current[recipe_id] = user_recipe
+        # In order: a status change only moves the counters if the status
+        # differs, then the $set applies whatever it was.
+        operations.extend(
+            UpdateOne(search_dict, update)
+            for search_dict, update in set_updates(user_id, recipe_id, update_dict)
         )
-    if deleted_user_recipe and "recipes" in deleted_user_recipe:
-        return UserRecipe(**deleted_user_recipe["recipes"][0]).to_json()
-    else:
+        results.append(
+            {"recipe_id": raw_recipe_id, "code": 200, "user_recipe": updated.to_json()}
+        )
+    if operations:
+        mongo.db.users.bulk_write(operations)
+    return {"user_recipes": results}
+
+
+# @app.route("/recipes/user/<string:recipe_id>", methods=["DELETE"])
+@jwt_required()
+def delete_user_recipe(recipe_id):
+    current_user_id = get_jwt_identity()
+    user_recipe, deleted = run_steps(
+        mongo.db.users, pull_user_recipe(ObjectId(current_user_id), ObjectId(recipe_id))
+    )
+    if user_recipe is None:
         abort(404, "User Recipe not found")
+    if not deleted:
+        abort(409, "User Recipe changed while deleting it, try again")
+    return UserRecipe(**user_recipe).to_json()
@@ -2,186 +2,474 @@
 api/recipes - A small API for managing recipes.
 """
 
+import itertools
+from collections.abc import Iterable
 from datetime import datetime
 
 from bson import ObjectId
-from flask import abort, current_app, jsonify, request, url_for
+from flask import abort, current_app, jsonify, request
 from flask_jwt_extended import get_jwt_identity, jwt_required
-from flask_pymongo import PyMongo
+from pymongo import ASCENDING
 from pymongo.collection import ReturnDocument
 
-from api.recipes.model import Recipe
-from api.users.model import UserRecipe
+from api.caching import conditional_document, find_one_raw, weak_etag
+from api.counts import counts
+from api.db import mongo
+from api.ingredients import bits, ingredient_index
+from api.metrics import timed
+from api.pagination import (
+    KeysetPage,
+    decode_after,
+    endpoint_href,
+    keyset_links,
+    last_page,
+    page_links,
+    seek_filter,
+)
+from api.recipes.model import RECIPE_CARD_PROJECTION, Recipe, RecipeCard
+from api.sampling import RANDOM_KEY, random_key, sample
+from api.serialize import ndjson_response, wants_ndjson
+from api.users.model import UserRecipe, UserRecipeStatus
+
+# Listing order, and the keyset for ``after=`` pagination. Ends in ``_id`` so
+# that it is unique.
+RECIPE_SORT = [
+    ("cookbook_key", ASCENDING),
+    ("page_number", ASCENDING),
+    ("_id", ASCENDING),
+]
+RECIPE_SORT_TYPES = (str, int, ObjectId)
+
+# The most ids or updates a batch request may hold, unless configured with
+# ``BATCH_MAX_SIZE`` (``COOKBOOKS_`` env prefix).
+BATCH_MAX_SIZE = 100
+
+# Relevance order of search results, best first. Ties keep a stable order.
+SEARCH_SORT = {"score": {"$meta": "textScore"}, "_id": ASCENDING}
+# Search results per request, by default and at most.
+SEARCH_LIMIT = 30
+SEARCH_MAX_LIMIT = 100
+# The most missing ingredients recipes_with_ingredients may allow.
+MAX_MISSING = 5
 
 
 # @app.route("/recipes/count")
+@jwt_required(optional=True)
 def recipes_count():
     """GET the total count of queried recipes."""
-    query = request.args.get("query", "")
-    search_dict = {}
-    if query:
-        search_dict["$text"] = {"$search": query}
-    with current_app.app_context():
-        mongo = PyMongo(current_app)
-        recipes_count = mongo.db.recipes.count_documents(search_dict)
+    search_dict = recipes_filter(
+        request.args.get("cookbook", ""),
+        request.args.get("query", ""),
+        request.args.get("status", ""),
+        get_jwt_identity(),
+    )
+    recipes_count = count_recipes(search_dict)
     return {
         "count": recipes_count,
     }
 
 
+def user_recipe_lookup(user_id: ObjectId) -> list[dict]:
+    """
+    Pipeline stages joining the user's entry for each recipe as `user_recipe`.
+
+    The recipes in the pipeline (a page, at most a hundred) are grouped into
+    one document, so that the user is read, and its recipes array filtered down
+    to theirs, once per page rather than once per recipe. Each recipe then only
+    looks through those entries. The recipes keep their order.
+    """
+    return [
+        {"$group": {"_id": None, "recipes": {"$push": "$$ROOT"}}},
+        {
+            "$lookup": {
+                "from": "users",
+                "let": {"recipe_ids": "$recipes._id"},
+                "pipeline": [
+                    {"$match": {"_id": user_id}},
+                    {
+                        "$project": {
+                            "_id": 0,
+                            "recipes": {
+                                "$filter": {
+                                    "input": "$recipes",
+                                    "as": "recipe",
+                                    "cond": {
+                                        "$in": ["$$recipe.recipe_id", "$$recipe_ids"]
+                                    },
+                                }
+                            },
+                        }
+                    },
+                ],
+                "as": "user",
+            }
+        },
+        {"$set": {"user_recipes": {"$ifNull": [{"$first": "$user.recipes"}, []]}}},
+        {"$unwind": "$recipes"},
+        {
+            "$set": {
+                "recipes.user_recipe": {
+                    "$ifNull": [
+                        {
+                            "$first": {
+                                "$filter": {
+                                    "input": "$user_recipes",
+                                    "as": "user_recipe",
+                                    "cond": {
+                                        "$eq": [
+                                            "$$user_recipe.recipe_id",
+                                            "$recipes._id",
+                                        ]
+                                    },
+                                }
+                            }
+                        },
+                        "$$REMOVE",
+                    ]
+                }
+            }
+        },
+        {"$replaceRoot": {"newRoot": "$recipes"}},
+    ]
+
+
+def cooked_recipe_ids_pipeline(user_id: ObjectId) -> list[dict]:
+    """Pipeline on users projecting a user's cooked recipe ids as `recipe_ids`."""
+    return [
+        {"$match": {"_id": user_id}},
+        {
+            "$project": {
+                "_id": 0,
+                "recipe_ids": {
+                    "$map": {
+                        "input": {
+                            "$filter": {
+                                "input": "$recipes",
+                                "as": "recipe",
+                                "cond": {
+                                    "$eq": [
+                                        "$$recipe.status",
+                                        UserRecipeStatus.cooked.value,
+                                    ]
+                                },
+                            }
+                        },
+                        "as": "recipe",
+                        "in": "$$recipe.recipe_id",
+                    }
+                },
+            }
+        },
+    ]
+
+
+def cooked_recipe_ids(user_id: ObjectId) -> list[ObjectId]:
+    """The ids of the recipes a user has marked as cooked."""
+    return cooked_ids_of(mongo.db.users.aggregate(cooked_recipe_ids_pipeline(user_id)))
+
+
+def cooked_ids_of(docs: Iterable[dict]) -> list[ObjectId]:
+    """The recipe ids of a ``cooked_recipe_ids_pipeline`` result."""
+    return [recipe_id for doc in docs for recipe_id in doc.get("recipe_ids", [])]
+
+
+def filters_on_status(user_status: str) -> bool:
+    """Whether the `status` parameter needs the user's cooked recipe ids."""
+    return user_status in (UserRecipeStatus.cooked, UserRecipeStatus.uncooked)
+
+
+def recipes_search_dict(
+    cookbook_key: str, query: str, user_status: str, cooked_ids: list[ObjectId]
+) -> dict:
+    """The recipes query for the `cookbook`, `query` and `status` parameters."""
+    search_dict = {}
+    if query:
+        search_dict["$text"] = {"$search": query}
+    if cookbook_key:
+        search_dict["cookbook_key"] = cookbook_key
+    # Recipes without a user recipe count as uncooked, so both statuses filter
+    # on the (usually much smaller) set of cooked recipe ids.
+    if user_status == UserRecipeStatus.cooked:
+        search_dict["_id"] = {"$in": cooked_ids}
+    elif user_status == UserRecipeStatus.uncooked and cooked_ids:
+        search_dict["_id"] = {"$nin": cooked_ids}
+    return search_dict
+
+
+def recipes_filter(
+    cookbook_key: str, query: str, user_status: str, current_user_id: str | None
+) -> dict:
+    cooked_ids = []
+    if filters_on_status(user_status) and current_user_id is not None:
+        cooked_ids = cooked_recipe_ids(ObjectId(current_user_id))
+    return recipes_search_dict(cookbook_key, query, user_status, cooked_ids)
+
+
+def recipes_page_pipeline(
+    search_dict: dict, skip: int, limit: int, user_id: ObjectId | None
+) -> list[dict]:
+    """Pipeline for a page of recipe cards, joined with the user's recipes."""
+    search_agg = [{"$match": search_dict}, {"$sort": dict(RECIPE_SORT)}]
+    if skip:
+        search_agg.append({"$skip": skip})
+    search_agg.append({"$limit": limit})
+    search_agg.append({"$project": RECIPE_CARD_PROJECTION})
+    if user_id is not None:
+        search_agg.extend(user_recipe_lookup(user_id))
+    return search_agg
+
+
+def search_pipeline(
+    search_dict: dict, limit: int, user_id: ObjectId | None
+) -> list[dict]:
+    """Pipeline for the top `limit` recipe cards matching a `$text` search."""
+    search_agg = [
+        {"$match": search_dict},
+        # A sort followed by a limit only keeps the best `limit` matches in
+        # memory, rather than sorting them all.
+        {"$sort": SEARCH_SORT},
+        {"$limit": limit},
+        {"$project": {**RECIPE_CARD_PROJECTION, "score": {"$meta": "textScore"}}},
+    ]
+    if user_id is not None:
+        search_agg.extend(user_recipe_lookup(user_id))
+    return search_agg
+
+
+def count_recipes(search_dict: dict) -> int:
+    if not is_count_cached(search_dict):
+        return mongo.db.recipes.count_documents(search_dict)
+    return counts.count(mongo.db.recipes, search_dict)
+
+
+def is_count_cached(search_dict: dict) -> bool:
+    """Whether to count the recipes of ``search_dict`` with ``api.counts``."""
+    # Status filters depend on the user's recipes, which don't invalidate the
+    # recipes count cache.
+    return "_id" not in search_dict
+
+
+@timed("model")
+def recipe_card_json(doc: dict, model: type[Recipe | RecipeCard] = RecipeCard) -> dict:
+    """JSON for a (card-projected) recipe, with its joined `user_recipe` if any."""
+    raw_user_recipe = doc.pop("user_recipe", None)
+    recipe = model(**doc).to_json()
+    if raw_user_recipe is not None:
+        recipe["user_recipe"] = UserRecipe(**raw_user_recipe).to_json()
+    return recipe
+
+
 # @app.route("/recipes/random/<int:count>", methods=["GET"])
 @jwt_required(optional=True)
 def get_n_random_recipes(count):
     """
-    GET n random recipes.
+    GET n random recipes, at most ``api.sampling.MAX_SAMPLE``.
 
-    The results are paginated using the `page` parameter.
+    The recipes are drawn from the random key index (see ``api.sampling``),
+    optionally from one `cookbook` or those matching a `query`.
     """
-    # cookbook_key = request.args.get("cookbook", None)
-    # query = request.args.get("query", "")
-    search_dict = {"$sample": {"size": int(count)}}
-    with current_app.app_context():
-        mongo = PyMongo(current_app)
-        cursor = mongo.db.recipes.aggregate([search_dict])
-    recipes = [Recipe(**doc).to_json() for doc in cursor]
-    for recipe in recipes:
-        if "instructions" in recipe:
-            del recipe["instructions"]
-        if "note" in recipe:
-            del recipe["note"]
+    search_dict = recipes_search_dict(
+        request.args.get("cookbook", ""), request.args.get("query", ""), "", []
+    )
+    stages = [{"$project": RECIPE_CARD_PROJECTION}]
     current_user_id = get_jwt_identity()
-    if current_user_id is None:
-        return {"recipes": recipes}
-
-    with current_app.app_context():
-        mongo = PyMongo(current_app)
-        ids = [ObjectId(recipe["_id"]) for recipe in recipes]
-        print(ids)
-        search_agg = []
-        search_agg.append({"$match": {"_id": ObjectId(current_user_id)}})
-        search_agg.append({"$unwind": "$recipes"})
-        # search_agg.append({"recipes": {"$elemMatch": {"recipe_id": ids}}})
-        search_agg.append({"$group": {"_id": "$_id", "recipes": {"$push": "$recipes"}}})
-        search_agg.append(
-            {
-                "$project": {
-                    "recipes": {
-                        "$filter": {
-                            "input": "$recipes",
-                            "as": "recipe",
-                            "cond": {"$in": ["$$recipe.recipe_id", ids]},
-                        }
-                    }
-                }
-            }
-        )
-        cursor = mongo.db.users.aggregate(search_agg)
-        user_recipe_map = {}
-        for doc in cursor:
-            for raw in doc.get("recipes", []):
-                raw["recipe_id"] = ObjectId(raw["recipe_id"])
-                user_recipe = UserRecipe(**raw)
-                user_recipe_map[str(user_recipe.recipe_id)] = user_recipe
-        for i in range(len(recipes)):
-            if recipes[i]["_id"] in user_recipe_map:
-                recipes[i]["user_recipe"] = user_recipe_map[recipes[i]["_id"]].to_json()
-        return {"recipes": recipes}
+    if current_user_id is not None:
+        stages.extend(user_recipe_lookup(ObjectId(current_user_id)))
+    docs = sample(mongo.db.recipes, search_dict, int(count), stages)
+    records = (recipe_card_json(doc) for doc in docs)
+    if wants_ndjson():
+        return ndjson_response(records)
+    return {"recipes": list(records)}
 
 
 # @app.route("/api/recipes/")
+@weak_etag
 @jwt_required(optional=True)
 def list_recipes():
     """
     GET a list of recipes.
 
-    The results are paginated using the `page` parameter.
+    The results are paginated using the `page` parameter, or with the `after`
+    token from a previous page's `next` link (see ``api.pagination``).
     """
     page = int(request.args.get("page", 1))
+    after = request.args.get("after")
     per_page = 30  # A const value.
     cookbook_key = request.args.get("cookbook", "")
     query = request.args.get("query", "")
     user_status = request.args.get("status", "")
+    current_user_id = get_jwt_identity()
 
-    # For pagination, it's necessary to sort by name,
-    # then skip the number of docs that earlier pages would have displayed,
-    # and then to limit to the fixed page size, ``per_page``.
-    with current_app.app_context():
-        mongo = PyMongo(current_app)
-        search_dict = {}
-        if query:
-            search_dict["$text"] = {"$search": query}
-        if cookbook_key:
-            search_dict["cookbook_key"] = cookbook_key
-        cursor = (
-            mongo.db.recipes.find(search_dict)
-            .sort("key")
-            .skip(per_page * (page - 1))
-            .limit(per_page)
+    search_dict = recipes_filter(cookbook_key, query, user_status, current_user_id)
+    filters = {"cookbook": cookbook_key, "query": query, "status": user_status}
+    href = endpoint_href(".list_recipes")
+    user_id = ObjectId(current_user_id) if current_user_id is not None else None
+    if after is not None:
+        # Seek past the previous page on the sort key, and fetch one extra
+        # document to know whether there is a next page.
+        after_values = decode_after(after, RECIPE_SORT, RECIPE_SORT_TYPES)
+        if after_values is not None:
+            search_dict.update(seek_filter(RECIPE_SORT, after_values))
+        search_agg = recipes_page_pipeline(search_dict, 0, per_page + 1, user_id)
+    else:
+        # For pagination, it's necessary to sort by name,
+        # then skip the number of docs that earlier pages would have displayed,
+        # and then to limit to the fixed page size, ``per_page``.
+        search_agg = recipes_page_pipeline(
+            search_dict, per_page * (page - 1), per_page, user_id
         )
-        recipes_count = mongo.db.recipes.count_documents(search_dict)
-    links = {
-        "self": {"href": url_for(".list_recipes", page=page, _external=True)},
-        "last": {
-            "href": url_for(
-                ".list_recipes", page=(recipes_count // per_page) + 1, _external=True
-            )
-        },
+    cursor = mongo.db.recipes.aggregate(search_agg)
+
+    if after is not None:
+        docs = KeysetPage(cursor, per_page, RECIPE_SORT)
+
+        def links():
+            return keyset_links(href, after, docs.next_after(), **filters)
+
+    else:
+        docs = cursor
+        last = last_page(count_recipes(search_dict), per_page)
+
+        def links():
+            return page_links(href, page, last, **filters)
+
+    records = (recipe_card_json(doc) for doc in docs)
+    if wants_ndjson():
+        return ndjson_response(records, links)
+    return {
+        "recipes": list(records),
+        "_links": links(),
     }
-    # Add a 'prev' link if it's not on the first page:
-    if page > 1:
-        links["prev"] = {
-            "href": url_for(".list_recipes", page=page - 1, _external=True)
-        }
-    # Add a 'next' link if it's not on the last page:
-    if page - 1 < recipes_count // per_page:
-        links["next"] = {
-            "href": url_for(".list_recipes", page=page + 1, _external=True)
-        }
-    recipes = [Recipe(**doc).to_json() for doc in cursor]
+
+
+# @app.route("/recipes/search")
+@jwt_required(optional=True)
+def search_recipes():
+    """
+    GET the recipes most relevant to a `query`, best first.
+
+    Matches are ranked by MongoDB's text score over the dish name, ingredients
+    and instructions, weighted in that order (see ``api.indexes``), and each
+    recipe has its `score`. Only the top `limit` are returned, and unlike
+    `list_recipes` the matches aren't counted. `cookbook` and `status` filter
+    as in `list_recipes`.
+    """
+    query = request.args.get("query", "")
+    limit = search_limit(query, request.args.get("limit"))
     current_user_id = get_jwt_identity()
-    if current_user_id is not None:
-        with current_app.app_context():
-            mongo = PyMongo(current_app)
-            ids = [recipe["_id"] for recipe in recipes]
-            search_agg = []
-            search_agg.append({"$match": {"_id": ObjectId(current_user_id)}})
-            search_agg.append({"$unwind": "$recipes"})
-            search_agg.append(
-                {"$group": {"_id": "$_id", "recipes": {"$push": "$recipes"}}}
+    search_dict = recipes_filter(
+        request.args.get("cookbook", ""),
+        query,
+        request.args.get("status", ""),
+        current_user_id,
+    )
+    user_id = ObjectId(current_user_id) if current_user_id is not None else None
+    docs = mongo.db.recipes.aggregate(search_pipeline(search_dict, limit, user_id))
+    records = (search_result_json(doc) for doc in docs)
+    if wants_ndjson():
+        return ndjson_response(records)
+    return {"recipes": list(records)}
+
+
+def search_limit(query: str, raw_limit: str | None) -> int:
+    """Validate a search's `query` and `limit` parameters. Returns the limit."""
+    if not query.strip():
+        abort(400, "Missing 'query'")
+    return results_limit(raw_limit)
+
+
+def results_limit(raw_limit: str | None) -> int:
+    try:
+        limit = int(raw_limit) if raw_limit is not None else SEARCH_LIMIT
+    except ValueError:
+        abort(400, "'limit' must be an integer")
+    if not 0 < limit <= SEARCH_MAX_LIMIT:
+        abort(400, f"'limit' must be between 1 and {SEARCH_MAX_LIMIT}")
+    return limit
+
+
+def search_result_json(doc: dict) -> dict:
+    score = doc.pop("score")
+    return {**recipe_card_json(doc), "score": score}
+
+
+# @app.route("/recipes/ingredients")
+@jwt_required(optional=True)
+def recipes_with_ingredients():
+    """
+    GET the recipes that can be made with the `have` ingredients.
+
+    `have` is repeated or comma separated. Recipes using at least one of them
+    and missing at most `missing` (default 0) other ingredients are listed,
+    fewest missing first, each with the names it is `missing`. Staples like
+    salt and oil count as had (see ``api.ingredients``). `cookbook` and
+    `status` filter as in `list_recipes`. `counts` holds how many recipes
+    miss 0, 1, ... ingredients, and the top `limit` are returned.
+    """
+    have = [
+        item.strip()
+        for value in request.args.getlist("have")
+        for item in value.split(",")
+        if item.strip()
+    ]
+    if not have:
+        abort(400, "Missing 'have'")
+    try:
+        max_missing = int(request.args.get("missing", 0))
+    except ValueError:
+        abort(400, "'missing' must be an integer")
+    if not 0 <= max_missing <= MAX_MISSING:
+        abort(400, f"'missing' must be between 0 and {MAX_MISSING}")
+    limit = results_limit(request.args.get("limit"))
+    user_status = request.args.get("status", "")
+    current_user_id = get_jwt_identity()
+    user_id = ObjectId(current_user_id) if current_user_id is not None else None
+
+    index = ingredient_index.get(mongo.db.recipes, RECIPE_SORT)
+    if index is None:
+        return (
+            jsonify({"msg": "The ingredient index is being built, try again"}),
+            503,
+            {"Retry-After": "5"},
+        )
+    # As recipes_search_dict: recipes without a user recipe count as uncooked.
+    only_ids, excluded_ids = None, []
+    if filters_on_status(user_status) and user_id is not None:
+        cooked_ids = cooked_recipe_ids(user_id)
+        if user_status == UserRecipeStatus.cooked:
+            only_ids = cooked_ids
+        else:
+            excluded_ids = cooked_ids
+    elif user_status == UserRecipeStatus.cooked:
+        only_ids = []
+    mask = index.mask(request.args.get("cookbook", ""), only_ids, excluded_ids)
+    covered = index.covered(have)
+    by_missing = index.missing(covered, max_missing, mask)
+    numbers = list(
+        itertools.islice(itertools.chain.from_iterable(map(bits, by_missing)), limit)
+    )
+
+    search_agg = [
+        {"$match": {"_id": {"$in": [index.ids[number] for number in numbers]}}},
+        {"$project": RECIPE_CARD_PROJECTION},
+    ]
+    if user_id is not None:
+        search_agg.extend(user_recipe_lookup(user_id))
+    docs = {doc["_id"]: doc for doc in mongo.db.recipes.aggregate(search_agg)}
+    recipes = []
+    for number in numbers:
+        # Deleted since the index was built.
+        doc = docs.get(index.ids[number])
+        if doc is not None:
+            recipes.append(
+                {
+                    **recipe_card_json(doc),
+                    "missing": index.missing_terms(number, covered),
+                }
             )
-            cursor = mongo.db.users.aggregate(search_agg)
-            user_recipe_map = {}
-            for doc in cursor:
-                for raw in doc.get("recipes", []):
-                    raw["recipe_id"] = ObjectId(raw["recipe_id"])
-                    user_recipe = UserRecipe(**raw)
-                    user_recipe_map[str(user_recipe.recipe_id)] = user_recipe
-            for i in range(len(recipes)):
-                if recipes[i]["_id"] in user_recipe_map:
-                    recipes[i]["user_recipe"] = user_recipe_map[
-                        recipes[i]["_id"]
-                    ].to_json()
-
-    for recipe in recipes:
-        del recipe["instructions"]
-        if "note" in recipe:
-            del recipe["note"]
-    if user_status == "cooked!":
-        recipes = [
-            recipe
-            for recipe in recipes
-            if "user_recipe" in recipe and recipe["user_recipe"]["status"] == "cooked!"
-        ]
-    elif user_status == "uncooked":
-        recipes = [
-            recipe
-            for recipe in recipes
-            if "user_recipe" not in recipe
-            or recipe["user_recipe"]["status"] == "uncooked"
-        ]
     return {
         "recipes": recipes,
-        "_links": links,
+        "counts": [bitset.bit_count() for bitset in by_missing],
     }
 
 
@@ -190,10 +478,12 @@ def new_recipe():
     raw_recipe = request.get_json()
     raw_recipe["date_added"] = datetime.utcnow()
     # Validate key, name, author fields exist.
-    recipe = recipe(**raw_recipe)
-    with current_app.app_context():
-        mongo = PyMongo(current_app)
-        insert_result = mongo.db.recipes.insert_one(recipe.to_bson())
+    recipe = Recipe(**raw_recipe)
+    insert_result = mongo.db.recipes.insert_one(
+        {**recipe.to_bson(), RANDOM_KEY: random_key()}
+    )
+    counts.invalidate(mongo.db.recipes)
+    ingredient_index.invalidate()
     recipe.id = ObjectId(str(insert_result.inserted_id))
     print(recipe)
     return recipe.to_json()
@@ -202,10 +492,55 @@ def new_recipe():
 # @app.route("/recipes/recipe/<string:key>", methods=["GET"])
 def get_recipe(_id):
     _id = ObjectId(_id)
-    with current_app.app_context():
-        mongo = PyMongo(current_app)
-        recipe = mongo.db.recipes.find_one_or_404({"_id": _id})
-    return Recipe(**recipe).to_json()
+    recipe = find_one_raw(mongo.db.recipes, {"_id": _id})
+    if recipe is None:
+        abort(404)
+    return conditional_document(recipe, lambda doc: Recipe(**doc).to_json())
+
+
+# @app.route("/recipes/batch", methods=["POST"])
+@jwt_required(optional=True)
+def batch_recipes():
+    """
+    POST a JSON body of `{"ids": [...]}` to GET several recipes at once.
+
+    The recipes, and the user's recipes when authorized, are fetched with a
+    single `$in` query. Each id gets a result in request order, with its own
+    `code`: 200 and the `recipe`, 400 for an invalid id or 404.
+    """
+    data = request.get_json(silent=True) or {}
+    raw_ids = data.get("ids")
+    if not isinstance(raw_ids, list):
+        abort(400, "Missing 'ids' list")
+    max_size = int(current_app.config.get("BATCH_MAX_SIZE", BATCH_MAX_SIZE))
+    if len(raw_ids) > max_size:
+        abort(400, f"At most {max_size} ids per batch")
+
+    ids = {
+        ObjectId(raw_id)
+        for raw_id in raw_ids
+        if isinstance(raw_id, str) and ObjectId.is_valid(raw_id)
+    }
+    search_agg = [{"$match": {"_id": {"$in": list(ids)}}}]
+    current_user_id = get_jwt_identity()
+    if current_user_id is not None:
+        search_agg.extend(user_recipe_lookup(ObjectId(current_user_id)))
+    recipes = {
+        doc["_id"]: recipe_card_json(doc, Recipe)
+        for doc in mongo.db.recipes.aggregate(search_agg)
+    }
+
+    results = []
+    for raw_id in raw_ids:
+        if not (isinstance(raw_id, str) and ObjectId.is_valid(raw_id)):
+            results.append({"_id": raw_id, "code": 400, "error": "Invalid id"})
+        elif ObjectId(raw_id) not in recipes:
+            results.append({"_id": raw_id, "code": 404, "error": "recipe not found"})
+        else:
+            results.append(
+                {"_id": raw_id, "code": 200, "recipe": recipes[ObjectId(raw_id)]}
+            )
+    return {"recipes": results}
 
 
 # @app.route("/recipes/recipe/<string:key>", methods=["PUT"])
@@ -213,14 +548,14 @@ def update_recipe(_id):
     _id = ObjectId(_id)
     recipe = Recipe(**request.get_json())
     recipe.date_updated = datetime.utcnow()
-    with app.app_context:
-        mongo = PyMongo(current_app)
-        updated_recipe = mongo.db.recipes.find_one_and_update(
-            {"_id": _id},
-            {"$set": recipe.to_bson()},
-            return_document=ReturnDocument.AFTER,
-        )
+    updated_recipe = mongo.db.recipes.find_one_and_update(
+        {"_id": _id},
+        {"$set": recipe.to_bson()},
+        return_document=ReturnDocument.AFTER,
+    )
     if updated_recipe:
+        counts.invalidate(mongo.db.recipes)
+        ingredient_index.invalidate()
         return Recipe(**updated_recipe).to_json()
     else:
         flask.abort(404, "recipe not found")
@@ -229,12 +564,12 @@ def update_recipe(_id):
 # @app.route("/recipes/recipe/<string:key>", methods=["DELETE"])
 def delete_recipe(_id):
     _id = ObjectId(_id)
-    with current_app.app_context():
-        mongo = PyMongo(current_app)
-        deleted_recipe = mongo.db.recipes.find_one_and_delete(
-            {"_id": _id},
-        )
+    deleted_recipe = mongo.db.recipes.find_one_and_delete(
+        {"_id": _id},
+    )
     if deleted_recipe:
+        counts.invalidate(mongo.db.recipes)
+        ingredient_index.invalidate()
         return Recipe(**deleted_recipe).to_json()
     else:
         flask.abort(404, "recipe not found")
@@ -0,0 +1,165 @@
+"""
+api/sampling - Random recipes from an index, rather than a ``$sample``.
+
+Every recipe stores a uniform ``random_key`` in [0, 1). A sample of ``count``
+recipes seeks the ``random_key`` index to a random point and reads the next
+``count`` entries, wrapping around to the start of the index if it runs out,
+so it reads ``count`` index entries however many recipes there are. The
+``cookbook`` filter has its own ``(cookbook_key, random_key)`` index. A
+``query`` filter still samples correctly, but is bounded by the text search.
+
+Samples are runs of neighbouring keys, so two recipes with close keys tend to
+be drawn together. Re-keying every recipe (``--all``) reshuffles them.
+
+The API and ``process_photos.py`` key every recipe they insert. Recipes from
+before this scheme have none, and are only drawn (with a ``$sample``) to top
+up a sample the keyed recipes fall short of. Backfill them once with:
+
+    uv run -m api.sampling --backfill
+
+or set ``COOKBOOKS_ENSURE_INDEXES=true`` to backfill them when the app starts.
+"""
+
+import argparse
+import os
+import random
+
+from dotenv import load_dotenv
+from pymongo import ASCENDING, MongoClient
+from pymongo.collection import Collection
+from pymongo.database import Database
+
+RANDOM_KEY = "random_key"
+# The most recipes a sample draws; larger counts are clamped to it.
+MAX_SAMPLE = 100
+
+
+def random_key() -> float:
+    return random.random()
+
+
+def sample_size(count: int) -> int:
+    """``count`` clamped to [0, MAX_SAMPLE]."""
+    return min(max(count, 0), MAX_SAMPLE)
+
+
+def sample_pipelines(search_dict: dict, count: int, start: float) -> list[list[dict]]:
+    """
+    The pipelines of a sample from ``start``: the seek, the wraparound, and a
+    ``$sample`` of the recipes without a key.
+
+    Run each of the next only while the sample is short of ``count`` recipes,
+    limited to the shortfall (see ``shortfall``). ``count`` is clamped by
+    ``sample_size``, and an empty sample has no pipelines: MongoDB rejects a
+    ``$limit`` of 0.
+    """
+    count = sample_size(count)
+    if count == 0:
+        return []
+    sort = {"$sort": {RANDOM_KEY: ASCENDING}}
+    return [
+        [
+            {"$match": {**search_dict, RANDOM_KEY: {"$gte": start}}},
+            sort,
+            {"$limit": count},
+        ],
+        [
+            {"$match": {**search_dict, RANDOM_KEY: {"$lt": start}}},
+            sort,
+            {"$limit": count},
+        ],
+        [
+            {"$match": {**search_dict, RANDOM_KEY: {"$exists": False}}},
+            {"$sample": {"size": count}},
+        ],
+    ]
+
+
+def shortfall(pipeline: list[dict], missing: int) -> list[dict]:
+    """``pipeline`` (of ``sample_pipelines``) limited to ``missing`` recipes."""
+    last = pipeline[-1]
+    if "$sample" in last:
+        return [*pipeline[:-1], {"$sample": {"size": missing}}]
+    return [*pipeline[:-1], {"$limit": missing}]
+
+
+def sample(
+    collection: Collection, search_dict: dict, count: int, stages: list[dict]
+) -> list[dict]:
+    """Up to ``count`` (at most MAX_SAMPLE) random documents matching
+    ``search_dict``.
+
+    ``stages`` are appended to each seek, e.g. a projection and lookups.
+    """
+    count = sample_size(count)
+    if count == 0:
+        return []
+    seek, *rest = sample_pipelines(search_dict, count, random_key())
+    docs = list(collection.aggregate(seek + stages))
+    for pipeline in rest:
+        if len(docs) == count:
+            break
+        docs.extend(
+            collection.aggregate(shortfall(pipeline, count - len(docs)) + stages)
+        )
+    return docs
+
+
+async def asample(
+    collection, search_dict: dict, count: int, stages: list[dict]
+) -> list[dict]:
+    """:func:`sample` on an ``AsyncCollection``."""
+    count = sample_size(count)
+    if count == 0:
+        return []
+    seek, *rest = sample_pipelines(search_dict, count, random_key())
+    docs = await (await collection.aggregate(seek + stages)).to_list()
+    for pipeline in rest:
+        if len(docs) == count:
+            break
+        cursor = await collection.aggregate(
+            shortfall(pipeline, count - len(docs)) + stages
+        )
+        docs.extend(await cursor.to_list())
+    return docs
+
+
+def backfill(db: Database, rekey: bool = False) -> int:
+    """Set a random key on every recipe without one, or on all of them."""
+    search_dict = {} if rekey else {RANDOM_KEY: {"$exists": False}}
+    result = db.recipes.update_many(
+        search_dict, [{"$set": {RANDOM_KEY: {"$rand": {}}}}]
+    )
+    return result.modified_count
+
+
+def main(rekey: bool) -> None:
+    load_dotenv()
+    client = MongoClient(os.environ.get("COOKBOOKS_CONNECTION_STRING"))
+    db = client[os.environ.get("COOKBOOKS_DB_NAME")]
+    print(f"Set the random key of {backfill(db, rekey)} recipes")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Backfill the random keys of recipes for random sampling."
+    )
+    parser.add_argument(
+        "--backfill",
+        action="store_true",
+        default=False,
+        help="Set a random key on every recipe without one.",
+    )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        default=False,
+        help="Re-key every recipe, reshuffling which recipes are drawn together.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.backfill or args.all:
+        main(args.all)
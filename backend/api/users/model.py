@@ -1,5 +1,4 @@
-# FastAPI's jsonable_encoder handles converting various non-JSON types,
-# such as datetime between JSON types and native Python types.
+import re
 from datetime import datetime
 from enum import Enum
 
@@ -7,7 +6,6 @@ from enum import Enum
 # that defines the structure and types of the different objects stored
 # in the recipes collection, and managed by this API.
 from bson import ObjectId
-from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel, ConfigDict, Field
 
 BaseModel.model_config["json_encoders"] = {ObjectId: lambda v: str(v)}
@@ -72,7 +70,7 @@ class UserRecipe(BaseModel):
         return False
 
     def to_json(self):
-        return jsonable_encoder(self, exclude_none=True)
+        return self.model_dump(mode="json", by_alias=True, exclude_none=True)
 
     def to_bson(self):
         data = self.dict(by_alias=True, exclude_none=True)
@@ -81,6 +79,48 @@ class UserRecipe(BaseModel):
         return data
 
 
+# A field name of UserRecipeCounts.cookbooks in MongoDB: no dots, and not an
+# operator. The user recipe views reject other cookbook keys.
+COUNTED_COOKBOOK_KEY = r"^[^$.][^.]*$"
+
+
+def is_counted_cookbook_key(cookbook_key) -> bool:
+    return isinstance(cookbook_key, str) and bool(
+        re.match(COUNTED_COOKBOOK_KEY, cookbook_key)
+    )
+
+
+class UserRecipeCounts(BaseModel):
+    """How many recipes a user has, kept up to date by the user recipe views."""
+
+    total: int = 0
+    cooked: int = 0
+    uncooked: int = 0
+    cookbooks: dict[str, int] = {}
+
+    @classmethod
+    def of(cls, recipes: list[dict]) -> "UserRecipeCounts":
+        counts = cls()
+        for recipe in recipes:
+            counts.total += 1
+            if recipe.get("status") == UserRecipeStatus.cooked:
+                counts.cooked += 1
+            else:
+                counts.uncooked += 1
+            key = recipe.get("cookbook_key")
+            if is_counted_cookbook_key(key):
+                counts.cookbooks[key] = counts.cookbooks.get(key, 0) + 1
+        return counts
+
+    def to_json(self):
+        # Cookbooks the user no longer has recipes of are left at 0.
+        data = self.model_dump(mode="json")
+        data["cookbooks"] = {
+            key: count for key, count in data["cookbooks"].items() if count
+        }
+        return data
+
+
 class User(BaseModel):
     model_config = ConfigDict(arbitrary_types_allowed=True)
     id: ObjectId = Field(None, alias="_id")
@@ -90,9 +130,10 @@ class User(BaseModel):
     first_name: str
     last_name: str
     recipes: list[UserRecipe] = []
+    recipe_counts: UserRecipeCounts = UserRecipeCounts()
 
     def to_json(self):
-        return jsonable_encoder(self, exclude_none=True)
+        return self.model_dump(mode="json", by_alias=True, exclude_none=True)
 
     def to_bson(self):
         data = self.dict(by_alias=True, exclude_none=True)
@@ -6,64 +6,77 @@ from datetime import datetime
 
 from bson import ObjectId
 from flask import abort, current_app, jsonify, request, url_for
-from flask_bcrypt import Bcrypt
 from flask_jwt_extended import create_access_token, get_jwt_identity, jwt_required
-from flask_pymongo import PyMongo
 from pymongo.collection import ReturnDocument
 
+from api.db import mongo
+from api.passwords import PasswordHasherBusy, hasher
+
 from .model import User
 
 
-# @app.route('/api/signup', methods=['POST'])
-def signup():
-    data = request.get_json()
+def credentials(data: dict | None) -> tuple[str, str, str | None]:
+    """The email and password of a signup or login body, and what is wrong with
+    it if anything."""
     if not data:
-        return jsonify({"msg": "Missing JSON in request"}), 400
+        return "", "", "Missing JSON in request"
     email = data.get("email", "").strip()
     password = data.get("password", "").strip()
-    first_name = data.get("first_name", "").strip()
-    last_name = data.get("last_name", "").strip()
     if not email or not password:
-        return jsonify({"msg": "Missing email or password"}), 400
-    with current_app.app_context():
-        mongo = PyMongo(current_app)
-        if mongo.db.users.find_one({"email": email}):
-            return jsonify({"msg": "Email already exists"}), 409
-        bcrypt = Bcrypt(current_app)
-        hashed_password = bcrypt.generate_password_hash(password).decode("utf-8")
-        raw_user = {
-            "email": email,
-            "password": hashed_password,
-            "first_name": first_name,
-            "last_name": last_name,
-            "recipes": [],
-        }
-        user = User(**raw_user)
-        insert_result = mongo.db.users.insert_one(user.to_bson())
-        user.id = ObjectId(str(insert_result.inserted_id))
-        return jsonify({"msg": "User created successfully"}), 201
+        return email, password, "Missing email or password"
+    return email, password, None
+
+
+def new_user(data: dict, email: str, hashed_password: str) -> User:
+    return User(
+        email=email,
+        password=hashed_password,
+        first_name=data.get("first_name", "").strip(),
+        last_name=data.get("last_name", "").strip(),
+        recipes=[],
+    )
+
+
+# @app.route('/api/signup', methods=['POST'])
+def signup():
+    data = request.get_json()
+    email, password, error = credentials(data)
+    if error is not None:
+        return jsonify({"msg": error}), 400
+    if mongo.db.users.find_one({"email": email}):
+        return jsonify({"msg": "Email already exists"}), 409
+    try:
+        hashed_password = hasher.hash(password)
+    except PasswordHasherBusy:
+        return jsonify({"msg": "Too many requests, try again"}), 503
+    user = new_user(data, email, hashed_password)
+    insert_result = mongo.db.users.insert_one(user.to_bson())
+    user.id = ObjectId(str(insert_result.inserted_id))
+    return jsonify({"msg": "User created successfully"}), 201
 
 
 # @app.route('/api/login', methods=['POST'])
 def login():
-    data = request.get_json()
-    if not data:
-        return jsonify({"msg": "Missing JSON in request"}), 400
-    email = data.get("email", "").strip()
-    password = data.get("password", "").strip()
-    if not email or not password:
-        return jsonify({"msg": "Missing email or password"}), 400
-    with current_app.app_context():
-        mongo = PyMongo(current_app)
-        user = mongo.db.users.find_one({"email": email})
-        if not user:
-            return jsonify({"msg": "Bad email or password"}), 401
-        bcrypt = Bcrypt(current_app)
-        if not bcrypt.check_password_hash(user["password"], password):
+    email, password, error = credentials(request.get_json())
+    if error is not None:
+        return jsonify({"msg": error}), 400
+    user = mongo.db.users.find_one({"email": email})
+    if not user:
+        return jsonify({"msg": "Bad email or password"}), 401
+    try:
+        if not hasher.check(user["password"], password):
             return jsonify({"msg": "Bad email or password"}), 401
-        # Create JWT token
-        access_token = create_access_token(identity=str(user["_id"]))
-        return jsonify(access_token=access_token, user=User(**user).to_json()), 200
+        # Upgrade the stored hash to the current cost factor.
+        if hasher.needs_rehash(user["password"]):
+            mongo.db.users.update_one(
+                {"_id": user["_id"], "password": user["password"]},
+                {"$set": {"password": hasher.hash(password)}},
+            )
+    except PasswordHasherBusy:
+        return jsonify({"msg": "Too many requests, try again"}), 503
+    # Create JWT token
+    access_token = create_access_token(identity=str(user["_id"]))
+    return jsonify(access_token=access_token, user=User(**user).to_json()), 200
 
 
 # @app.route("/api/users/token")
@@ -81,12 +94,10 @@ def check_token():
 @jwt_required()
 def protected():
     current_user_id = get_jwt_identity()
-    with current_app.app_context():
-        mongo = PyMongo(current_app)
-        user = mongo.db.users.find_one({"_id": ObjectId(current_user_id)})
-        if not user:
-            return jsonify({"msg": "User not found"}), 404
-        return jsonify(logged_in_as=user["email"]), 200
+    user = mongo.db.users.find_one({"_id": ObjectId(current_user_id)})
+    if not user:
+        return jsonify({"msg": "User not found"}), 404
+    return jsonify(logged_in_as=user["email"]), 200
     flask.abort(404, "user not found")
 
 
@@ -94,12 +105,10 @@ def protected():
 @jwt_required()
 def get_user(email):
     current_user_id = get_jwt_identity()
-    with current_app.app_context():
-        mongo = PyMongo(current_app)
-        user = mongo.db.users.find_one_or_404({"email": email})
-        if current_user_id != user._id:
-            return jsonify(message="Token is invalid for requested user"), 401
-        return User(**user).to_json()
+    user = mongo.db.users.find_one_or_404({"email": email})
+    if current_user_id != user._id:
+        return jsonify(message="Token is invalid for requested user"), 401
+    return User(**user).to_json()
 
 
 # @app.route("/api/users/<string:email>", methods=["PUT"])
@@ -109,18 +118,16 @@ def update_user(email):
 
     user = User(**request.get_json())
     user.date_updated = datetime.utcnow()
-    with app.app_context():
-        mongo = PyMongo(current_app)
-        got_user = mongo.db.users.find_one_or_404({"email": email})
-        if got_user._id != current_user_id:
-            return jsonify(message="Token is invalid for requested user"), 401
-        updated_user = mongo.db.users.find_one_and_update(
-            {"_id": got_user._id},
-            {"$set": user.to_bson()},
-            return_document=ReturnDocument.AFTER,
-        )
-
-        if updated_user:
-            return User(**updated_user).to_json()
-        else:
-            flask.abort(404, "user not found")
+    got_user = mongo.db.users.find_one_or_404({"email": email})
+    if got_user._id != current_user_id:
+        return jsonify(message="Token is invalid for requested user"), 401
+    updated_user = mongo.db.users.find_one_and_update(
+        {"_id": got_user._id},
+        {"$set": user.to_bson()},
+        return_document=ReturnDocument.AFTER,
+    )
+
+    if updated_user:
+        return User(**updated_user).to_json()
+    else:
+        flask.abort(404, "user not found")
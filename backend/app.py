@@ -6,22 +6,27 @@ from dotenv import load_dotenv
 from flask import Flask, Response, g
 from flask_cors import CORS, cross_origin
 from flask_jwt_extended import JWTManager
-from flask_pymongo import PyMongo
-from pymongo import MongoClient
 
 import api.cookbooks.views as cookbooks_view
 import api.recipes.user.views as user_recipes_view
 import api.recipes.views as recipes_view
 import api.users.views as users_view
+from api import compression, db, metrics, sampling
+from api.counts import counts
+from api.ingredients import ingredient_index
+from api.indexes import ensure_indexes
+from api.passwords import hasher
+from api.serialize import FastJSONProvider
 
 load_dotenv()
 
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 cors = CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=True)
 jwt = JWTManager(app)
 app.config.from_prefixed_env("COOKBOOKS")
-app.config["MONGO_URI"] = f'{app.config["CONNECTION_STRING"]}{app.config["DB_NAME"]}'
+app.config["MONGO_URI"] = f"{app.config['CONNECTION_STRING']}{app.config['DB_NAME']}"
 app.url_map.strict_slashes = False
 
 
@@ -30,8 +35,8 @@ def init_mongodb_client(app: Flask):
         print(
             f"Attempting to connect to MongoDB connection string: {app.config['CONNECTION_STRING']} and DB: {app.config['DB_NAME']} ..."
         )
-        mongo = PyMongo(app)
-        result = mongo.db.command("ping")
+        db.init_app(app)
+        result = db.mongo.db.command("ping")
         if int(result.get("ok")) == 1:
             print("Connected")
         else:
@@ -40,7 +45,21 @@ def init_mongodb_client(app: Flask):
         raise e
 
 
+# Before the client is created, so that its commands are timed.
+metrics.init_app(app)
 init_mongodb_client(app)
+counts.init_app(app)
+ingredient_index.init_app(app)
+hasher.init_app(app)
+compression.init_app(app)
+if app.config.get("ENSURE_INDEXES", False):
+    for error in ensure_indexes(db.mongo.db):
+        print(f"Error: index not created: {error}")
+    # Recipes inserted before the random keys are otherwise only drawn to top
+    # up a short sample.
+    print(f"Set the random key of {sampling.backfill(db.mongo.db)} recipes")
+# Build in the background now rather than in the first request that needs it.
+ingredient_index.start(db.mongo.db.recipes, recipes_view.RECIPE_SORT)
 
 # Users and login
 app.add_url_rule(
@@ -107,6 +126,21 @@ app.add_url_rule(
     view_func=recipes_view.get_n_random_recipes,
     methods=["GET"],
 )
+app.add_url_rule(
+    "/api/recipes/search",
+    view_func=recipes_view.search_recipes,
+    methods=["GET"],
+)
+app.add_url_rule(
+    "/api/recipes/ingredients",
+    view_func=recipes_view.recipes_with_ingredients,
+    methods=["GET"],
+)
+app.add_url_rule(
+    "/api/recipes/batch",
+    view_func=recipes_view.batch_recipes,
+    methods=["POST"],
+)
 app.add_url_rule(
     "/api/recipes/recipe/<string:_id>",
     view_func=recipes_view.get_recipe,
@@ -135,6 +169,11 @@ app.add_url_rule(
     view_func=user_recipes_view.user_recipes_count,
     methods=["GET"],
 )
+app.add_url_rule(
+    "/api/recipes/user/batch",
+    view_func=user_recipes_view.batch_update_user_recipes,
+    methods=["POST"],
+)
 app.add_url_rule(
     "/api/recipes/user/<string:recipe_id>",
     view_func=user_recipes_view.get_or_create_user_recipe,
@@ -0,0 +1,596 @@
+"""
+asgi - The read and user recipe routes of the API on ASGI.
+
+A subset of app.py's routes, with the same JSON contracts, served by FastAPI
+with PyMongo's AsyncMongoClient, so that a worker keeps serving while queries
+are in flight and a request's independent queries (a page and its count) run
+concurrently:
+
+    signup, login and the token check
+    the cookbook and recipe reads: lists, counts, random, search and documents
+    a user's recipes: list, count, get or create, update and delete
+
+Everything else (the cookbook, recipe and user writes, the batch and
+ingredient routes, and adding a user recipe by POST) is only served by app.py.
+Tokens are interchangeable with the Flask app's. Run it with:
+
+    uv run --with uvicorn uvicorn asgi:app --workers 4
+"""
+
+import asyncio
+import contextlib
+import datetime as dt
+import uuid
+
+import bson
+import jwt
+from bson import ObjectId
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from dotenv import load_dotenv
+from fastapi import Depends, FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+from flask import Config
+from pymongo import AsyncMongoClient
+from starlette.datastructures import MutableHeaders
+from starlette.middleware.gzip import GZipMiddleware
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import parse_etags
+
+from api.caching import DEFAULT_CACHE_CONTROL, etag_for
+from api.compression import DEFAULT_LEVEL, DEFAULT_MIN_SIZE
+from api.cookbooks.views import COOKBOOK_SORT, COOKBOOK_SORT_TYPES, cookbook_json
+from api.counts import counts
+from api.db import client_options
+from api.pagination import (
+    Href,
+    KeysetPage,
+    decode_after,
+    keyset_links,
+    last_page,
+    page_links,
+    seek_filter,
+)
+from api.passwords import PasswordHasherBusy, hasher
+from api.recipes.model import RECIPE_CARD_PROJECTION, Recipe
+from api.recipes.user.counters import push_update, set_updates
+from api.recipes.user.views import (
+    USER_RECIPE_SORT,
+    USER_RECIPE_SORT_TYPES,
+    apply_first,
+    arun_steps,
+    counted_update,
+    created_user_recipe,
+    page_user_recipes,
+    pull_user_recipe,
+    updated_user_recipe,
+    user_recipe_counts,
+    user_recipe_json,
+    user_recipe_update,
+    user_recipes_page_pipeline,
+    user_recipes_total,
+)
+from api.recipes.views import (
+    RECIPE_SORT,
+    RECIPE_SORT_TYPES,
+    cooked_ids_of,
+    cooked_recipe_ids_pipeline,
+    filters_on_status,
+    is_count_cached,
+    recipe_card_json,
+    recipes_page_pipeline,
+    recipes_search_dict,
+    search_limit,
+    search_pipeline,
+    search_result_json,
+    user_recipe_lookup,
+)
+from api.sampling import asample
+from api.serialize import dumps_bytes
+from api.users.model import User
+from api.users.views import credentials, new_user
+
+load_dotenv()
+
+# The same ``COOKBOOKS_`` settings, parsed the same way, as the Flask app.
+config = Config(".")
+config.from_prefixed_env("COOKBOOKS")
+counts.init_config(config)
+hasher.init_config(config)
+
+JWT_ALGORITHM = "HS256"
+
+
+def access_expires(config) -> dt.timedelta | None:
+    """``JWT_ACCESS_TOKEN_EXPIRES`` as flask-jwt-extended reads it: 15 minutes
+    by default, seconds if a number, and no expiry if false."""
+    expires = config.get("JWT_ACCESS_TOKEN_EXPIRES", dt.timedelta(minutes=15))
+    if expires is False:
+        return None
+    if isinstance(expires, int):
+        return dt.timedelta(seconds=expires)
+    return expires
+
+
+JWT_ACCESS_EXPIRES = access_expires(config)
+
+
+class FastJSONResponse(JSONResponse):
+    """Encodes with :func:`api.serialize.dumps_bytes`."""
+
+    def render(self, content) -> bytes:
+        return dumps_bytes(content)
+
+
+class WeakETagMiddleware:
+    """Weakens the ETag of responses compressed by the GZipMiddleware inside
+    it, as ``api.compression`` does: the compressed bytes differ from the ones
+    a strong ETag was made for."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        async def send_weakened(message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/") and "content-encoding" in headers:
+                    headers["etag"] = f"W/{etag}"
+            await send(message)
+
+        await self.app(scope, receive, send_weakened)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    client = AsyncMongoClient(config["CONNECTION_STRING"], **client_options(config))
+    app.state.db = client[config["DB_NAME"]]
+    yield
+    await client.close()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+app.add_middleware(
+    GZipMiddleware,
+    minimum_size=int(config.get("COMPRESS_MIN_SIZE", DEFAULT_MIN_SIZE)),
+    compresslevel=int(config.get("COMPRESS_LEVEL", DEFAULT_LEVEL)),
+)
+app.add_middleware(WeakETagMiddleware)
+# As flask-cors: any origin, method and request header (e.g. Authorization).
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+@app.exception_handler(HTTPException)
+async def werkzeug_error(request: Request, e: HTTPException) -> Response:
+    # The shared helpers (e.g. ``decode_after``) abort like a Flask view.
+    return Response(e.description, status_code=e.code)
+
+
+class JWTError(Exception):
+    def __init__(self, msg: str, status_code: int) -> None:
+        self.msg = msg
+        self.status_code = status_code
+
+
+@app.exception_handler(JWTError)
+async def jwt_error(request: Request, e: JWTError) -> Response:
+    return FastJSONResponse({"msg": e.msg}, status_code=e.status_code)
+
+
+def create_access_token(identity: str) -> str:
+    """A token in flask-jwt-extended's format, accepted by either app."""
+    now = dt.datetime.now(dt.timezone.utc)
+    claims = {
+        "fresh": False,
+        "iat": now,
+        "jti": str(uuid.uuid4()),
+        "type": "access",
+        "sub": identity,
+        "nbf": now,
+    }
+    if JWT_ACCESS_EXPIRES is not None:
+        claims["exp"] = now + JWT_ACCESS_EXPIRES
+    return jwt.encode(claims, config["JWT_SECRET_KEY"], algorithm=JWT_ALGORITHM)
+
+
+def jwt_identity(optional: bool = False):
+    """Dependency returning the user id of the request's bearer token."""
+
+    def identity(request: Request) -> str | None:
+        header = request.headers.get("Authorization")
+        if header is None:
+            if optional:
+                return None
+            raise JWTError("Missing Authorization Header", 401)
+        scheme, _, token = header.partition(" ")
+        if scheme != "Bearer" or not token:
+            raise JWTError("Bad Authorization header. Expected 'Bearer <JWT>'", 422)
+        try:
+            claims = jwt.decode(
+                token, config["JWT_SECRET_KEY"], algorithms=[JWT_ALGORITHM]
+            )
+        except jwt.ExpiredSignatureError:
+            raise JWTError("Token has expired", 401)
+        except jwt.InvalidTokenError as e:
+            raise JWTError(str(e), 422)
+        if claims.get("type") != "access":
+            raise JWTError("Only non-refresh tokens are allowed", 422)
+        return claims["sub"]
+
+    return identity
+
+
+def href(request: Request, name: str) -> Href:
+    """The ``api.pagination.Href`` of a route."""
+
+    def url(**params) -> str:
+        return str(request.url_for(name).include_query_params(**params))
+
+    return url
+
+
+async def aggregate(collection, pipeline: list[dict]) -> list[dict]:
+    cursor = await collection.aggregate(pipeline)
+    return await cursor.to_list()
+
+
+async def conditional_document(request: Request, collection, search_dict, to_json):
+    """Like ``api.caching.conditional_document``, with the lookup included."""
+    raw_collection = collection.with_options(
+        codec_options=CodecOptions(document_class=RawBSONDocument)
+    )
+    raw = await raw_collection.find_one(search_dict)
+    if raw is None:
+        return Response(status_code=404)
+    etag = etag_for(raw.raw)
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": config.get("CACHE_CONTROL", DEFAULT_CACHE_CONTROL),
+    }
+    if parse_etags(request.headers.get("If-None-Match")).contains_weak(etag):
+        return Response(status_code=304, headers=headers)
+    return FastJSONResponse(to_json(bson.decode(raw.raw)), headers=headers)
+
+
+# Users and login
+
+
+@app.post("/api/signup", name="signup")
+async def signup(request: Request):
+    data = await request.json()
+    email, password, error = credentials(data)
+    if error is not None:
+        return FastJSONResponse({"msg": error}, 400)
+    db = request.app.state.db
+    if await db.users.find_one({"email": email}):
+        return FastJSONResponse({"msg": "Email already exists"}, 409)
+    try:
+        hashed_password = await hasher.ahash(password)
+    except PasswordHasherBusy:
+        return FastJSONResponse({"msg": "Too many requests, try again"}, 503)
+    await db.users.insert_one(new_user(data, email, hashed_password).to_bson())
+    return FastJSONResponse({"msg": "User created successfully"}, 201)
+
+
+@app.post("/api/login", name="login")
+async def login(request: Request):
+    email, password, error = credentials(await request.json())
+    if error is not None:
+        return FastJSONResponse({"msg": error}, 400)
+    users = request.app.state.db.users
+    user = await users.find_one({"email": email})
+    if not user:
+        return FastJSONResponse({"msg": "Bad email or password"}, 401)
+    try:
+        if not await hasher.acheck(user["password"], password):
+            return FastJSONResponse({"msg": "Bad email or password"}, 401)
+        if hasher.needs_rehash(user["password"]):
+            await users.update_one(
+                {"_id": user["_id"], "password": user["password"]},
+                {"$set": {"password": await hasher.ahash(password)}},
+            )
+    except PasswordHasherBusy:
+        return FastJSONResponse({"msg": "Too many requests, try again"}, 503)
+    access_token = create_access_token(str(user["_id"]))
+    return FastJSONResponse(
+        {"access_token": access_token, "user": User(**user).to_json()}
+    )
+
+
+@app.get("/api/users/token", name="check_token")
+async def check_token(identity: str | None = Depends(jwt_identity(optional=True))):
+    if identity is None:
+        return FastJSONResponse({"message": "Token is invalid"}, 401)
+    return FastJSONResponse({"message": "Token is valid"})
+
+
+# Cookbooks
+
+
+@app.get("/api/cookbooks", name="list_cookbooks")
+async def list_cookbooks(request: Request, page: int = 1, after: str | None = None):
+    per_page = 10  # A const value.
+    cookbooks = request.app.state.db.cookbooks
+    if after is not None:
+        after_values = decode_after(after, COOKBOOK_SORT, COOKBOOK_SORT_TYPES)
+        search_dict = {}
+        if after_values is not None:
+            search_dict = seek_filter(COOKBOOK_SORT, after_values)
+        cursor = cookbooks.find(search_dict).sort(COOKBOOK_SORT).limit(per_page + 1)
+        docs = KeysetPage(await cursor.to_list(), per_page, COOKBOOK_SORT)
+        records = [cookbook_json(doc) for doc in docs]
+        links = keyset_links(href(request, "list_cookbooks"), after, docs.next_after())
+        return FastJSONResponse({"cookbooks": records, "_links": links})
+
+    cursor = cookbooks.find().sort(COOKBOOK_SORT).skip(per_page * (page - 1))
+    docs, cookbook_count = await asyncio.gather(
+        cursor.limit(per_page).to_list(), counts.acount(cookbooks, {})
+    )
+    links = page_links(
+        href(request, "list_cookbooks"), page, last_page(cookbook_count, per_page)
+    )
+    return FastJSONResponse(
+        {"cookbooks": [cookbook_json(doc) for doc in docs], "_links": links}
+    )
+
+
+@app.get("/api/cookbooks/count", name="cookbooks_count")
+async def cookbooks_count(request: Request):
+    count = await counts.acount(request.app.state.db.cookbooks, {})
+    return FastJSONResponse({"count": count})
+
+
+@app.get("/api/cookbooks/{key}", name="get_cookbook")
+async def get_cookbook(request: Request, key: str):
+    return await conditional_document(
+        request,
+        request.app.state.db.cookbooks,
+        {"key": key},
+        cookbook_json,
+    )
+
+
+# Recipes
+
+
+async def recipes_filter(
+    db, cookbook_key: str, query: str, user_status: str, identity: str | None
+) -> dict:
+    cooked_ids = []
+    if filters_on_status(user_status) and identity is not None:
+        pipeline = cooked_recipe_ids_pipeline(ObjectId(identity))
+        cooked_ids = cooked_ids_of(await aggregate(db.users, pipeline))
+    return recipes_search_dict(cookbook_key, query, user_status, cooked_ids)
+
+
+async def count_recipes(db, search_dict: dict) -> int:
+    # As api.recipes.views.count_recipes.
+    if not is_count_cached(search_dict):
+        return await db.recipes.count_documents(search_dict)
+    return await counts.acount(db.recipes, search_dict)
+
+
+@app.get("/api/recipes", name="list_recipes")
+async def list_recipes(
+    request: Request,
+    page: int = 1,
+    after: str | None = None,
+    cookbook: str = "",
+    query: str = "",
+    status: str = "",
+    identity: str | None = Depends(jwt_identity(optional=True)),
+):
+    per_page = 30  # A const value.
+    db = request.app.state.db
+    filters = {"cookbook": cookbook, "query": query, "status": status}
+    search_dict = await recipes_filter(db, cookbook, query, status, identity)
+    user_id = ObjectId(identity) if identity is not None else None
+
+    if after is not None:
+        after_values = decode_after(after, RECIPE_SORT, RECIPE_SORT_TYPES)
+        if after_values is not None:
+            search_dict.update(seek_filter(RECIPE_SORT, after_values))
+        pipeline = recipes_page_pipeline(search_dict, 0, per_page + 1, user_id)
+        docs = KeysetPage(await aggregate(db.recipes, pipeline), per_page, RECIPE_SORT)
+        recipes = [recipe_card_json(doc) for doc in docs]
+        links = keyset_links(
+            href(request, "list_recipes"), after, docs.next_after(), **filters
+        )
+        return FastJSONResponse({"recipes": recipes, "_links": links})
+
+    pipeline = recipes_page_pipeline(
+        search_dict, per_page * (page - 1), per_page, user_id
+    )
+    docs, recipes_count = await asyncio.gather(
+        aggregate(db.recipes, pipeline), count_recipes(db, search_dict)
+    )
+    links = page_links(
+        href(request, "list_recipes"),
+        page,
+        last_page(recipes_count, per_page),
+        **filters,
+    )
+    return FastJSONResponse(
+        {"recipes": [recipe_card_json(doc) for doc in docs], "_links": links}
+    )
+
+
+@app.get("/api/recipes/count", name="recipes_count")
+async def recipes_count(
+    request: Request,
+    cookbook: str = "",
+    query: str = "",
+    status: str = "",
+    identity: str | None = Depends(jwt_identity(optional=True)),
+):
+    db = request.app.state.db
+    search_dict = await recipes_filter(db, cookbook, query, status, identity)
+    return FastJSONResponse({"count": await count_recipes(db, search_dict)})
+
+
+@app.get("/api/recipes/random/{count}", name="get_n_random_recipes")
+async def get_n_random_recipes(
+    request: Request,
+    count: int,
+    cookbook: str = "",
+    query: str = "",
+    identity: str | None = Depends(jwt_identity(optional=True)),
+):
+    search_dict = recipes_search_dict(cookbook, query, "", [])
+    stages = [{"$project": RECIPE_CARD_PROJECTION}]
+    if identity is not None:
+        stages.extend(user_recipe_lookup(ObjectId(identity)))
+    docs = await asample(request.app.state.db.recipes, search_dict, count, stages)
+    return FastJSONResponse({"recipes": [recipe_card_json(doc) for doc in docs]})
+
+
+@app.get("/api/recipes/search", name="search_recipes")
+async def search_recipes(
+    request: Request,
+    query: str = "",
+    limit: str | None = None,
+    cookbook: str = "",
+    status: str = "",
+    identity: str | None = Depends(jwt_identity(optional=True)),
+):
+    db = request.app.state.db
+    limit = search_limit(query, limit)
+    search_dict = await recipes_filter(db, cookbook, query, status, identity)
+    user_id = ObjectId(identity) if identity is not None else None
+    docs = await aggregate(db.recipes, search_pipeline(search_dict, limit, user_id))
+    return FastJSONResponse({"recipes": [search_result_json(doc) for doc in docs]})
+
+
+@app.get("/api/recipes/recipe/{_id}", name="get_recipe")
+async def get_recipe(request: Request, _id: str):
+    return await conditional_document(
+        request,
+        request.app.state.db.recipes,
+        {"_id": ObjectId(_id)},
+        lambda doc: Recipe(**doc).to_json(),
+    )
+
+
+# User Recipes
+
+
+@app.get("/api/recipes/user", name="list_user_recipes")
+async def list_user_recipes(
+    request: Request,
+    page: int = 1,
+    after: str | None = None,
+    identity: str = Depends(jwt_identity()),
+):
+    per_page = 30  # A const value.
+    users = request.app.state.db.users
+    user_id = ObjectId(identity)
+
+    if after is not None:
+        after_values = decode_after(after, USER_RECIPE_SORT, USER_RECIPE_SORT_TYPES)
+        pipeline = user_recipes_page_pipeline(user_id, after_values, 0, per_page + 1)
+        docs = await aggregate(users, pipeline)
+        raws = KeysetPage(page_user_recipes(docs), per_page, USER_RECIPE_SORT)
+        user_recipes = [user_recipe_json(raw) for raw in raws]
+        links = keyset_links(
+            href(request, "list_user_recipes"), after, raws.next_after()
+        )
+        return FastJSONResponse({"user_recipes": user_recipes, "_links": links})
+
+    docs = await aggregate(
+        users,
+        user_recipes_page_pipeline(user_id, None, per_page * (page - 1), per_page),
+    )
+    links = page_links(
+        href(request, "list_user_recipes"),
+        page,
+        last_page(user_recipes_total(docs), per_page),
+    )
+    return FastJSONResponse(
+        {
+            "user_recipes": [user_recipe_json(raw) for raw in page_user_recipes(docs)],
+            "_links": links,
+        }
+    )
+
+
+@app.get("/api/recipes/user/count", name="user_recipes_count")
+async def user_recipes_count(request: Request, identity: str = Depends(jwt_identity())):
+    recipe_counts = await arun_steps(
+        request.app.state.db.users, user_recipe_counts(ObjectId(identity))
+    )
+    return FastJSONResponse({"count": recipe_counts.total, **recipe_counts.to_json()})
+
+
+@app.get("/api/recipes/user/{recipe_id}", name="get_or_create_user_recipe")
+async def get_or_create_user_recipe(
+    request: Request, recipe_id: str, identity: str = Depends(jwt_identity())
+):
+    db = request.app.state.db
+    search_user = {
+        "_id": ObjectId(identity),
+        "recipes": {"$elemMatch": {"recipe_id": ObjectId(recipe_id)}},
+    }
+    user = await db.users.find_one(search_user, {"recipes.$": 1})
+    if user is not None:
+        return FastJSONResponse(user_recipe_json(user["recipes"][0]))
+    recipe = await db.recipes.find_one({"_id": ObjectId(recipe_id)})
+    user_recipe = created_user_recipe(ObjectId(recipe_id), recipe)
+    user_id = ObjectId(identity)
+    search_dict, update = push_update(user_id, user_recipe.to_bson())
+    result = await arun_steps(db.users, counted_update(user_id, search_dict, update))
+    if result.matched_count == 0:
+        user = await db.users.find_one(search_user, {"recipes.$": 1})
+        if user is not None:
+            return FastJSONResponse(user_recipe_json(user["recipes"][0]))
+    return FastJSONResponse(user_recipe.to_json(), 201)
+
+
+@app.put("/api/recipes/user/{recipe_id}", name="update_user_recipe")
+async def update_user_recipe(
+    request: Request, recipe_id: str, identity: str = Depends(jwt_identity())
+):
+    user_recipe_raw = await request.json()
+    update_dict, error = user_recipe_update(user_recipe_raw)
+    if error is not None:
+        return Response(error, status_code=400)
+    original_user = await arun_steps(
+        request.app.state.db.users,
+        apply_first(
+            set_updates(ObjectId(identity), ObjectId(recipe_id), update_dict),
+            projection={"recipes.$": 1},
+        ),
+    )
+    if not original_user:
+        return Response("User Recipe not found", status_code=404)
+    user_recipe = updated_user_recipe(
+        original_user["recipes"][0], user_recipe_raw, update_dict
+    )
+    return FastJSONResponse(user_recipe.to_json())
+
+
+@app.delete("/api/recipes/user/{recipe_id}", name="delete_user_recipe")
+async def delete_user_recipe(
+    request: Request, recipe_id: str, identity: str = Depends(jwt_identity())
+):
+    user_recipe, deleted = await arun_steps(
+        request.app.state.db.users,
+        pull_user_recipe(ObjectId(identity), ObjectId(recipe_id)),
+    )
+    if user_recipe is None:
+        return Response("User Recipe not found", status_code=404)
+    if not deleted:
+        return Response(
+            "User Recipe changed while deleting it, try again", status_code=409
+        )
+    return FastJSONResponse(user_recipe_json(user_recipe))
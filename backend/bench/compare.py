@@ -0,0 +1,60 @@
+"""
+bench/compare - Load the Flask and ASGI deployments side by side.
+
+Start both against the same database, e.g.:
+
+    uv run gunicorn -w 4 -b 127.0.0.1:8000 app:app
+    uv run --with uvicorn uvicorn asgi:app --workers 4 --port 8001
+
+and then drive the same paths at each in turn:
+
+    uv run -m bench.compare -c 256 -d 20
+"""
+
+import argparse
+
+from bench.load import run
+
+DEFAULT_PATHS = [
+    "/api/recipes",
+    "/api/recipes?page=5",
+    "/api/recipes/count",
+    "/api/cookbooks",
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Compare p50/p99 latency of the Flask and ASGI deployments."
+    )
+    parser.add_argument(
+        "--flask", type=str, default="http://127.0.0.1:8000", help="Flask base URL."
+    )
+    parser.add_argument(
+        "--asgi", type=str, default="http://127.0.0.1:8001", help="ASGI base URL."
+    )
+    parser.add_argument(
+        "--path",
+        type=str,
+        action="append",
+        help="Path to GET. Repeat for several. Defaults to a few list routes.",
+    )
+    parser.add_argument(
+        "-c", "--concurrency", type=int, default=256, help="Concurrent clients."
+    )
+    parser.add_argument(
+        "-d", "--duration", type=float, default=20.0, help="Seconds per run."
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    print(f"{'path':<32} {'server':<6} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} errors")
+    for path in args.path or DEFAULT_PATHS:
+        for server, base in (("flask", args.flask), ("asgi", args.asgi)):
+            result = run(base + path, args.concurrency, args.duration)
+            print(
+                f"{path:<32} {server:<6} {result['rps']:>8.1f} "
+                f"{result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['errors']}"
+            )
@@ -0,0 +1,191 @@
+"""
+bench/extraction - Check the rate limiting and retries of
+``process.extraction`` against the stand-in server of ``bench.mock_openai``.
+
+Extracts ``--images`` copies of a made-up page while the server throttles,
+fails and rejects a share of the requests. The limiter and the backoff run on
+a fake clock, so their waits take no time. Then it checks that:
+
+    every reservation was settled (success) or refunded (failure) once
+    the settled tokens are the usage the server reported
+    the requests kept within ``--rpm`` of fake time
+    every backoff stayed within its exponential bound
+
+and exits non-zero if not:
+
+    uv run -m bench.extraction --images 200 --rate-limited 0.2 --bad-requests 0.05
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+from PIL import Image
+
+from bench.mock_openai import COMPLETION_TOKENS, PROMPT_TOKENS, MockOpenAI
+from process.ai_processor import create_client
+from process.extraction import RateLimiter, extract_all
+from process.model import RecipeImage
+
+
+class FakeClock:
+    """A clock that only moves when slept on, by at least a millisecond as a
+    real sleep would: the limiter's last sliver of a wait may otherwise be too
+    small to move it at all."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self) -> float:
+        with self._lock:
+            return self.now
+
+    def sleep(self, seconds: float) -> None:
+        with self._lock:
+            self.now += max(0.001, seconds)
+
+
+class AuditedLimiter(RateLimiter):
+    """Counts what passes through the limiter's accounting."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.audit_lock = threading.Lock()
+        self.acquired = 0
+        self.settled = 0
+        self.settled_tokens = 0
+        self.refunded = 0
+        self.first = None
+        self.last = None
+
+    def acquire(self) -> int:
+        reserved = super().acquire()
+        with self.audit_lock:
+            self.acquired += 1
+            now = self._clock()
+            self.first = now if self.first is None else self.first
+            self.last = now
+        return reserved
+
+    def settle(self, reserved: int, used: int) -> None:
+        super().settle(reserved, used)
+        with self.audit_lock:
+            self.settled += 1
+            self.settled_tokens += used
+
+    def refund(self, reserved: int) -> None:
+        super().refund(reserved)
+        with self.audit_lock:
+            self.refunded += 1
+
+
+def check(name: str, ok: bool, detail: str) -> bool:
+    print(f"{'ok' if ok else 'FAILED'}: {name} ({detail})")
+    return ok
+
+
+def main(args) -> int:
+    server = MockOpenAI(
+        ("127.0.0.1", 0),
+        latency=0.0,
+        rate_limited=args.rate_limited,
+        server_errors=args.server_errors,
+        retry_after=args.retry_after,
+        seed=args.seed,
+        bad_requests=args.bad_requests,
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+    client = create_client("mock", max_retries=0)
+
+    clock = FakeClock()
+    limiter = AuditedLimiter(args.rpm, args.tpm, clock=clock, sleep=clock.sleep)
+    backoffs = []
+
+    def backoff_sleep(seconds: float) -> None:
+        backoffs.append(seconds)
+        clock.sleep(seconds)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "page.jpg"
+        Image.new("RGB", (64, 64), "white").save(path)
+        images = [RecipeImage(path, "bench", ".jpg") for _ in range(args.images)]
+        results = list(
+            extract_all(
+                client,
+                images,
+                limiter,
+                args.concurrency,
+                max_retries=args.max_retries,
+                max_delay=args.max_delay,
+                sleep=backoff_sleep,
+            )
+        )
+    server.shutdown()
+    server.server_close()
+
+    extracted = sum(extraction is not None for _, extraction in results)
+    failed = server.served["429"] + server.served["500"] + server.served["400"]
+    elapsed = (limiter.last or 0.0) - (limiter.first or 0.0)
+    allowed = args.rpm + args.rpm * elapsed / 60
+    print(
+        f"{extracted}/{len(results)} extracted, served {server.served}, "
+        f"{elapsed:.0f} fake seconds"
+    )
+    checks = [
+        check(
+            "every reservation settled or refunded",
+            limiter.acquired == limiter.settled + limiter.refunded,
+            f"{limiter.acquired} acquired, {limiter.settled} settled, "
+            f"{limiter.refunded} refunded",
+        ),
+        check(
+            "successes settled, failures refunded",
+            limiter.settled == server.served["ok"] == extracted
+            and limiter.refunded == failed,
+            f"{server.served['ok']} ok, {failed} failed",
+        ),
+        check(
+            "settled tokens are the reported usage",
+            limiter.settled_tokens == extracted * (PROMPT_TOKENS + COMPLETION_TOKENS),
+            f"{limiter.settled_tokens} tokens",
+        ),
+        check(
+            "requests within the rpm",
+            limiter.acquired <= allowed,
+            f"{limiter.acquired} requests, at most {allowed:.0f}",
+        ),
+        check(
+            "backoffs within their bound",
+            all(0 <= delay <= args.max_delay for delay in backoffs),
+            f"{len(backoffs)} backoffs, longest "
+            f"{max(backoffs, default=0):.1f}s of {args.max_delay}s",
+        ),
+    ]
+    return 0 if all(checks) else 1
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Check the extraction rate limiter and retries on a mock API."
+    )
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rpm", type=int, default=60)
+    parser.add_argument("--tpm", type=int, default=500_000)
+    parser.add_argument("--max-retries", type=int, default=6)
+    parser.add_argument("--max-delay", type=float, default=8.0)
+    parser.add_argument("--rate-limited", type=float, default=0.2)
+    parser.add_argument("--server-errors", type=float, default=0.1)
+    parser.add_argument("--bad-requests", type=float, default=0.05)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0, help="Failure draw seed.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
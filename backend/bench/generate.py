@@ -0,0 +1,360 @@
+"""
+bench/generate - Synthetic cookbooks, recipes and users at realistic scale.
+
+Fills a database with documents that validate against the API's models,
+deterministically from a seed: the same arguments always produce the same
+documents, ``_id`` values included (only the password salts differ). Sizes are skewed the way real data is:
+
+- a few cookbooks hold most of the recipes (``--cookbook-skew``);
+- a few ingredients appear in most recipes (``--ingredient-skew``);
+- most users save a few recipes, and a few save thousands
+  (``--user-skew``), mostly the same popular ones (``--saved-skew``).
+
+Every user's password is ``--password``. Load into a scratch database with:
+
+    uv run -m bench.generate --db cookbooks_scale --recipes 50000 --users 500
+"""
+
+import argparse
+import bisect
+import datetime as dt
+import itertools
+import os
+import random
+import time
+from collections.abc import Iterable, Iterator
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from pymongo.database import Database
+
+from api.cookbooks.model import Cookbook
+from api.passwords import hasher
+from api.recipes.model import Recipe
+from api.sampling import RANDOM_KEY
+from api.users.model import User, UserRecipeCounts, UserRecipeStatus
+
+AISLES = {
+    "meat": [
+        "chicken thighs", "chicken breast", "ground beef", "pork shoulder",
+        "bacon", "lamb shoulder", "chorizo", "pancetta", "flank steak",
+        "italian sausage", "duck breast", "ground turkey", "short ribs", "ham",
+    ],
+    "produce": [
+        "onion", "garlic", "lemon", "lime", "carrot", "celery", "potato",
+        "tomato", "red bell pepper", "spinach", "kale", "scallion", "ginger",
+        "cilantro", "parsley", "basil", "shallot", "zucchini", "mushroom",
+        "avocado", "jalapeno", "cabbage", "sweet potato", "cucumber", "thyme",
+        "rosemary", "leek", "eggplant", "broccoli", "cauliflower", "fennel",
+    ],
+    "seafood": [
+        "shrimp", "salmon", "cod", "mussels", "clams", "scallops", "tuna",
+        "anchovies", "halibut", "crab",
+    ],
+    "pantry": [
+        "olive oil", "salt", "black pepper", "flour", "sugar", "rice",
+        "soy sauce", "chicken stock", "canned tomatoes", "cumin", "paprika",
+        "honey", "dijon mustard", "red wine vinegar", "chickpeas", "pasta",
+        "coconut milk", "fish sauce", "sesame oil", "breadcrumbs", "lentils",
+        "oregano", "chili flakes", "baking powder", "brown sugar", "tahini",
+    ],
+    "dairy": [
+        "butter", "eggs", "parmesan", "heavy cream", "milk", "feta",
+        "greek yogurt", "mozzarella", "cheddar", "ricotta", "sour cream",
+    ],
+    "seafood_and_meat": ["fish stock", "oyster sauce", "shrimp paste", "dashi"],
+    "frozen": ["peas", "corn", "puff pastry", "edamame", "spinach"],
+    "other": ["white wine", "red wine", "beer", "bread", "tortillas", "miso"],
+}
+DISH_STYLES = [
+    "roasted", "braised", "grilled", "crispy", "spicy", "slow-cooked",
+    "pan-seared", "smoky", "creamy", "lemony", "sticky", "herbed", "baked",
+]
+DISH_KINDS = [
+    "stew", "salad", "tacos", "pasta", "curry", "soup", "skewers", "tart",
+    "risotto", "noodles", "gratin", "sandwiches", "traybake", "fritters",
+]
+METHODS = [
+    "Heat the oil over medium-high heat.",
+    "Season generously with salt and pepper.",
+    "Cook, stirring occasionally, until golden.",
+    "Simmer gently until tender.",
+    "Whisk together until smooth.",
+    "Roast until browned and cooked through.",
+    "Toss everything together and taste for seasoning.",
+    "Rest for five minutes before serving.",
+]
+EPOCH = dt.datetime(2023, 1, 1)
+BATCH_SIZE = 1000
+
+
+def email(i: int) -> str:
+    """The ``i``-th generated user's email."""
+    return f"user-{i:05d}@example.com"
+
+
+def zipf_cum_weights(n: int, skew: float) -> list[float]:
+    """Cumulative weights of ranks 1..n, proportional to ``1 / rank**skew``."""
+    return list(itertools.accumulate(1 / (rank + 1) ** skew for rank in range(n)))
+
+
+class Generator:
+    def __init__(
+        self,
+        seed: int,
+        cookbook_skew: float = 1.0,
+        ingredient_skew: float = 1.0,
+        user_skew: float = 1.2,
+        saved_skew: float = 0.8,
+    ) -> None:
+        self.rng = random.Random(seed)
+        self.cookbook_skew = cookbook_skew
+        self.ingredient_skew = ingredient_skew
+        self.user_skew = user_skew
+        self.saved_skew = saved_skew
+        self._ingredient_weights = {
+            aisle: zipf_cum_weights(len(names), ingredient_skew)
+            for aisle, names in AISLES.items()
+        }
+
+    def object_id(self) -> ObjectId:
+        return ObjectId(self.rng.randbytes(12))
+
+    def datetime(self) -> dt.datetime:
+        return EPOCH + dt.timedelta(seconds=self.rng.randrange(2 * 365 * 86400))
+
+    def cookbooks(self, n: int) -> list[dict]:
+        return [
+            Cookbook(
+                _id=self.object_id(),
+                key=f"cookbook-{i:04d}",
+                name=f"{self.rng.choice(DISH_STYLES).title()} Kitchen, Vol. {i + 1}",
+                author=f"Author {self.rng.randrange(n * 2)}",
+            ).to_bson()
+            for i in range(n)
+        ]
+
+    def _ingredients(self) -> dict[str, list[str]]:
+        ingredients = {}
+        for aisle, names in AISLES.items():
+            # Most recipes use produce and pantry staples, fewer the rest.
+            count = self.rng.choices([0, 1, 2, 3, 4], [4, 3, 2, 1, 1])[0]
+            if aisle in ("produce", "pantry"):
+                count += 2
+            picked = self.rng.choices(
+                names, cum_weights=self._ingredient_weights[aisle], k=count
+            )
+            ingredients[aisle] = list(dict.fromkeys(picked))
+        return ingredients
+
+    def recipe(self, cookbook_key: str, page_number: int) -> dict:
+        ingredients = self._ingredients()
+        main = next(
+            (ingredients[aisle][0] for aisle in ("meat", "seafood") if ingredients[aisle]),
+            ingredients["produce"][0],
+        )
+        doc = Recipe(
+            _id=self.object_id(),
+            cookbook_key=cookbook_key,
+            name_of_dish=(
+                f"{self.rng.choice(DISH_STYLES).title()} {main} "
+                f"{self.rng.choice(DISH_KINDS)}"
+            ),
+            serving_size=str(self.rng.choice([2, 4, 4, 6, 8])),
+            page_number=page_number,
+            ingredients=ingredients,
+            instructions=[
+                {
+                    "step": f"Step {step + 1}",
+                    "details": self.rng.sample(METHODS, self.rng.randint(1, 3)),
+                }
+                for step in range(self.rng.randint(3, 8))
+            ],
+        ).to_bson()
+        doc[RANDOM_KEY] = self.rng.random()
+        return doc
+
+    def recipes(self, cookbooks: list[dict], n: int) -> Iterator[dict]:
+        """``n`` recipes over ``cookbooks``, the first ones holding the most."""
+        weights = zipf_cum_weights(len(cookbooks), self.cookbook_skew)
+        pages = {cookbook["key"]: 0 for cookbook in cookbooks}
+        for _ in range(n):
+            key = self.rng.choices(cookbooks, cum_weights=weights)[0]["key"]
+            pages[key] += self.rng.randint(1, 3)
+            yield self.recipe(key, pages[key])
+
+    def users(
+        self,
+        recipes: list[tuple[ObjectId, str]],
+        n: int,
+        min_saved: int,
+        max_saved: int,
+        password_hash: str,
+    ) -> Iterator[dict]:
+        """``n`` users, saving Pareto-distributed numbers of ``recipes``.
+
+        ``recipes`` are ``(_id, cookbook_key)`` pairs, most popular first.
+        """
+        weights = zipf_cum_weights(len(recipes), self.saved_skew)
+        total = weights[-1]
+        for i in range(n):
+            saved = min(
+                max_saved,
+                len(recipes),
+                int(min_saved * self.rng.paretovariate(self.user_skew)),
+            )
+            picked: dict[int, None] = {}
+            while len(picked) < saved:
+                index = bisect.bisect_left(weights, self.rng.random() * total)
+                picked[min(index, len(recipes) - 1)] = None
+            user_recipes = []
+            for index in picked:
+                recipe_id, cookbook_key = recipes[index]
+                created_at = self.datetime()
+                status = self.rng.choice(list(UserRecipeStatus))
+                user_recipe = {
+                    "cookbook_key": cookbook_key,
+                    "recipe_id": recipe_id,
+                    "created_at": created_at,
+                    "updated_at": created_at,
+                    "status": status.value,
+                }
+                if status == UserRecipeStatus.cooked and self.rng.random() < 0.5:
+                    user_recipe["rating"] = self.rng.randint(1, 10)
+                user_recipes.append(user_recipe)
+            yield User(
+                _id=self.object_id(),
+                email=email(i),
+                password=password_hash,
+                first_name=f"First{i}",
+                last_name=f"Last{i}",
+                recipes=user_recipes,
+                recipe_counts=UserRecipeCounts.of(user_recipes),
+            ).to_bson()
+
+
+def insert_batches(collection, docs: Iterable[dict]) -> int:
+    inserted = 0
+    docs = iter(docs)
+    while batch := list(itertools.islice(docs, BATCH_SIZE)):
+        collection.insert_many(batch, ordered=False)
+        inserted += len(batch)
+    return inserted
+
+
+def load(
+    db: Database,
+    seed: int = 0,
+    cookbooks: int = 100,
+    recipes: int = 20000,
+    users: int = 200,
+    min_saved: int = 10,
+    max_saved: int = 5000,
+    password: str = "password",
+    **skews: float,
+) -> dict[str, int]:
+    """Generate and insert every document. Returns how many of each."""
+    generator = Generator(seed, **skews)
+    cookbook_docs = generator.cookbooks(cookbooks)
+    insert_batches(db.cookbooks, cookbook_docs)
+    recipe_ids = []
+
+    def tracked(docs: Iterator[dict]) -> Iterator[dict]:
+        for doc in docs:
+            recipe_ids.append((doc["_id"], doc["cookbook_key"]))
+            yield doc
+
+    recipe_count = insert_batches(
+        db.recipes, tracked(generator.recipes(cookbook_docs, recipes))
+    )
+    # Hashed once: every user has the same password, and bcrypt is slow.
+    password_hash = hasher.hash(password)
+    # Which recipes are popular is independent of when they were generated.
+    generator.rng.shuffle(recipe_ids)
+    user_count = insert_batches(
+        db.users,
+        generator.users(recipe_ids, users, min_saved, max_saved, password_hash),
+    )
+    return {"cookbooks": cookbooks, "recipes": recipe_count, "users": user_count}
+
+
+def main(args) -> None:
+    load_dotenv()
+    client = MongoClient(os.environ.get("COOKBOOKS_CONNECTION_STRING"))
+    if args.drop:
+        client.drop_database(args.db)
+    start = time.perf_counter()
+    counts = load(
+        client[args.db],
+        seed=args.seed,
+        cookbooks=args.cookbooks,
+        recipes=args.recipes,
+        users=args.users,
+        min_saved=args.min_saved,
+        max_saved=args.max_saved,
+        password=args.password,
+        cookbook_skew=args.cookbook_skew,
+        ingredient_skew=args.ingredient_skew,
+        user_skew=args.user_skew,
+        saved_skew=args.saved_skew,
+    )
+    print(
+        f"Inserted {counts['cookbooks']} cookbooks, {counts['recipes']} recipes and "
+        f"{counts['users']} users into {args.db} in "
+        f"{time.perf_counter() - start:.1f} s"
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Fill a database with deterministic synthetic data."
+    )
+    parser.add_argument(
+        "--db", type=str, required=True, help="Database to fill (not the app's!)."
+    )
+    parser.add_argument(
+        "--drop", action="store_true", default=False, help="Drop the database first."
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+    parser.add_argument("--cookbooks", type=int, default=100, help="Cookbooks.")
+    parser.add_argument("--recipes", type=int, default=20000, help="Recipes.")
+    parser.add_argument("--users", type=int, default=200, help="Users.")
+    parser.add_argument(
+        "--min-saved", type=int, default=10, help="Fewest recipes a user saves."
+    )
+    parser.add_argument(
+        "--max-saved", type=int, default=5000, help="Most recipes a user saves."
+    )
+    parser.add_argument(
+        "--password", type=str, default="password", help="Every user's password."
+    )
+    parser.add_argument(
+        "--cookbook-skew",
+        type=float,
+        default=1.0,
+        help="Zipf exponent of recipes per cookbook. 0 spreads them evenly.",
+    )
+    parser.add_argument(
+        "--ingredient-skew",
+        type=float,
+        default=1.0,
+        help="Zipf exponent of how often each ingredient is used.",
+    )
+    parser.add_argument(
+        "--user-skew",
+        type=float,
+        default=1.2,
+        help="Pareto shape of recipes saved per user. Lower is more skewed.",
+    )
+    parser.add_argument(
+        "--saved-skew",
+        type=float,
+        default=0.8,
+        help="Zipf exponent of how popular each recipe is with users.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_args())
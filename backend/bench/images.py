@@ -0,0 +1,130 @@
+"""
+bench/images - Request size, image tokens and time of sending a directory of
+cookbook photos as they are, against normalized (see
+``process.image_preprocessor.ImageNormalizer``) in a few settings.
+
+For each setting it builds every image's chat completions request, and with
+``--extract`` also sends them, to ``OPENAI_BASE_URL`` if set (e.g. the
+stand-in server of ``bench.mock_openai``):
+
+    uv run -m bench.images --images-dir ~/photos/salt --extract
+"""
+
+import argparse
+import json
+import math
+import os
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+from PIL import Image
+
+from process.ai_processor import create_client, recipe_request_body
+from process.extraction import RateLimiter, extract_all
+from process.image_preprocessor import HEIF_SUFFIXES, ImageNormalizer
+from process.model import RecipeImage
+
+VARIANTS = {
+    "original": None,
+    "jpeg 2048": {"max_edge": 2048},
+    "webp 2048": {"max_edge": 2048, "image_format": "webp"},
+    "jpeg 2048 gray": {"max_edge": 2048, "grayscale": True},
+    "jpeg 1024": {"max_edge": 1024},
+}
+# gpt-4o-mini's price of a high detail image: a base plus each 512 px tile,
+# once fit within 2048x2048 and shrunk to a 768 px short side.
+BASE_TOKENS = 2833
+TILE_TOKENS = 5667
+
+
+def image_tokens(width: int, height: int) -> int:
+    scale = min(1.0, 2048 / max(width, height))
+    scale *= min(1.0, 768 / (min(width, height) * scale))
+    tiles = math.ceil(width * scale / 512) * math.ceil(height * scale / 512)
+    return BASE_TOKENS + TILE_TOKENS * tiles
+
+
+def sample_images(images_directory: Path, normalizer) -> list[RecipeImage]:
+    return [
+        RecipeImage(path, "bench", path.suffix.lower(), normalizer)
+        for path in sorted(images_directory.iterdir())
+        if not path.name.startswith(".")
+        and (normalizer is not None or path.suffix.lower() not in HEIF_SUFFIXES)
+    ]
+
+
+def sent_size(image: RecipeImage) -> tuple[int, int]:
+    with Image.open(image.filepath) as original:
+        width, height = original.size
+    if image.normalizer is None:
+        return width, height
+    scale = min(1.0, image.normalizer.max_edge / max(width, height))
+    return round(width * scale), round(height * scale)
+
+
+def measure(images: list[RecipeImage]) -> tuple[int, float, int]:
+    """Total request bytes, seconds to build the requests, and image tokens."""
+    payload = 0
+    start = time.perf_counter()
+    for image in images:
+        payload += len(json.dumps(recipe_request_body(image)))
+    seconds = time.perf_counter() - start
+    tokens = sum(image_tokens(*sent_size(image)) for image in images)
+    return payload, seconds, tokens
+
+
+def main(args) -> None:
+    load_dotenv()
+    images_directory = Path(args.images_dir)
+    client = None
+    if args.extract:
+        client = create_client(os.environ.get("OPENAI_API_KEY"), max_retries=0)
+    for name, options in VARIANTS.items():
+        normalizer = None if options is None else ImageNormalizer(**options)
+        images = sample_images(images_directory, normalizer)
+        if not images:
+            print(f"{name}: no images")
+            continue
+        payload, seconds, tokens = measure(images)
+        line = (
+            f"{name}: {len(images)} images, requests {payload / 1e6:.1f} MB "
+            f"({payload / len(images) / 1e3:.0f} KB each), built in "
+            f"{seconds:.2f} s, ~{tokens // len(images)} image tokens each"
+        )
+        if client is not None:
+            limiter = RateLimiter(args.rpm, args.tpm)
+            start = time.perf_counter()
+            failed = sum(
+                extraction is None
+                for _, extraction in extract_all(
+                    client, images, limiter, args.concurrency
+                )
+            )
+            line += f", extracted in {time.perf_counter() - start:.2f} s"
+            if failed:
+                line += f" ({failed} failed)"
+        print(line)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Compare sending cookbook photos as they are and normalized."
+    )
+    parser.add_argument(
+        "--images-dir", type=str, required=True, help="A sample of page photos."
+    )
+    parser.add_argument(
+        "--extract",
+        action="store_true",
+        default=False,
+        help="Also time extracting the images (OPENAI_BASE_URL for a stand-in).",
+    )
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rpm", type=int, default=500)
+    parser.add_argument("--tpm", type=int, default=200_000)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_args())
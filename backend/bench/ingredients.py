@@ -0,0 +1,105 @@
+"""
+bench/ingredients - Latency of "cook with what I have" queries on the
+ingredient index, against ``$regex`` scans for the same ingredients.
+
+Fills a scratch database next to the one in ``.env`` with generated recipes
+(see ``bench.generate``), and drops it afterwards:
+
+    uv run -m bench.ingredients --recipes 100000 --missing 2
+"""
+
+import argparse
+import os
+import re
+import statistics
+import time
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+from api.indexes import INGREDIENT_AISLES
+from api.ingredients import IngredientIndex, PROJECTION, bits
+from api.recipes.views import RECIPE_SORT
+from bench import generate
+
+PANTRIES = [
+    ["chicken", "lemon", "rice"],
+    ["salmon", "garlic", "spinach", "butter"],
+    ["ground beef", "onion", "tomato", "pasta", "parmesan"],
+    ["egg", "flour", "sugar", "milk", "butter", "honey"],
+]
+
+
+def timed(fn, trials: int) -> float:
+    latencies = []
+    for _ in range(trials):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies) * 1000
+
+
+def regex_filter(have: list[str]) -> dict:
+    return {
+        "$or": [
+            {f"ingredients.{aisle}": {"$regex": re.escape(item), "$options": "i"}}
+            for item in have
+            for aisle in INGREDIENT_AISLES
+        ]
+    }
+
+
+def main(recipes: int, max_missing: int, trials: int, seed: int) -> None:
+    load_dotenv()
+    client = MongoClient(os.environ.get("COOKBOOKS_CONNECTION_STRING"))
+    db_name = f"{os.environ.get('COOKBOOKS_DB_NAME')}_bench_ingredients"
+    client.drop_database(db_name)
+    db = client[db_name]
+    try:
+        generate.load(db, seed=seed, cookbooks=200, recipes=recipes, users=0)
+        start = time.perf_counter()
+        index = IngredientIndex(db.recipes.find({}, PROJECTION).sort(RECIPE_SORT))
+        print(
+            f"{recipes} recipes, {len(index.terms)} terms: index built in "
+            f"{time.perf_counter() - start:.2f} s"
+        )
+        for have in PANTRIES:
+
+            def query():
+                covered = index.covered(have)
+                by_missing = index.missing(covered, max_missing, index.all)
+                return [number for bitset in by_missing for number in bits(bitset)]
+
+            matches = len(query())
+            index_ms = timed(query, trials)
+            regex_ms = timed(
+                lambda: list(db.recipes.find(regex_filter(have), PROJECTION)),
+                max(1, trials // 10),
+            )
+            print(
+                f"  {', '.join(have)}: {matches} recipes missing at most "
+                f"{max_missing}, index {index_ms:.2f} ms, "
+                f"$regex candidates {regex_ms:.2f} ms"
+            )
+    finally:
+        client.drop_database(db_name)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Time ingredient index queries against $regex scans."
+    )
+    parser.add_argument(
+        "--recipes", type=int, default=100_000, help="Recipes to generate."
+    )
+    parser.add_argument(
+        "--missing", type=int, default=2, help="Most missing ingredients."
+    )
+    parser.add_argument("--trials", type=int, default=100, help="Runs per query.")
+    parser.add_argument("--seed", type=int, default=0, help="Data generator seed.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args.recipes, args.missing, args.trials, args.seed)
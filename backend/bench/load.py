@@ -0,0 +1,116 @@
+"""
+bench/load - A small closed-loop HTTP load generator for the API.
+
+Start the API (e.g. ``uv run gunicorn -w 4 app:app``) and then run:
+
+    uv run -m bench.load --url http://127.0.0.1:8000/api/recipes -c 32 -d 20
+
+Run it once per commit to compare requests per second before and after.
+``bench.compare``, ``bench.login`` and ``bench.suite`` drive their own mixes of
+requests with :func:`drive` and report them with :func:`summary`.
+"""
+
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.request
+from collections.abc import Callable
+
+# What a client sends next: a name to report it under, and the request.
+Draw = Callable[[], tuple[str, urllib.request.Request]]
+
+
+def post_json(url: str, body: dict) -> urllib.request.Request:
+    return urllib.request.Request(
+        url,
+        data=json.dumps(body).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+
+
+def drive(
+    client: Callable[[int], Draw], concurrency: int, duration: float
+) -> tuple[dict[str, list[float]], dict[str, int], float]:
+    """
+    Run ``concurrency`` clients, each sending the requests drawn by
+    ``client(i)`` one after another until ``duration`` seconds are up. Return
+    the latencies and errors of each name, and the seconds it took.
+    """
+    latencies: dict[str, list[float]] = {}
+    errors: dict[str, int] = {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(i: int) -> None:
+        draw = client(i)
+        while time.perf_counter() < deadline:
+            name, req = draw()
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(req) as response:
+                    response.read()
+            except Exception:
+                with lock:
+                    errors[name] = errors.get(name, 0) + 1
+                continue
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.setdefault(name, []).append(elapsed)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - started
+
+
+def summary(latencies: list[float], errors: int, elapsed: float) -> dict:
+    quantiles = (
+        statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [0.0] * 99
+    )
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(quantiles[49] * 1000, 3),
+        "p90_ms": round(quantiles[89] * 1000, 3),
+        "p99_ms": round(quantiles[98] * 1000, 3),
+    }
+
+
+def describe(result: dict) -> str:
+    return (
+        f"{result['requests']} requests, {result['errors']} errors, "
+        f"{result['rps']:.1f} req/s, p50 {result['p50_ms']:.1f} ms, "
+        f"p99 {result['p99_ms']:.1f} ms"
+    )
+
+
+def run(url: str, concurrency: int, duration: float) -> dict:
+    """GET ``url`` from ``concurrency`` clients for ``duration`` seconds."""
+    latencies, errors, elapsed = drive(
+        lambda i: lambda: ("get", urllib.request.Request(url)), concurrency, duration
+    )
+    return summary(latencies.get("get", []), errors.get("get", 0), elapsed)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Closed-loop HTTP load generator.")
+    parser.add_argument("--url", type=str, required=True, help="URL to GET.")
+    parser.add_argument(
+        "-c", "--concurrency", type=int, default=16, help="Concurrent clients."
+    )
+    parser.add_argument(
+        "-d", "--duration", type=float, default=10.0, help="Seconds to run for."
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    print(describe(run(args.url, args.concurrency, args.duration)))
@@ -0,0 +1,64 @@
+"""
+bench/login - Read latency during a burst of logins.
+
+Signs up a throwaway user on the running API, then drives a mix of logins and
+recipe list reads and reports each separately:
+
+    uv run -m bench.login --url http://127.0.0.1:8000 --login-share 0.2 -c 32
+
+Run it with and without the login share, or across commits, to see how much
+bcrypt work slows down the reads.
+"""
+
+import argparse
+import random
+import urllib.request
+import uuid
+
+from bench.load import describe, drive, post_json, summary
+
+
+def main(base: str, login_share: float, concurrency: int, duration: float) -> None:
+    credentials = {"email": f"bench-{uuid.uuid4()}@example.com", "password": "bench"}
+    with urllib.request.urlopen(post_json(f"{base}/api/signup", credentials)):
+        pass
+
+    def client(i: int):
+        rng = random.Random()
+
+        def draw():
+            if rng.random() < login_share:
+                return "login", post_json(f"{base}/api/login", credentials)
+            return "read", urllib.request.Request(f"{base}/api/recipes")
+
+        return draw
+
+    latencies, errors, elapsed = drive(client, concurrency, duration)
+    for name in ("login", "read"):
+        result = summary(latencies.get(name, []), errors.get(name, 0), elapsed)
+        print(f"{name}: {describe(result)}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Mixed login and read load.")
+    parser.add_argument(
+        "--url", type=str, default="http://127.0.0.1:8000", help="API base URL."
+    )
+    parser.add_argument(
+        "--login-share",
+        type=float,
+        default=0.2,
+        help="Fraction of requests that are logins.",
+    )
+    parser.add_argument(
+        "-c", "--concurrency", type=int, default=32, help="Concurrent clients."
+    )
+    parser.add_argument(
+        "-d", "--duration", type=float, default=20.0, help="Seconds to run for."
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args.url, args.login_share, args.concurrency, args.duration)
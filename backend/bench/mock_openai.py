@@ -0,0 +1,372 @@
+"""
+bench/mock_openai - A stand-in for the OpenAI API, to run process_photos.py
+without an API key or spending tokens.
+
+Answers ``/v1/chat/completions`` with a made-up ``RecipeExtraction`` on a new
+page number each time, after ``--latency`` seconds, and fails a share of the
+requests with a 429 (with ``Retry-After``) or a 500 to exercise the retries,
+or a 400, which isn't retried:
+
+    uv run -m bench.mock_openai --port 8100 --latency 2 --rate-limited 0.1
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_KEY=mock \\
+        uv run process_photos.py --images-dir ... --cookbook-key ...
+
+It also takes Batch API uploads and batches (``process_photos.py --batch``).
+A batch is in progress for ``--batch-latency`` seconds, then completes, with
+the failed share of its requests in its error file.
+"""
+
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from process.model import IngredientList, InstructionStep, RecipeExtraction
+
+# A page image costs about this many prompt tokens on gpt-4o-mini.
+PROMPT_TOKENS = 25_000
+COMPLETION_TOKENS = 400
+
+
+class MockOpenAI(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        latency: float = 1.0,
+        rate_limited: float = 0.0,
+        server_errors: float = 0.0,
+        retry_after: float = 1.0,
+        seed: int = 0,
+        batch_latency: float = 5.0,
+        bad_requests: float = 0.0,
+    ) -> None:
+        super().__init__(address, Handler)
+        self.latency = latency
+        self.rate_limited = rate_limited
+        self.server_errors = server_errors
+        self.bad_requests = bad_requests
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.pages = itertools.count(1)
+        self.lock = threading.Lock()
+        self.served = {"ok": 0, "429": 0, "500": 0, "400": 0}
+        self.batch_latency = batch_latency
+        self.ids = itertools.count(1)
+        self.files: dict[str, dict] = {}
+        self.contents: dict[str, bytes] = {}
+        self.batches: dict[str, dict] = {}
+        self.batch_lock = threading.Lock()
+
+    def add_file(self, filename: str, purpose: str, content: bytes) -> dict:
+        with self.lock:
+            file = {
+                "id": f"file-mock{next(self.ids)}",
+                "object": "file",
+                "bytes": len(content),
+                "created_at": int(time.time()),
+                "filename": filename,
+                "purpose": purpose,
+                "status": "processed",
+            }
+            self.files[file["id"]] = file
+            self.contents[file["id"]] = content
+            return file
+
+    def add_batch(self, request: dict) -> dict:
+        with self.lock:
+            batch = {
+                "id": f"batch_mock{next(self.ids)}",
+                "object": "batch",
+                "endpoint": request["endpoint"],
+                "input_file_id": request["input_file_id"],
+                "completion_window": request["completion_window"],
+                "status": "validating",
+                "created_at": int(time.time()),
+                "metadata": request.get("metadata"),
+                "output_file_id": None,
+                "error_file_id": None,
+                "request_counts": {"total": 0, "completed": 0, "failed": 0},
+                "_started": time.monotonic(),
+            }
+            self.batches[batch["id"]] = batch
+            return batch
+
+    def advance(self, batch: dict) -> None:
+        """Move a batch on by how long ago it was created."""
+        with self.batch_lock:
+            elapsed = time.monotonic() - batch["_started"]
+            if batch["status"] == "validating":
+                batch["status"] = "in_progress"
+                batch["in_progress_at"] = int(time.time())
+            elif batch["status"] == "in_progress" and elapsed >= self.batch_latency:
+                self.complete(batch)
+
+    def complete(self, batch: dict) -> None:
+        output, errors = [], []
+        for line in self.contents[batch["input_file_id"]].splitlines():
+            request = json.loads(line)
+            outcome = self.outcome()
+            if outcome == "ok":
+                status, body = (
+                    200,
+                    completion(request["body"].get("model"), self.next_page()),
+                )
+            else:
+                status, body = int(outcome), error("Mock failure", "server_error")
+            result = {
+                "id": f"batch_req_mock{next(self.ids)}",
+                "custom_id": request["custom_id"],
+                "response": {"status_code": status, "body": body},
+                "error": None,
+            }
+            (output if status == 200 else errors).append(json.dumps(result))
+        for lines, field in ((output, "output_file_id"), (errors, "error_file_id")):
+            if lines:
+                content = ("\n".join(lines) + "\n").encode()
+                file = self.add_file(
+                    f"{batch['id']}_{field}.jsonl", "batch_output", content
+                )
+                batch[field] = file["id"]
+        batch["request_counts"] = {
+            "total": len(output) + len(errors),
+            "completed": len(output),
+            "failed": len(errors),
+        }
+        batch["status"] = "completed"
+        batch["completed_at"] = int(time.time())
+
+    def outcome(self) -> str:
+        with self.lock:
+            draw = self.random.random()
+            if draw < self.rate_limited:
+                outcome = "429"
+            elif draw < self.rate_limited + self.server_errors:
+                outcome = "500"
+            elif draw < self.rate_limited + self.server_errors + self.bad_requests:
+                outcome = "400"
+            else:
+                outcome = "ok"
+            self.served[outcome] += 1
+            return outcome
+
+    def next_page(self) -> int:
+        with self.lock:
+            return next(self.pages)
+
+
+def extraction(page_number: int) -> RecipeExtraction:
+    return RecipeExtraction(
+        name_of_dish=f"Mock Recipe {page_number}",
+        serving_size="4",
+        page_number=page_number,
+        ingredients=IngredientList(
+            meat=[],
+            produce=["2 lemons", "1 bunch parsley"],
+            seafood=[],
+            pantry=["1 cup rice"],
+            dairy=["2 tbsp butter"],
+            seafood_and_meat=["1 lb chicken thighs"],
+            frozen=[],
+            other=[],
+        ),
+        instructions=[
+            InstructionStep(step="Cook the rice", details=["Simmer for 18 minutes."]),
+            InstructionStep(step="Roast the chicken", details=["425F, 30 minutes."]),
+        ],
+    )
+
+
+def completion(model: str, page_number: int) -> dict:
+    return {
+        "id": f"chatcmpl-mock{page_number}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {
+                    "role": "assistant",
+                    "content": extraction(page_number).model_dump_json(),
+                    "refusal": None,
+                },
+                "logprobs": None,
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": PROMPT_TOKENS,
+            "completion_tokens": COMPLETION_TOKENS,
+            "total_tokens": PROMPT_TOKENS + COMPLETION_TOKENS,
+        },
+    }
+
+
+def public(batch: dict) -> dict:
+    return {key: value for key, value in batch.items() if not key.startswith("_")}
+
+
+def error(message: str, error_type: str) -> dict:
+    return {"error": {"message": message, "type": error_type, "code": None}}
+
+
+class Handler(BaseHTTPRequestHandler):
+    server: MockOpenAI
+
+    def send_json(self, status: int, body: dict, headers: dict | None = None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def not_found(self):
+        self.send_json(404, error(f"No route {self.path}", "invalid_request"))
+
+    def do_GET(self):
+        parts = self.path.split("?")[0].strip("/").split("/")
+        if parts[:2] == ["v1", "batches"] and len(parts) == 3:
+            batch = self.server.batches.get(parts[2])
+            if batch is None:
+                return self.not_found()
+            self.server.advance(batch)
+            self.send_json(200, public(batch))
+        elif parts[:2] == ["v1", "files"] and parts[3:] == ["content"]:
+            content = self.server.contents.get(parts[2])
+            if content is None:
+                return self.not_found()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        else:
+            self.not_found()
+
+    def do_POST(self):
+        if self.path == "/v1/files":
+            return self.upload()
+        if self.path == "/v1/batches":
+            return self.send_json(200, public(self.server.add_batch(self.read_json())))
+        if self.path != "/v1/chat/completions":
+            return self.not_found()
+        request = self.read_json()
+        time.sleep(self.server.latency)
+        outcome = self.server.outcome()
+        if outcome == "429":
+            self.send_json(
+                429,
+                error("Rate limit reached for requests", "requests"),
+                {"Retry-After": str(self.server.retry_after)},
+            )
+        elif outcome == "500":
+            self.send_json(500, error("The server had an error", "server_error"))
+        elif outcome == "400":
+            self.send_json(400, error("Invalid image", "invalid_request_error"))
+        else:
+            self.send_json(
+                200, completion(request.get("model"), self.server.next_page())
+            )
+
+    def upload(self):
+        length = int(self.headers.get("Content-Length", 0))
+        head = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode()
+        form = BytesParser(policy=HTTP).parsebytes(head + self.rfile.read(length))
+        fields = {
+            part.get_param("name", header="content-disposition"): part
+            for part in form.iter_parts()
+        }
+        file = fields["file"]
+        self.send_json(
+            200,
+            self.server.add_file(
+                file.get_filename(),
+                fields["purpose"].get_content().strip(),
+                file.get_payload(decode=True),
+            ),
+        )
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main(args) -> None:
+    server = MockOpenAI(
+        (args.host, args.port),
+        args.latency,
+        args.rate_limited,
+        args.server_errors,
+        args.retry_after,
+        args.seed,
+        args.batch_latency,
+        args.bad_requests,
+    )
+    print(f"Mock OpenAI API on http://{args.host}:{server.server_port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Served: {server.served}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Serve a stand-in for the OpenAI chat completions API."
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument(
+        "--latency", type=float, default=1.0, help="Seconds per response."
+    )
+    parser.add_argument(
+        "--rate-limited",
+        type=float,
+        default=0.0,
+        help="Share of requests answered with a 429.",
+    )
+    parser.add_argument(
+        "--server-errors",
+        type=float,
+        default=0.0,
+        help="Share of requests answered with a 500.",
+    )
+    parser.add_argument(
+        "--bad-requests",
+        type=float,
+        default=0.0,
+        help="Share of requests answered with a 400.",
+    )
+    parser.add_argument(
+        "--retry-after",
+        type=float,
+        default=1.0,
+        help="Retry-After seconds of a 429.",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Failure draw seed.")
+    parser.add_argument(
+        "--batch-latency",
+        type=float,
+        default=5.0,
+        help="Seconds until a batch completes.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_args())
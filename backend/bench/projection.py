@@ -0,0 +1,69 @@
+"""
+bench/projection - Bytes and latency of a recipe list page, with and without
+the card projection.
+
+Runs against the database in ``.env``:
+
+    uv run -m bench.projection --pages 20
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+from api.recipes.model import RECIPE_CARD_PROJECTION
+from api.recipes.views import RECIPE_SORT
+
+
+def measure(collection, projection, pages: int, per_page: int) -> dict:
+    latencies = []
+    sizes = []
+    for page in range(1, pages + 1):
+        start = time.perf_counter()
+        docs = list(
+            collection.find({}, projection)
+            .sort(RECIPE_SORT)
+            .skip(per_page * (page - 1))
+            .limit(per_page)
+        )
+        latencies.append(time.perf_counter() - start)
+        sizes.append(sum(len(doc.raw) for doc in docs))
+    return {
+        "bytes_per_page": statistics.mean(sizes),
+        "ms_per_page": statistics.mean(latencies) * 1000,
+    }
+
+
+def main(pages: int, per_page: int) -> None:
+    load_dotenv()
+    client = MongoClient(os.environ.get("COOKBOOKS_CONNECTION_STRING"))
+    # Raw documents keep the wire bytes, and skip decoding them.
+    collection = client[os.environ.get("COOKBOOKS_DB_NAME")].get_collection(
+        "recipes", codec_options=CodecOptions(document_class=RawBSONDocument)
+    )
+    for name, projection in (("full", None), ("card", RECIPE_CARD_PROJECTION)):
+        result = measure(collection, projection, pages, per_page)
+        print(
+            f"{name}: {result['bytes_per_page']:.0f} bytes/page, "
+            f"{result['ms_per_page']:.2f} ms/page"
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Compare full and card-projected recipe list pages."
+    )
+    parser.add_argument("--pages", type=int, default=10, help="Pages to fetch.")
+    parser.add_argument("--per-page", type=int, default=30, help="Page size.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args.pages, args.per_page)
@@ -0,0 +1,106 @@
+"""
+bench/sampling - Latency of random recipes, ``$sample`` against the random key
+index, as the collection grows.
+
+Fills a scratch database next to the one in ``.env``, and drops it afterwards:
+
+    uv run -m bench.sampling --sizes 1000 10000 100000 --count 6
+"""
+
+import argparse
+import os
+import random
+import statistics
+import time
+
+from dotenv import load_dotenv
+from pymongo import ASCENDING, IndexModel, MongoClient
+
+from api.recipes.model import RECIPE_CARD_PROJECTION
+from api.sampling import RANDOM_KEY, sample
+
+COOKBOOKS = 20
+
+
+def fake_recipe(i: int) -> dict:
+    return {
+        "cookbook_key": f"cookbook-{i % COOKBOOKS}",
+        "name_of_dish": f"Dish {i}",
+        "serving_size": "4",
+        "page_number": i // COOKBOOKS,
+        "ingredients": {"produce": ["onion"], "pantry": ["salt", "pepper"]},
+        "instructions": [{"step": "Cook", "details": ["Until done."] * 5}],
+        RANDOM_KEY: random.random(),
+    }
+
+
+def timed(fn, trials: int) -> float:
+    latencies = []
+    for _ in range(trials):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies) * 1000
+
+
+def main(sizes: list[int], count: int, trials: int) -> None:
+    load_dotenv()
+    client = MongoClient(os.environ.get("COOKBOOKS_CONNECTION_STRING"))
+    db_name = f"{os.environ.get('COOKBOOKS_DB_NAME')}_bench_sampling"
+    client.drop_database(db_name)
+    recipes = client[db_name].recipes
+    recipes.create_indexes(
+        [
+            IndexModel([(RANDOM_KEY, ASCENDING)]),
+            IndexModel([("cookbook_key", ASCENDING), (RANDOM_KEY, ASCENDING)]),
+        ]
+    )
+    stages = [{"$project": RECIPE_CARD_PROJECTION}]
+    try:
+        inserted = 0
+        for size in sorted(sizes):
+            recipes.insert_many(fake_recipe(i) for i in range(inserted, size))
+            inserted = size
+            sample_ms = timed(
+                lambda: list(
+                    recipes.aggregate([{"$sample": {"size": count}}] + stages)
+                ),
+                trials,
+            )
+            seek_ms = timed(lambda: sample(recipes, {}, count, stages), trials)
+            cookbook_ms = timed(
+                lambda: sample(recipes, {"cookbook_key": "cookbook-0"}, count, stages),
+                trials,
+            )
+            stats = recipes.find({RANDOM_KEY: {"$gte": 0.5}}).sort(
+                RANDOM_KEY, ASCENDING
+            ).limit(count).explain()["executionStats"]
+            print(
+                f"{size} recipes: $sample {sample_ms:.2f} ms, "
+                f"seek {seek_ms:.2f} ms ({stats['totalKeysExamined']} keys, "
+                f"{stats['totalDocsExamined']} docs), "
+                f"seek by cookbook {cookbook_ms:.2f} ms"
+            )
+    finally:
+        client.drop_database(db_name)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Compare $sample with the random key index as recipes grow."
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1_000, 10_000, 100_000],
+        help="Collection sizes to measure at.",
+    )
+    parser.add_argument("--count", type=int, default=6, help="Recipes per sample.")
+    parser.add_argument("--trials", type=int, default=200, help="Samples per size.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args.sizes, args.count, args.trials)
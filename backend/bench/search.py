@@ -0,0 +1,97 @@
+"""
+bench/search - Latency of ranked top-k search against a counted list page.
+
+Fills a scratch database next to the one in ``.env`` with generated recipes
+(see ``bench.generate``), and drops it afterwards. For each query it times
+``search_recipes``' pipeline, and ``list_recipes``' page and count for the same
+query:
+
+    uv run -m bench.search --recipes 100000 --limit 30
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+from api.indexes import ensure_indexes
+from api.recipes.views import recipes_page_pipeline, search_pipeline
+from bench import generate
+
+QUERIES = [
+    "chicken",
+    "garlic",
+    "salmon lemon",
+    "crispy tacos",
+    '"olive oil"',
+    "shallot -butter",
+]
+
+
+def timed(fn, trials: int) -> float:
+    latencies = []
+    for _ in range(trials):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies) * 1000
+
+
+def main(recipes: int, limit: int, trials: int, seed: int) -> None:
+    load_dotenv()
+    client = MongoClient(os.environ.get("COOKBOOKS_CONNECTION_STRING"))
+    db_name = f"{os.environ.get('COOKBOOKS_DB_NAME')}_bench_search"
+    client.drop_database(db_name)
+    db = client[db_name]
+    try:
+        generate.load(db, seed=seed, cookbooks=200, recipes=recipes, users=0)
+        for error in ensure_indexes(db):
+            print(f"Error: {error}")
+        print(f"{recipes} recipes, top {limit}:")
+        for query in QUERIES:
+            search_dict = {"$text": {"$search": query}}
+            search_ms = timed(
+                lambda: list(
+                    db.recipes.aggregate(search_pipeline(search_dict, limit, None))
+                ),
+                trials,
+            )
+            list_ms = timed(
+                lambda: (
+                    list(
+                        db.recipes.aggregate(
+                            recipes_page_pipeline(search_dict, 0, limit, None)
+                        )
+                    ),
+                    db.recipes.count_documents(search_dict),
+                ),
+                trials,
+            )
+            matches = db.recipes.count_documents(search_dict)
+            print(
+                f"  {query}: {matches} matches, search {search_ms:.2f} ms, "
+                f"list and count {list_ms:.2f} ms"
+            )
+    finally:
+        client.drop_database(db_name)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Compare ranked top-k search with a counted list page."
+    )
+    parser.add_argument(
+        "--recipes", type=int, default=100_000, help="Recipes to generate."
+    )
+    parser.add_argument("--limit", type=int, default=30, help="Results per query.")
+    parser.add_argument("--trials", type=int, default=50, help="Runs per query.")
+    parser.add_argument("--seed", type=int, default=0, help="Data generator seed.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args.recipes, args.limit, args.trials, args.seed)
@@ -0,0 +1,355 @@
+"""
+bench/suite - A reproducible load test of the API's hot paths.
+
+Starts a throwaway ``mongod`` (or uses ``--uri``), fills a scratch database
+with :mod:`bench.generate`, serves the app on it with gunicorn and drives a
+weighted mix of the real routes at each concurrency level:
+
+    uv run -m bench.suite -c 8 32 --mix recipes=5,random=2,user=2,login=1
+
+Throughput and latency percentiles, per route and overall, are written to
+``bench/results/<commit>.json`` together with the settings they were measured
+with. Pass an earlier file as ``--baseline`` to print the change against it.
+"""
+
+import argparse
+import contextlib
+import datetime as dt
+import json
+import os
+import random
+import secrets
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+from pathlib import Path
+
+from pymongo import MongoClient
+
+from api.indexes import ensure_indexes
+from bench import generate
+from bench.load import drive, post_json, summary
+
+BACKEND = Path(__file__).resolve().parent.parent
+DB_NAME = "cookbooks_bench"
+PASSWORD = "bench"
+PER_PAGE = 30
+SCENARIOS = ("recipes", "random", "user", "login", "cookbooks", "search")
+SEARCH_TERMS = [name for names in generate.AISLES.values() for name in names]
+DEFAULT_MIX = "recipes=5,random=2,user=2,login=1,cookbooks=1"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(check, timeout: float, what: str) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if check():
+                return
+        except Exception:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {what}")
+
+
+@contextlib.contextmanager
+def mongod(uri: str | None, binary: str):
+    """Yield a connection string: ``uri``, or that of a throwaway mongod."""
+    if uri:
+        yield uri
+        return
+    if shutil.which(binary) is None:
+        raise RuntimeError(f"{binary} not found. Install MongoDB or pass --uri.")
+    port = free_port()
+    with tempfile.TemporaryDirectory() as dbpath:
+        process = subprocess.Popen(
+            [binary, "--dbpath", dbpath, "--port", str(port)],
+            stdout=subprocess.DEVNULL,
+        )
+        uri = f"mongodb://127.0.0.1:{port}/"
+        try:
+            client = MongoClient(uri, serverSelectionTimeoutMS=500)
+            wait_for(lambda: client.admin.command("ping"), 30, "mongod")
+            yield uri
+        finally:
+            process.terminate()
+            process.wait()
+
+
+@contextlib.contextmanager
+def server(uri: str, workers: int, threads: int):
+    """Serve the app with gunicorn on the bench database. Yield its base URL."""
+    port = free_port()
+    env = {
+        **os.environ,
+        "COOKBOOKS_CONNECTION_STRING": uri,
+        "COOKBOOKS_DB_NAME": DB_NAME,
+        "COOKBOOKS_JWT_SECRET_KEY": secrets.token_hex(32),
+    }
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "-w",
+            str(workers),
+            "--threads",
+            str(threads),
+            "-b",
+            f"127.0.0.1:{port}",
+            "app:app",
+        ],
+        cwd=BACKEND,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        wait_for(
+            lambda: urllib.request.urlopen(f"{base}/api/cookbooks/count").status == 200,
+            60,
+            "the app",
+        )
+        yield base
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def login_users(base: str, users: int) -> list[dict]:
+    """Log in every generated user."""
+    accounts = []
+    for i in range(users):
+        credentials = {"email": generate.email(i), "password": PASSWORD}
+        with urllib.request.urlopen(post_json(f"{base}/api/login", credentials)) as r:
+            token = json.load(r)["access_token"]
+        accounts.append({"credentials": credentials, "token": token})
+    return accounts
+
+
+def scenario_request(name: str, base: str, pages: int, account: dict, rng):
+    if name == "recipes":
+        return urllib.request.Request(
+            f"{base}/api/recipes?page={rng.randint(1, pages)}"
+        )
+    if name == "random":
+        return urllib.request.Request(f"{base}/api/recipes/random/6")
+    if name == "user":
+        return urllib.request.Request(
+            f"{base}/api/recipes/user",
+            headers={"Authorization": f"Bearer {account['token']}"},
+        )
+    if name == "login":
+        return post_json(f"{base}/api/login", account["credentials"])
+    if name == "search":
+        query = urllib.parse.quote(rng.choice(SEARCH_TERMS))
+        return urllib.request.Request(f"{base}/api/recipes/search?query={query}")
+    return urllib.request.Request(f"{base}/api/cookbooks")
+
+
+def run_level(
+    base: str,
+    mix: dict[str, int],
+    concurrency: int,
+    duration: float,
+    pages: int,
+    accounts: list[dict],
+    seed: int,
+) -> dict:
+    names = list(mix)
+    weights = [mix[name] for name in names]
+
+    def client(i: int):
+        # Every client draws the same sequence of requests on every run.
+        rng = random.Random(f"{seed}-{concurrency}-{i}")
+        account = accounts[i % len(accounts)]
+
+        def draw():
+            name = rng.choices(names, weights)[0]
+            return name, scenario_request(name, base, pages, account, rng)
+
+        return draw
+
+    latencies, errors, elapsed = drive(client, concurrency, duration)
+    return {
+        "concurrency": concurrency,
+        "routes": {
+            name: summary(latencies.get(name, []), errors.get(name, 0), elapsed)
+            for name in names
+        },
+        "total": summary(
+            [latency for name in names for latency in latencies.get(name, [])],
+            sum(errors.values()),
+            elapsed,
+        ),
+    }
+
+
+def git_commit() -> tuple[str, bool]:
+    def git(*args) -> str:
+        return subprocess.run(
+            ["git", *args], cwd=BACKEND, capture_output=True, text=True
+        ).stdout.strip()
+
+    return git("rev-parse", "--short", "HEAD") or "unknown", bool(git("status", "-s"))
+
+
+def compare(baseline: dict, result: dict) -> None:
+    """Print the change of each level and route against a baseline run."""
+    levels = {level["concurrency"]: level for level in baseline["levels"]}
+    print(f"Against {baseline['commit']}:")
+    for level in result["levels"]:
+        base_level = levels.get(level["concurrency"])
+        if base_level is None:
+            continue
+        for name, stats in [*level["routes"].items(), ("total", level["total"])]:
+            if name == "total":
+                base_stats = base_level["total"]
+            else:
+                base_stats = base_level["routes"].get(name)
+            if base_stats is None:
+                continue
+            changes = []
+            for key in ("rps", "p50_ms", "p99_ms"):
+                if base_stats[key]:
+                    change = (stats[key] - base_stats[key]) / base_stats[key] * 100
+                    changes.append(f"{key} {change:+.1f}%")
+            print(f"  c={level['concurrency']} {name}: {', '.join(changes)}")
+
+
+def parse_mix(mix: str) -> dict[str, int]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown route {name!r}, expected one of {SCENARIOS}")
+        weights[name] = int(weight or 1)
+    return weights
+
+
+def main(args) -> None:
+    mix = parse_mix(args.mix)
+    commit, dirty = git_commit()
+    with mongod(args.uri, args.mongod) as uri:
+        client = MongoClient(uri)
+        client.drop_database(DB_NAME)
+        db = client[DB_NAME]
+        try:
+            generate.load(
+                db,
+                seed=args.seed,
+                cookbooks=args.cookbooks,
+                recipes=args.recipes,
+                users=args.users,
+                min_saved=args.user_recipes,
+                password=PASSWORD,
+            )
+            ensure_indexes(db)
+            with server(uri, args.workers, args.threads) as base:
+                accounts = login_users(base, args.users)
+                pages = max(1, args.recipes // PER_PAGE)
+                levels = []
+                for concurrency in args.concurrency:
+                    level = run_level(
+                        base,
+                        mix,
+                        concurrency,
+                        args.duration,
+                        pages,
+                        accounts,
+                        args.seed,
+                    )
+                    total = level["total"]
+                    print(
+                        f"c={concurrency}: {total['rps']} req/s, "
+                        f"p50 {total['p50_ms']} ms, p99 {total['p99_ms']} ms, "
+                        f"{total['errors']} errors"
+                    )
+                    levels.append(level)
+        finally:
+            client.drop_database(DB_NAME)
+
+    result = {
+        "commit": commit,
+        "dirty": dirty,
+        "date": dt.datetime.now(dt.timezone.utc).isoformat(),
+        "settings": {
+            "mix": mix,
+            "duration": args.duration,
+            "seed": args.seed,
+            "recipes": args.recipes,
+            "cookbooks": args.cookbooks,
+            "users": args.users,
+            "user_recipes": args.user_recipes,
+            "workers": args.workers,
+            "threads": args.threads,
+        },
+        "levels": levels,
+    }
+    out = Path(args.out or BACKEND / "bench" / "results" / f"{commit}.json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=2) + "\n")
+    print(f"Wrote {out}")
+    if args.baseline:
+        compare(json.loads(Path(args.baseline).read_text()), result)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Load test the API's routes and record the results as JSON."
+    )
+    parser.add_argument(
+        "--uri", type=str, help="MongoDB to use, rather than a throwaway mongod."
+    )
+    parser.add_argument(
+        "--mongod", type=str, default="mongod", help="mongod binary to start."
+    )
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        nargs="+",
+        default=[8, 32],
+        help="Concurrent clients, one run per level.",
+    )
+    parser.add_argument(
+        "-d", "--duration", type=float, default=20.0, help="Seconds per level."
+    )
+    parser.add_argument(
+        "--mix",
+        type=str,
+        default=DEFAULT_MIX,
+        help=f"Weighted routes to request, of {', '.join(SCENARIOS)}.",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seeds data and mixes.")
+    parser.add_argument("--recipes", type=int, default=3000, help="Recipes to seed.")
+    parser.add_argument("--cookbooks", type=int, default=20, help="Cookbooks to seed.")
+    parser.add_argument("--users", type=int, default=10, help="Users to seed.")
+    parser.add_argument(
+        "--user-recipes",
+        type=int,
+        default=200,
+        help="Fewest recipes a user saves. A few save many more.",
+    )
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn workers.")
+    parser.add_argument(
+        "--threads", type=int, default=8, help="Threads per gunicorn worker."
+    )
+    parser.add_argument("--out", type=str, help="Results file to write.")
+    parser.add_argument("--baseline", type=str, help="Results file to compare to.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -1,47 +1,106 @@
 from openai import OpenAI
+from openai.types.chat import ParsedChatCompletion
 
-from process.image_preprocessor import RecipeImage
+from process.image_preprocessor import RecipeImage, image_data_url
 from process.model import RecipeExtraction
 
 
-def process_recipe_image(
-    client: OpenAI,
-    image: RecipeImage,
-) -> RecipeExtraction | None:
+MODEL = "gpt-4o-mini"
+
+
+def recipe_messages(image: RecipeImage) -> list[dict]:
+    # Encoded for this request only, and released along with the messages.
+    url = image_data_url(image)
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You are an assistant that processes images of recipes and extracts recipe information. "
+                "Please extract the recipe information from the image and convert it to into the given structure."
+            ),
+        },
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": "Extract the recipe information from this image and return it in the specified structured. For the instruction details, please keep as much or all of the original text. If there are addiitonal notes at the bottom of the page, please add to the note field.",
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {"url": url},
+                },
+            ],
+        },
+    ]
+
+
+def strict_json_schema(schema):
+    """
+    A Pydantic JSON schema as Structured Outputs' strict mode takes it: every
+    object closed to other properties, with all of them required (optional
+    fields are already nullable), and no null defaults.
+    """
+    if isinstance(schema, list):
+        return [strict_json_schema(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+    strict = {}
+    for key, value in schema.items():
+        if key == "default" and value is None:
+            continue
+        if key in ("properties", "$defs"):
+            # Names, not keywords.
+            strict[key] = {name: strict_json_schema(sub) for name, sub in value.items()}
+        else:
+            strict[key] = strict_json_schema(value)
+    if strict.get("type") == "object":
+        strict["additionalProperties"] = False
+        strict["required"] = list(strict.get("properties", {}))
+    return strict
+
+
+# The response format that ``parse`` sends for ``RecipeExtraction``.
+RECIPE_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": RecipeExtraction.__name__,
+        "schema": strict_json_schema(RecipeExtraction.model_json_schema()),
+        "strict": True,
+    },
+}
+
+
+def recipe_request_body(image: RecipeImage) -> dict:
+    """The chat completions request of ``parse_recipe_image``, as JSON, for the
+    Batch API."""
+    return {
+        "model": MODEL,
+        "messages": recipe_messages(image),
+        "response_format": RECIPE_RESPONSE_FORMAT,
+    }
+
+
+def parse_recipe_image(client: OpenAI, image: RecipeImage) -> ParsedChatCompletion:
+    """The whole completion, with its token ``usage``."""
     # Call the OpenAI API with the image data
-    print(f"Calling gpt-4o-mini on image {image} ...")
-    completion = client.beta.chat.completions.parse(
-        model="gpt-4o-mini",
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    "You are an assistant that processes images of recipes and extracts recipe information. "
-                    "Please extract the recipe information from the image and convert it to into the given structure."
-                ),
-            },
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": "Extract the recipe information from this image and return it in the specified structured. For the instruction details, please keep as much or all of the original text. If there are addiitonal notes at the bottom of the page, please add to the note field.",
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/{image.file_format};base64,{image.base64}"
-                        },
-                    },
-                ],
-            },
-        ],
+    print(f"Calling {MODEL} on image {image} ...")
+    return client.beta.chat.completions.parse(
+        model=MODEL,
+        messages=recipe_messages(image),
         response_format=RecipeExtraction,
     )
 
+
+def process_recipe_image(
+    client: OpenAI,
+    image: RecipeImage,
+) -> RecipeExtraction | None:
+    completion = parse_recipe_image(client, image)
     # Extract and return the generated response
     return completion.choices[0].message.parsed
 
 
-def create_client(api_key: str) -> OpenAI:
-    return OpenAI(api_key=api_key)
+def create_client(api_key: str, max_retries: int = 2) -> OpenAI:
+    # The base URL can be pointed at a stand-in server with OPENAI_BASE_URL.
+    return OpenAI(api_key=api_key, max_retries=max_retries)
@@ -0,0 +1,172 @@
+"""
+process/batch - Extract recipe images with the OpenAI Batch API.
+
+Half the price of the chat completions API, and without its rate limits, in
+exchange for answers within 24 hours rather than seconds. The images are
+written as JSONL requests of the same prompt and ``RecipeExtraction`` response
+format as ``ai_processor.parse_recipe_image``, split into files within the
+Batch API's limits. Each file is then:
+
+    submitted: uploaded, and a batch created from it
+    polled:    until the batch is completed, failed, expired or cancelled
+    ingested:  its output (and error) file streamed back, line by line
+
+Each request's ``custom_id`` is its image's file name, so a batch can be
+picked up again by its ID (``process_photos.py --batch-id``) if polling is
+interrupted. Images already ingested have been renamed, and are skipped.
+"""
+
+import json
+import tempfile
+import time
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+from openai import OpenAI
+from openai.types import Batch
+from pydantic import ValidationError
+
+from process.ai_processor import recipe_request_body
+from process.model import RecipeExtraction, RecipeImage
+
+ENDPOINT = "/v1/chat/completions"
+# The Batch API takes up to 50,000 requests and 200 MB per input file.
+MAX_REQUESTS = 50_000
+MAX_FILE_BYTES = 190 * 1024 * 1024
+TERMINAL = {"completed", "failed", "expired", "cancelled"}
+
+
+def batch_request(image: RecipeImage) -> dict:
+    return {
+        "custom_id": image.filepath.name,
+        "method": "POST",
+        "url": ENDPOINT,
+        "body": recipe_request_body(image),
+    }
+
+
+def write_requests(
+    images: Iterable[RecipeImage],
+    directory: Path,
+    max_requests: int = MAX_REQUESTS,
+    max_bytes: int = MAX_FILE_BYTES,
+) -> list[Path]:
+    """Write the images' requests to as few JSONL files as the limits allow."""
+    paths: list[Path] = []
+    file = None
+    try:
+        for image in images:
+            line = (json.dumps(batch_request(image)) + "\n").encode()
+            if file is None or count == max_requests or size + len(line) > max_bytes:
+                if file is not None:
+                    file.close()
+                paths.append(directory / f"requests-{len(paths)}.jsonl")
+                file = open(paths[-1], "wb")
+                count, size = 0, 0
+            file.write(line)
+            count += 1
+            size += len(line)
+    finally:
+        if file is not None:
+            file.close()
+    return paths
+
+
+def submit(client: OpenAI, path: Path, cookbook_key: str) -> Batch:
+    with open(path, "rb") as file:
+        input_file = client.files.create(file=file, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=ENDPOINT,
+        completion_window="24h",
+        metadata={"cookbook_key": cookbook_key},
+    )
+    print(f"Submitted batch {batch.id} of {path.name}")
+    return batch
+
+
+def wait(
+    client: OpenAI, batch_id: str, poll_interval: float = 60.0, sleep=time.sleep
+) -> Batch:
+    """Poll a batch until it stops."""
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        progress = ""
+        if batch.request_counts is not None:
+            counts = batch.request_counts
+            progress = f" {counts.completed + counts.failed}/{counts.total}"
+        print(f"Batch {batch.id} {batch.status}{progress}")
+        if batch.status in TERMINAL:
+            return batch
+        sleep(poll_interval)
+
+
+def file_lines(client: OpenAI, file_id: str) -> Iterator[dict]:
+    """The JSON lines of a file, streamed rather than downloaded whole."""
+    with client.files.with_streaming_response.content(file_id) as response:
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line)
+
+
+def parse_result(result: dict) -> RecipeExtraction | None:
+    """The extraction of one output (or error) file line, if it succeeded."""
+    response = result.get("response") or {}
+    if result.get("error") or response.get("status_code") != 200:
+        error = result.get("error") or response.get("body")
+        print(f"Request {result.get('custom_id')} failed: {error}")
+        return None
+    message = response["body"]["choices"][0]["message"]
+    if not message.get("content"):
+        print(f"Request {result.get('custom_id')} refused: {message.get('refusal')}")
+        return None
+    try:
+        return RecipeExtraction.model_validate_json(message["content"])
+    except ValidationError as e:
+        print(f"Request {result.get('custom_id')} returned no recipe: {e}")
+        return None
+
+
+def results(
+    client: OpenAI, batch: Batch
+) -> Iterator[tuple[str, RecipeExtraction | None]]:
+    """Each request's ``custom_id`` and extraction. Expired and cancelled
+    batches still return the requests they finished."""
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if file_id is not None:
+            for result in file_lines(client, file_id):
+                yield result["custom_id"], parse_result(result)
+
+
+def extract_batch(
+    client: OpenAI,
+    images: Iterable[RecipeImage],
+    cookbook_key: str,
+    batch_ids: Iterable[str] = (),
+    poll_interval: float = 60.0,
+    sleep=time.sleep,
+) -> Iterator[tuple[RecipeImage, RecipeExtraction | None]]:
+    """
+    Submit the images as batches, or pick up ``batch_ids``, and yield each
+    image with its extraction as the batches' results are read.
+    """
+    images_by_id = {image.filepath.name: image for image in images}
+    batch_ids = list(batch_ids)
+    if not batch_ids and images_by_id:
+        with tempfile.TemporaryDirectory() as directory:
+            for path in write_requests(images_by_id.values(), Path(directory)):
+                batch_ids.append(submit(client, path, cookbook_key).id)
+        print(f"Resume with: --batch-id {' '.join(batch_ids)}")
+    for batch_id in batch_ids:
+        batch = wait(client, batch_id, poll_interval, sleep)
+        if batch.status != "completed":
+            print(f"Batch {batch.id} {batch.status}: ingesting what it finished")
+        skipped = 0
+        for custom_id, extraction in results(client, batch):
+            image = images_by_id.pop(custom_id, None)
+            if image is None:
+                skipped += 1
+                continue
+            yield image, extraction
+        if skipped:
+            print(f"Skipped {skipped} results of images not left to process")
@@ -1,4 +1,6 @@
 import json
+import random
+from collections import Counter
 
 from pymongo import MongoClient
 from pymongo.collection import Collection
@@ -13,6 +15,8 @@ def insert_recipe(
 ) -> None:
     recipe_json = json.loads(recipe.model_dump_json())
     recipe_json["cookbook_key"] = cookbook_key
+    # The API draws random recipes by this key (see api/sampling.py).
+    recipe_json["random_key"] = random.random()
     mongo_insertion = recipes_collection.insert_one(recipe_json)
     print(f"Inserted extraction into MongoDB with ID: {mongo_insertion.inserted_id}")
 
@@ -24,12 +28,18 @@ def is_cookbook(cookbook_key: str, collection: Collection) -> bool:
     return False
 
 
-def does_recipe_exist(
-    cookbook_key: str, page_number: int, collection: Collection
-) -> bool:
-    if collection.find_one({"cookbook_key": cookbook_key, "page_number": page_number}):
-        return True
-    return False
+# Only fields of the cookbook_key_page_number_id index (see api/indexes.py), so
+# that the query is answered from the index without reading the recipes.
+EXISTING_PAGES_PROJECTION = {"_id": 0, "page_number": 1}
+
+
+def existing_pages(cookbook_key: str, collection: Collection) -> Counter[int]:
+    # How many recipes of the cookbook are stored for each page, in one query
+    # rather than one per image. A page can hold more than one recipe.
+    cursor = collection.find(
+        {"cookbook_key": cookbook_key}, EXISTING_PAGES_PROJECTION, batch_size=10_000
+    )
+    return Counter(doc["page_number"] for doc in cursor)
 
 
 def get_collection(client_env: str, db_env: str, collection_env: str) -> Collection:
@@ -0,0 +1,201 @@
+"""
+process/extraction - Extract many recipe images at once, within rate limits.
+
+Images are sent by a pool of threads sharing one OpenAI client, at most
+``concurrency`` at a time. Before each request, a :class:`RateLimiter` waits
+for room in the requests-per-minute and tokens-per-minute budgets. A request's
+tokens aren't known until it returns, so it reserves an estimate, the average
+of the requests so far, and is charged what it really used afterwards.
+
+A 429 or 5xx response, a timeout or a dropped connection is retried with
+exponentially growing, fully jittered waits. A 429 also pauses every thread
+for its ``Retry-After``, since the budget is shared. Extractions are yielded as
+they finish, in any order.
+"""
+
+import random
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+import openai
+from openai import OpenAI
+
+from process.ai_processor import parse_recipe_image
+from process.model import RecipeExtraction, RecipeImage
+
+# gpt-4o-mini bills images at many more tokens than gpt-4o. A first guess at a
+# page's request, until real usage comes back.
+DEFAULT_TOKENS_PER_REQUEST = 20_000
+RETRYABLE = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+)
+
+
+class RateLimiter:
+    """Requests- and tokens-per-minute token buckets, shared by threads."""
+
+    def __init__(
+        self,
+        rpm: int,
+        tpm: int,
+        tokens_per_request: int = DEFAULT_TOKENS_PER_REQUEST,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ) -> None:
+        self.rpm = rpm
+        self.tpm = tpm
+        self.tokens_per_request = tokens_per_request
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        # Start full, as the API's own limits do.
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._observed = 0
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def acquire(self) -> int:
+        """Wait for room for one request. Returns the tokens it reserved."""
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._refill(now)
+                # A request bigger than the whole budget waits for a full one.
+                tokens = min(self.tokens_per_request, self.tpm)
+                wait = self._paused_until - now
+                if wait <= 0:
+                    wait = max(
+                        (1 - self._requests) * 60 / self.rpm,
+                        (tokens - self._tokens) * 60 / self.tpm,
+                    )
+                if wait <= 0:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return tokens
+            self._sleep(wait)
+
+    def settle(self, reserved: int, used: int) -> None:
+        """Charge a finished request what it used rather than its reservation."""
+        with self._lock:
+            self._tokens -= used - reserved
+            # A running average, so that the estimate follows the pages.
+            self._observed += 1
+            self.tokens_per_request += (
+                used - self.tokens_per_request
+            ) / self._observed
+
+    def refund(self, reserved: int) -> None:
+        """Give back a failed request's tokens."""
+        with self._lock:
+            self._tokens += reserved
+
+    def pause(self, seconds: float) -> None:
+        """Hold every request for ``seconds``, e.g. after a 429."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+
+def retry_after(error: openai.APIError) -> float | None:
+    """The ``Retry-After`` seconds of an API error's response, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt: int, base: float, cap: float) -> float:
+    """Full jitter: a uniform wait up to an exponentially growing bound."""
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def extract(
+    client: OpenAI,
+    image: RecipeImage,
+    limiter: RateLimiter,
+    max_retries: int = 6,
+    base_delay: float = 1.0,
+    max_delay: float = 60.0,
+    sleep=time.sleep,
+) -> RecipeExtraction | None:
+    """Extract one image, retrying throttled and failed requests."""
+    for attempt in range(max_retries + 1):
+        reserved = limiter.acquire()
+        try:
+            completion = parse_recipe_image(client, image)
+        except RETRYABLE as e:
+            # The failed request's tokens may or may not count: assume none.
+            limiter.refund(reserved)
+            if attempt == max_retries:
+                print(f"Giving up on image {image} after {attempt + 1} tries: {e}")
+                return None
+            delay = backoff(attempt, base_delay, max_delay)
+            if isinstance(e, openai.RateLimitError):
+                limiter.pause(retry_after(e) or delay)
+            print(f"Retrying image {image} in {delay:.1f}s: {e}")
+            sleep(delay)
+            continue
+        except Exception:
+            # Not worth retrying, but the request was never charged either.
+            limiter.refund(reserved)
+            raise
+        if completion.usage is not None:
+            limiter.settle(reserved, completion.usage.total_tokens)
+        return completion.choices[0].message.parsed
+    return None
+
+
+def extract_all(
+    client: OpenAI,
+    images: Iterable[RecipeImage],
+    limiter: RateLimiter,
+    concurrency: int = 8,
+    **retry,
+) -> Iterator[tuple[RecipeImage, RecipeExtraction | None]]:
+    """
+    Extract every image, yielding each with its extraction as it finishes.
+
+    ``images`` is read lazily: only ``concurrency`` images are in flight, and
+    the next is taken as one finishes, so the first request goes out as soon
+    as the first image is ready.
+    """
+    images = iter(images)
+    futures: dict[Future, RecipeImage] = {}
+    with ThreadPoolExecutor(
+        max_workers=concurrency, thread_name_prefix="extract"
+    ) as executor:
+
+        def submit_next() -> None:
+            image = next(images, None)
+            if image is not None:
+                future = executor.submit(extract, client, image, limiter, **retry)
+                futures[future] = image
+
+        for _ in range(concurrency):
+            submit_next()
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                image = futures.pop(future)
+                # Keep the pool busy while the caller handles this one.
+                submit_next()
+                try:
+                    extraction = future.result()
+                except Exception as e:
+                    print(f"Image {image} failed ai processing: {e}")
+                    extraction = None
+                yield image, extraction
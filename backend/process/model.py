@@ -4,11 +4,14 @@ from pydantic import BaseModel
 
 
 class RecipeImage:
-    def __init__(self, filepath: Path, cookbook_key: str, file_format: str) -> None:
+    def __init__(
+        self, filepath: Path, cookbook_key: str, file_format: str, normalizer=None
+    ) -> None:
         self.filepath = filepath
         self.cookbook_key = cookbook_key
         self.file_format = file_format
-        self.base64 = None
+        # An image_preprocessor.ImageNormalizer, to re-encode it when it is sent.
+        self.normalizer = normalizer
 
     def __str__(self):
         return f"RecipeImage(filepath={self.filepath}, cookbook_key={self.cookbook_key}, file_format={self.file_format})"
@@ -1,18 +1,45 @@
 import argparse
 import json
 import os
-import time
+from collections.abc import Iterable, Iterator
 from pathlib import Path
 
 from dotenv import load_dotenv
 
-from process.ai_processor import create_client, process_recipe_image
+from process.ai_processor import create_client
+from process.batch import extract_batch
 from process.db import get_collection, insert_recipe, is_cookbook
-from process.image_preprocessor import preprocess_images
+from process.extraction import RateLimiter, extract_all
+from process.image_preprocessor import (
+    DEFAULT_MAX_EDGE,
+    DEFAULT_QUALITY,
+    IMAGE_FORMATS,
+    ImageNormalizer,
+    page_image_path,
+    preprocess_images,
+)
 from process.model import RecipeExtraction, RecipeImage
 
 
-def main(images_directory: Path, cookbook_key: str, dry_run: bool) -> None:
+def announce(images: Iterable[RecipeImage]) -> Iterator[RecipeImage]:
+    for image in images:
+        print(f"Image to process: {image}")
+        yield image
+
+
+def main(
+    images_directory: Path,
+    cookbook_key: str,
+    dry_run: bool,
+    concurrency: int = 8,
+    rpm: int = 500,
+    tpm: int = 200_000,
+    max_retries: int = 6,
+    batch: bool = False,
+    batch_ids: list[str] | None = None,
+    poll_interval: float = 60.0,
+    normalizer: ImageNormalizer | None = None,
+) -> None:
     load_dotenv()
     recipes_collection = get_collection(
         os.environ.get("COOKBOOKS_CONNECTION_STRING"),
@@ -30,24 +57,36 @@ def main(images_directory: Path, cookbook_key: str, dry_run: bool) -> None:
             f'--cookbook-key "{cookbook_key}" is not in the MongoDB cookbooks collection'
         )
     # Preprocess images, to not process already done images for example (if image file and dir is set up correctly)
-    images = preprocess_images(images_directory, cookbook_key, recipes_collection)
-
-    if not images:
-        print("No images to process...")
-        return
-
-    print("Images to process: ")
-    [print(image) for image in images]
+    # Images are checked and read as they are needed, not all up front.
+    images = announce(
+        preprocess_images(
+            images_directory, cookbook_key, recipes_collection, normalizer
+        )
+    )
 
     if dry_run:
+        if not any(True for _ in images):
+            print("No images to process...")
         print("--dry-run enabled. Not processes or inserting")
         return
 
-    time.sleep(5)
-
-    ai_client = create_client(os.environ.get("OPENAI_API_KEY"))
-    for image in images:
-        recipe_extraction = process_recipe_image(ai_client, image)
+    if batch or batch_ids:
+        # Answered within 24 hours, at half the price and without rate limits.
+        ai_client = create_client(os.environ.get("OPENAI_API_KEY"))
+        extractions = extract_batch(
+            ai_client, images, cookbook_key, batch_ids or (), poll_interval
+        )
+    else:
+        # Retries are scheduled by process.extraction, within the rate limits.
+        ai_client = create_client(os.environ.get("OPENAI_API_KEY"), max_retries=0)
+        limiter = RateLimiter(rpm, tpm)
+        extractions = extract_all(
+            ai_client, images, limiter, concurrency, max_retries=max_retries
+        )
+    # Extractions come back as they finish, and are committed in that order.
+    processed = 0
+    for image, recipe_extraction in extractions:
+        processed += 1
         if recipe_extraction is None:
             print(f"Recipe for image {image} failed ai processing")
             continue
@@ -56,13 +95,12 @@ def main(images_directory: Path, cookbook_key: str, dry_run: bool) -> None:
             cookbook_key,
             recipes_collection,
         )
-        os.rename(
-            image.filepath,
-            image.filepath.parent
-            / Path(
-                f"{cookbook_key}-{recipe_extraction.page_number}{image.filepath.suffix}"
-            ),
-        )
+        # Not over another image of the same page, with another recipe on it.
+        os.rename(image.filepath, page_image_path(image, recipe_extraction.page_number))
+    if not processed:
+        print("No images to process...")
+    elif normalizer is not None:
+        print(normalizer.report())
 
 
 def parse_args():
@@ -87,10 +125,98 @@ def parse_args():
         required=True,
         help="The cookbooks key in MongoDB.",
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Images sent to the AI at the same time.",
+    )
+    parser.add_argument(
+        "--rpm",
+        type=int,
+        default=500,
+        help="Requests per minute allowed by the OpenAI account's limits.",
+    )
+    parser.add_argument(
+        "--tpm",
+        type=int,
+        default=200_000,
+        help="Tokens per minute allowed by the OpenAI account's limits.",
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=6,
+        help="Retries of an image after a 429, a 5xx or a connection error.",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        default=False,
+        help="Submit the images to the Batch API and wait for its results.",
+    )
+    parser.add_argument(
+        "--batch-id",
+        type=str,
+        nargs="+",
+        help="Ingest the results of batches already submitted by --batch.",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=60.0,
+        help="Seconds between checks of a batch's status.",
+    )
+    parser.add_argument(
+        "--no-normalize",
+        action="store_true",
+        default=False,
+        help="Send the image files as they are, rather than re-encoded.",
+    )
+    parser.add_argument(
+        "--max-edge",
+        type=int,
+        default=DEFAULT_MAX_EDGE,
+        help="Shrink images to at most this many pixels on their long edge.",
+    )
+    parser.add_argument(
+        "--image-format",
+        choices=list(IMAGE_FORMATS),
+        default="jpeg",
+        help="Format images are re-encoded to.",
+    )
+    parser.add_argument(
+        "--quality",
+        type=int,
+        default=DEFAULT_QUALITY,
+        help="JPEG or WebP quality of the re-encoded images, 1-100.",
+    )
+    parser.add_argument(
+        "--grayscale",
+        action="store_true",
+        default=False,
+        help="Send images in grayscale, which most cookbook pages lose nothing to.",
+    )
     return parser.parse_args()
 
 
 # Add command line arguments
 if __name__ == "__main__":
     args = parse_args()
-    main(Path(args.images_dir), args.cookbook_key, args.dry_run)
+    main(
+        Path(args.images_dir),
+        args.cookbook_key,
+        args.dry_run,
+        args.concurrency,
+        args.rpm,
+        args.tpm,
+        args.max_retries,
+        batch=args.batch,
+        batch_ids=args.batch_id,
+        poll_interval=args.poll_interval,
+        normalizer=None
+        if args.no_normalize
+        else ImageNormalizer(
+            args.max_edge, args.image_format, args.quality, args.grayscale
+        ),
+    )